@@ -3,154 +3,142 @@ Admin Dashboard Module
 For monitoring users, payments, and analytics
 """
 
-import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+import db
+import order_export
+from analytics import compute_kpis
+from config import DATABASE_PATH
+
+# === Query dashboard ===
+# Dipakai juga oleh query_plans.check_query_plans: tidak boleh scan orders / rollup.
+
+# Pelanggan dengan belanja COMPLETED terbesar lewat idx (status, amount),
+# sisanya dari primary key (user_email, status)
+USERS_SQL = """
+SELECT 
+    t.user_email,
+    (SELECT SUM(r.orders) FROM order_user_rollup r WHERE r.user_email = t.user_email) as purchase_count,
+    t.amount as total_spent,
+    (SELECT MAX(r.last_order) FROM order_user_rollup r WHERE r.user_email = t.user_email) as last_purchase,
+    (SELECT GROUP_CONCAT(r.status) FROM order_user_rollup r WHERE r.user_email = t.user_email) as statuses
+FROM order_user_rollup t
+WHERE t.status = 'COMPLETED'
+ORDER BY t.amount DESC
+LIMIT ?
+"""
+
+# User yang belum punya order COMPLETED (total_spent 0), untuk melengkapi USERS_SQL
+USERS_WITHOUT_PURCHASE_SQL = """
+SELECT 
+    user_email,
+    SUM(orders) as purchase_count,
+    0 as total_spent,
+    MAX(last_order) as last_purchase,
+    GROUP_CONCAT(status) as statuses
+FROM order_user_rollup 
+GROUP BY user_email
+HAVING SUM(status = 'COMPLETED') = 0
+LIMIT ?
+"""
+
+USER_SUMMARY_SQL = """
+SELECT 
+    user_email,
+    SUM(orders) as total_orders,
+    SUM(CASE WHEN status = 'COMPLETED' THEN orders ELSE 0 END) as completed_orders,
+    SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_spent,
+    MIN(first_order) as first_purchase,
+    MAX(last_order) as last_purchase
+FROM order_user_rollup 
+WHERE user_email = ?
+"""
+
+USER_ORDERS_SQL = """
+SELECT id, product_name, amount, status, created_at 
+FROM orders 
+WHERE user_email = ?
+ORDER BY created_at DESC
+"""
+
+# Rentang setengah terbuka [start, end) pada kolom day, tanpa fungsi di sisi kolom
+REVENUE_BY_DATE_SQL = """
+SELECT 
+    day as date,
+    SUM(orders) as orders,
+    SUM(CASE WHEN status = 'COMPLETED' THEN orders ELSE 0 END) as completed,
+    SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as revenue
+FROM order_daily_rollup 
+WHERE day >= ? AND day < ?
+GROUP BY day
+ORDER BY day DESC
+"""
+
+TOP_CUSTOMERS_SQL = """
+SELECT 
+    user_email,
+    orders,
+    amount as total_spent,
+    last_order
+FROM order_user_rollup 
+WHERE status = 'COMPLETED'
+ORDER BY amount DESC
+LIMIT ?
+"""
 
 
 class AdminDashboard:
     """Admin dashboard untuk monitoring payment dan users"""
     
-    def __init__(self, db_path: str = "database.db"):
+    def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
     
     def get_dashboard_stats(self) -> Dict:
-        """Get overall dashboard statistics"""
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Total revenue
-        cursor.execute("SELECT SUM(amount) FROM orders WHERE status = 'COMPLETED'")
-        total_revenue = cursor.fetchone()[0] or 0
-        
-        # Today's revenue
-        cursor.execute("""
-        SELECT SUM(amount) FROM orders 
-        WHERE status = 'COMPLETED' 
-        AND DATE(created_at) = DATE('now')
-        """)
-        today_revenue = cursor.fetchone()[0] or 0
-        
-        # Total users
-        cursor.execute("SELECT COUNT(DISTINCT user_email) FROM orders WHERE user_email IS NOT NULL")
-        total_users = cursor.fetchone()[0]
-        
-        # Total orders
-        cursor.execute("SELECT COUNT(*) FROM orders")
-        total_orders = cursor.fetchone()[0]
-        
-        # Completed orders
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'COMPLETED'")
-        completed_orders = cursor.fetchone()[0]
-        
-        # Pending orders
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'PENDING'")
-        pending_orders = cursor.fetchone()[0]
-        
-        # Failed orders
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'FAILED'")
-        failed_orders = cursor.fetchone()[0]
+        """Get overall dashboard statistics (uncached; routes use analytics.kpis)"""
         
-        # Conversion rate
-        conversion_rate = (completed_orders / total_orders * 100) if total_orders > 0 else 0
-        
-        # Average order value
-        cursor.execute("SELECT AVG(amount) FROM orders WHERE status = 'COMPLETED'")
-        avg_order_value = cursor.fetchone()[0] or 0
-        
-        conn.close()
-        
-        return {
-            "total_revenue": total_revenue,
-            "today_revenue": today_revenue,
-            "total_users": total_users,
-            "total_orders": total_orders,
-            "completed_orders": completed_orders,
-            "pending_orders": pending_orders,
-            "failed_orders": failed_orders,
-            "conversion_rate": round(conversion_rate, 2),
-            "avg_order_value": round(avg_order_value, 2)
-        }
+        with db.connection(self.db_path, readonly=True) as conn:
+            return compute_kpis(conn)
     
     def get_recent_orders(self, limit: int = 20) -> List[Dict]:
         """Get recent orders"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        with db.connection(self.db_path, readonly=True) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("""
-        SELECT id, user_email, product_name, amount, status, created_at 
-        FROM orders 
-        ORDER BY created_at DESC 
-        LIMIT ?
-        """, (limit,))
+            cursor.execute("""
+            SELECT id, user_email, product_name, amount, status, created_at 
+            FROM orders 
+            ORDER BY created_at DESC 
+            LIMIT ?
+            """, (limit,))
         
-        orders = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+            orders = [dict(row) for row in cursor.fetchall()]
         
         return orders
     
     def get_users(self, limit: int = 50) -> List[Dict]:
         """Get all users with their purchase history"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT 
-            user_email,
-            COUNT(*) as purchase_count,
-            SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_spent,
-            MAX(created_at) as last_purchase,
-            GROUP_CONCAT(DISTINCT status) as statuses
-        FROM orders 
-        WHERE user_email IS NOT NULL
-        GROUP BY user_email
-        ORDER BY total_spent DESC
-        LIMIT ?
-        """, (limit,))
+        with db.connection(self.db_path, readonly=True) as conn:
+            users = [dict(row) for row in conn.execute(USERS_SQL, (limit,))]
         
-        users = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+            # Kurang dari `limit` pelanggan yang pernah COMPLETED: tambahkan sisanya
+            if len(users) < limit:
+                rows = conn.execute(USERS_WITHOUT_PURCHASE_SQL, (limit - len(users),))
+                users.extend(dict(row) for row in rows)
         
         return users
     
     def get_user_detail(self, user_email: str) -> Dict:
         """Get detailed user profile"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        with db.connection(self.db_path, readonly=True) as conn:
+            # User summary
+            user_summary = dict(conn.execute(USER_SUMMARY_SQL, (user_email,)).fetchone() or {})
         
-        # User summary
-        cursor.execute("""
-        SELECT 
-            user_email,
-            COUNT(*) as total_orders,
-            COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END) as completed_orders,
-            SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_spent,
-            MIN(created_at) as first_purchase,
-            MAX(created_at) as last_purchase
-        FROM orders 
-        WHERE user_email = ?
-        """, (user_email,))
-        
-        user_summary = dict(cursor.fetchone() or {})
-        
-        # User's orders
-        cursor.execute("""
-        SELECT id, product_name, amount, status, created_at 
-        FROM orders 
-        WHERE user_email = ?
-        ORDER BY created_at DESC
-        """, (user_email,))
-        
-        orders = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+            # User's orders
+            orders = [dict(row) for row in conn.execute(USER_ORDERS_SQL, (user_email,))]
         
         return {
             "user": user_summary,
@@ -158,125 +146,78 @@ class AdminDashboard:
         }
     
     def get_revenue_by_date(self, days: int = 30) -> List[Dict]:
-        """Get revenue trend over time"""
-        
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        """Get revenue trend over time (whole days, from order_daily_rollup)"""
         
-        cursor.execute("""
-        SELECT 
-            DATE(created_at) as date,
-            COUNT(*) as orders,
-            COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END) as completed,
-            SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as revenue
-        FROM orders 
-        WHERE created_at >= datetime('now', '-' || ? || ' days')
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
-        """, (days,))
+        # Hari dalam UTC, sama dengan CURRENT_TIMESTAMP di kolom created_at
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=days)
+        end = today + timedelta(days=1)
         
-        data = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with db.connection(self.db_path, readonly=True) as conn:
+            rows = conn.execute(REVENUE_BY_DATE_SQL, (start.isoformat(), end.isoformat()))
+            data = [dict(row) for row in rows]
         
         return data
     
     def get_product_sales(self) -> List[Dict]:
         """Get sales by product"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT 
-            product_id,
-            product_name,
-            product_type,
-            COUNT(*) as total_orders,
-            COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END) as completed_orders,
-            SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_revenue,
-            AVG(CASE WHEN status = 'COMPLETED' THEN amount END) as avg_price
-        FROM orders 
-        GROUP BY product_id
-        ORDER BY total_revenue DESC
-        """)
-        
-        products = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with db.connection(self.db_path, readonly=True) as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute("""
+            SELECT 
+                product_id,
+                MAX(product_name) as product_name,
+                MAX(product_type) as product_type,
+                SUM(orders) as total_orders,
+                SUM(CASE WHEN status = 'COMPLETED' THEN orders ELSE 0 END) as completed_orders,
+                SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_revenue,
+                SUM(CASE WHEN status = 'COMPLETED' THEN amount END)
+                    / SUM(CASE WHEN status = 'COMPLETED' THEN orders END) as avg_price
+            FROM order_daily_rollup 
+            GROUP BY product_id
+            ORDER BY total_revenue DESC
+            """)
+        
+            products = [dict(row) for row in cursor.fetchall()]
         
         return products
     
     def get_payment_status_summary(self) -> Dict:
         """Get payment status distribution"""
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT status, COUNT(*) as count, SUM(amount) as amount
-        FROM orders 
-        GROUP BY status
-        """)
+        with db.connection(self.db_path, readonly=True) as conn:
+            cursor = conn.cursor()
         
-        statuses = {}
-        for status, count, amount in cursor.fetchall():
-            statuses[status] = {
-                "count": count,
-                "amount": amount or 0
-            }
+            cursor.execute("""
+            SELECT status, SUM(orders) as count, SUM(amount) as amount
+            FROM order_daily_rollup 
+            GROUP BY status
+            """)
         
-        conn.close()
+            statuses = {}
+            for status, count, amount in cursor.fetchall():
+                statuses[status] = {
+                    "count": count,
+                    "amount": amount or 0
+                }
         
         return statuses
     
     def get_top_customers(self, limit: int = 10) -> List[Dict]:
         """Get top spending customers"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT 
-            user_email,
-            COUNT(*) as orders,
-            SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) as total_spent,
-            MAX(created_at) as last_order
-        FROM orders 
-        WHERE user_email IS NOT NULL AND status = 'COMPLETED'
-        GROUP BY user_email
-        ORDER BY total_spent DESC
-        LIMIT ?
-        """, (limit,))
-        
-        customers = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with db.connection(self.db_path, readonly=True) as conn:
+            customers = [dict(row) for row in conn.execute(TOP_CUSTOMERS_SQL, (limit,))]
         
         return customers
     
-    def export_orders_csv(self) -> str:
-        """Export all orders as CSV format"""
+    def export_orders(self, fmt: str = "csv", date_from: Optional[str] = None,
+                      date_to: Optional[str] = None, status: Optional[str] = None,
+                      compress: bool = False) -> Iterator[bytes]:
+        """Stream orders (newest first) as CSV/NDJSON/Parquet byte chunks"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-        SELECT id, user_email, product_name, amount, status, created_at, completed_at
-        FROM orders 
-        ORDER BY created_at DESC
-        """)
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        # Build CSV
-        csv_data = "Order ID,Email,Product,Amount,Status,Created,Completed\n"
-        for row in rows:
-            csv_data += f"{row['id']},{row['user_email']},{row['product_name']},{row['amount']},{row['status']},{row['created_at']},{row['completed_at']}\n"
-        
-        return csv_data
-
+        return order_export.export_orders(self.db_path, fmt, date_from, date_to, status, compress)
 
 admin_dashboard = AdminDashboard()
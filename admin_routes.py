@@ -2,12 +2,22 @@
 Admin Routes - Dashboard dan monitoring endpoints
 """
 
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, render_template, request, jsonify, stream_with_context
 from functools import wraps
 import os
-from io import StringIO
 
+import db
 from admin_dashboard import admin_dashboard
+from analytics import analytics
+from blob_cache import blob_cache
+from checkout_queue import checkout_worker
+from dana_payment import dana_gateway
+from drive_client import drive_token
+from order_export import FORMATS, ExportError, export_filename
+from reconciler import reconciler
+from status_bus import status_bus
+from streaming import download_meter
+from webhook_queue import webhook_worker
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -50,7 +60,7 @@ def login():
 def dashboard():
     """Admin dashboard - overview"""
     
-    stats = admin_dashboard.get_dashboard_stats()
+    stats = analytics.kpis()
     recent_orders = admin_dashboard.get_recent_orders(limit=10)
     revenue_data = admin_dashboard.get_revenue_by_date(days=30)
     product_sales = admin_dashboard.get_product_sales()
@@ -114,9 +124,9 @@ def reports():
 @admin_bp.route('/api/stats')
 @require_admin
 def api_stats():
-    """API endpoint for dashboard stats"""
+    """API endpoint for dashboard stats (polled; memoized for ANALYTICS_TTL)"""
     
-    stats = admin_dashboard.get_dashboard_stats()
+    stats = analytics.kpis()
     return jsonify(stats)
 
 
@@ -142,18 +152,57 @@ def api_users():
     return jsonify(users)
 
 
-@admin_bp.route('/export/orders.csv')
+@admin_bp.route('/api/metrics')
 @require_admin
-def export_orders():
-    """Export orders as CSV"""
-    
-    csv_data = admin_dashboard.export_orders_csv()
-    
-    return send_file(
-        StringIO(csv_data),
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name="orders.csv"
+def api_metrics():
+    """API endpoint for runtime metrics of this worker"""
+    
+    response_cache = current_app.extensions.get('response_cache')
+    prefix_index = current_app.extensions.get('prefix_index')
+    fuzzy_search = current_app.extensions.get('fuzzy_search')
+    return jsonify({
+        "db_pools": db.pool_stats(),
+        "analytics": analytics.stats(),
+        "webhook_worker": webhook_worker.stats(),
+        "reconciler": reconciler.stats(),
+        "checkout_worker": checkout_worker.stats(),
+        "status_bus": status_bus.stats(),
+        "drive_token": drive_token.stats(),
+        "dana_token": dana_gateway.token.stats(),
+        "dana_http": dana_gateway.http.stats(),
+        "blob_cache": blob_cache.stats(),
+        "downloads": download_meter.stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "prefix_index": prefix_index.stats() if prefix_index else None,
+        "fuzzy_search": fuzzy_search.stats() if fuzzy_search else None
+    })
+
+
+@admin_bp.route('/export/orders.<fmt>')
+@require_admin
+def export_orders(fmt):
+    """Export orders as CSV, NDJSON or Parquet (streamed)
+    
+    Query: from/to (YYYY-MM-DD, inclusive), status, gzip=1
+    """
+    
+    compress = request.args.get('gzip') == '1'
+    try:
+        chunks = admin_dashboard.export_orders(
+            fmt,
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            status=request.args.get('status'),
+            compress=compress
+        )
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    mimetype = 'application/gzip' if compress else FORMATS[fmt][0]
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={export_filename(fmt, compress)}"}
     )
 
 
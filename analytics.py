@@ -0,0 +1,108 @@
+"""
+Analytics
+Payment KPIs for the admin dashboard and /payment/analytics: one query over
+the order rollups, memoized per worker for a short TTL
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import db
+from config import DATABASE_PATH
+
+# === Konfigurasi analytics (bisa diatur lewat environment) ===
+# Umur hasil KPI (detik) sebelum dihitung ulang; 0 = selalu hitung ulang
+ANALYTICS_TTL = float(os.environ.get('ANALYTICS_TTL', 15))
+
+# Semua KPI dalam satu scan order_daily_rollup (plus jumlah user)
+KPI_SQL = """
+SELECT
+    SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END) AS total_revenue,
+    SUM(CASE WHEN status = 'COMPLETED' AND day = DATE('now') THEN amount ELSE 0 END) AS today_revenue,
+    SUM(orders) AS total_orders,
+    SUM(CASE WHEN status = 'COMPLETED' THEN orders ELSE 0 END) AS completed_orders,
+    SUM(CASE WHEN status = 'PENDING' THEN orders ELSE 0 END) AS pending_orders,
+    SUM(CASE WHEN status = 'FAILED' THEN orders ELSE 0 END) AS failed_orders,
+    (SELECT COUNT(DISTINCT user_email) FROM order_user_rollup) AS total_users
+FROM order_daily_rollup
+"""
+
+
+def compute_kpis(conn: sqlite3.Connection) -> Dict:
+    """Dashboard KPIs in a single round-trip"""
+    row = conn.execute(KPI_SQL).fetchone()
+    total_revenue = row['total_revenue'] or 0
+    total_orders = row['total_orders'] or 0
+    completed_orders = row['completed_orders'] or 0
+
+    conversion_rate = (completed_orders / total_orders * 100) if total_orders > 0 else 0
+    avg_order_value = (total_revenue / completed_orders) if completed_orders > 0 else 0
+
+    return {
+        "total_revenue": total_revenue,
+        "today_revenue": row['today_revenue'] or 0,
+        "total_users": row['total_users'],
+        "total_orders": total_orders,
+        "completed_orders": completed_orders,
+        "pending_orders": row['pending_orders'] or 0,
+        "failed_orders": row['failed_orders'] or 0,
+        "conversion_rate": round(conversion_rate, 2),
+        "avg_order_value": round(avg_order_value, 2)
+    }
+
+
+class Analytics:
+    """Per-worker KPI memo.
+
+    A fresh result is returned as is. When it expires, exactly one thread
+    recomputes it; the others keep getting the previous result meanwhile
+    instead of all querying at once. Only the very first call (nothing
+    cached yet) makes concurrent callers wait for that one query.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, ttl: float = ANALYTICS_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._refresh = threading.Lock()
+        # (expires_at, kpis)
+        self._entry: Optional[Tuple[float, Dict]] = None
+        self._stats = {"hits": 0, "stale": 0, "computed": 0}
+
+    def kpis(self) -> Dict:
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[0]:
+            self._stats["hits"] += 1
+            return entry[1]
+
+        if entry is not None:
+            if not self._refresh.acquire(blocking=False):
+                # Thread lain sedang menghitung ulang
+                self._stats["stale"] += 1
+                return entry[1]
+        else:
+            self._refresh.acquire()
+        try:
+            current = self._entry
+            if current is not entry and current is not None:
+                # Sudah dihitung thread lain selagi menunggu lock
+                self._stats["hits"] += 1
+                return current[1]
+            with db.connection(self.db_path, readonly=True) as conn:
+                kpis = compute_kpis(conn)
+            self._stats["computed"] += 1
+            self._entry = (time.monotonic() + self.ttl, kpis)
+            return kpis
+        finally:
+            self._refresh.release()
+
+    def invalidate(self):
+        self._entry = None
+
+    def stats(self) -> Dict:
+        return dict(self._stats, ttl=self.ttl)
+
+
+analytics = Analytics()
@@ -1,11 +1,8 @@
 # app.py
 
 import os
-import sqlite3
-import requests
-from flask import Flask, render_template, abort, request, jsonify, Response, stream_with_context
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request as AuthRequest
+from flask import Flask, render_template, abort, request, jsonify, Response, send_file, stream_with_context
+from werkzeug.http import is_resource_modified
 
 # If deploying to platforms like Render where you cannot store a file directly,
 # we support providing the service account JSON via the environment variable
@@ -26,10 +23,34 @@ if sa_json:
 
 app = Flask(__name__)
 from config import DATABASE_PATH
+import db
+from blob_cache import BLOB_CACHE_ENABLED, blob_cache, record_download
+from catalogue import (
+    FILE_SQL, SUBFOLDERS_SQL, FolderStatsCache, breadcrumbs, folder_path, list_folder_page, subtree_stats,
+    write_generation_stamp
+)
+from drive_client import (
+    download_to_file, drive_session, drive_token, file_etag, media_headers, media_url,
+    parse_modified_time
+)
+from fuzzy_search import FuzzySearch, load_rows
+from migrations import run_migrations
+from prefix_index import PrefixIndex
+from response_cache import ResponseCache
+from search_index import search_files
+from streaming import download_meter, iter_chunks
 
 # Use the detected database path from config (DATABASE_URL-aware fallback)
 DATABASE = DATABASE_PATH
 
+# Terapkan migrasi skema (index, FTS5) sebelum melayani request
+try:
+    run_migrations(DATABASE)
+    # Stamp generasi untuk response_cache (database bisa saja diganti saat deploy)
+    write_generation_stamp(DATABASE)
+except Exception as e:
+    print(f'Warning: database migrations failed: {e}')
+
 # === Konfigurasi Root Folder (harus sesuai dengan drive_sync.py) ===
 ROOT_FOLDERS = {
     "EBOOKS": "12ffd7GqHAiy3J62Vu65LbVt6-ultog5Z",
@@ -45,28 +66,50 @@ DISPLAY_NAMES = {
     "Service_Manual_1": "🔧 Service Manual (1)",
     "Service_Manual_2": "⚙️ Service Manual (2)"
 }
+# Nama tampilan per id folder root (untuk breadcrumb)
+ROOT_NAMES = {folder_id: DISPLAY_NAMES.get(key, key) for key, folder_id in ROOT_FOLDERS.items()}
+
+# Statistik folder (jumlah & ukuran) dari tabel folder_stats, di-cache per worker
+folder_stats = FolderStatsCache(DATABASE)
+
+# Cache halaman katalog & API pencarian per generasi katalog (ETag + 304 tanpa query)
+response_cache = ResponseCache(DATABASE)
+app.extensions['response_cache'] = response_cache
+
+# Index prefix bersama (mmap) untuk autocomplete; dibangun sekali, dipakai semua worker
+prefix_index = PrefixIndex(DATABASE)
+app.extensions['prefix_index'] = prefix_index
+prefix_index.rebuild()
+
+# Pencarian toleran typo ("serivce manual"), dipakai jika pencarian biasa kosong
+fuzzy_search = FuzzySearch(prefix_index)
+app.extensions['fuzzy_search'] = fuzzy_search
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_connection(readonly=True):
+    """Borrow a pooled connection: `with get_db_connection() as conn: ...`
+
+    Browse routes use read-only connections so they never wait on the
+    write lock held by webhooks or a catalogue sync.
+    """
+    return db.connection(DATABASE, readonly=readonly)
+
+
+def get_root_list(conn):
+    """(display name, folder id, item count) for each root folder."""
+    stats = folder_stats.get_all(conn)
+    root_list = []
+    for key, folder_id in ROOT_FOLDERS.items():
+        count = stats.get(folder_id, {}).get('recursive_count', 0)
+        name = DISPLAY_NAMES.get(key, key)
+        root_list.append((name, folder_id, count))
+    return root_list
 
 
 @app.context_processor
 def inject_root_list():
     """Make root_list available in all templates for the sidebar."""
-    conn = get_db_connection()
-    root_list = []
-    try:
-        for key, folder_id in ROOT_FOLDERS.items():
-            count = conn.execute(
-                "SELECT COUNT(*) FROM files WHERE (parent_id = ?) OR (root_folder_name = ?)",
-                (folder_id, key)
-            ).fetchone()[0]
-            name = DISPLAY_NAMES.get(key, key)
-            root_list.append((name, folder_id, count))
-    finally:
-        conn.close()
+    with get_db_connection() as conn:
+        root_list = get_root_list(conn)
     return dict(root_list=root_list)
 
 def sizeof_fmt(num, suffix="B"):
@@ -87,65 +130,84 @@ app.jinja_env.filters['filesizeformat'] = sizeof_fmt
 
 # === HALAMAN UTAMA: Tampilkan 4 root folder eksplisit ===
 @app.route('/')
+@response_cache.cached()
 def index():
-    conn = get_db_connection()
-    root_list = []
-    for key, folder_id in ROOT_FOLDERS.items():
-        # Hitung jumlah file & folder langsung di bawah root folder ini
-        count = conn.execute(
-            "SELECT COUNT(*) FROM files WHERE (parent_id = ?) OR (root_folder_name = ?)",
-            (folder_id, key)
-        ).fetchone()[0]
-        name = DISPLAY_NAMES.get(key, key)
-        root_list.append((name, folder_id, count))
-    conn.close()
+    with get_db_connection() as conn:
+        root_list = get_root_list(conn)
     return render_template('index.html', root_list=root_list)
 
 
 # === TAMPILKAN ISI FOLDER ===
 @app.route('/folder/<folder_id>')
+@response_cache.cached()
 def view_folder(folder_id):
-    conn = get_db_connection()
-    
-    # Cari nama folder ini (untuk judul halaman)
-    folder_name = "Folder"
-    for key, fid in ROOT_FOLDERS.items():
-        if fid == folder_id:
-            folder_name = DISPLAY_NAMES.get(key, key)
-            break
-    else:
-        # Coba cari dari database jika ini subfolder
-        folder_row = conn.execute(
-            "SELECT name FROM files WHERE id = ? AND is_directory = 1", (folder_id,)
-        ).fetchone()
-        if folder_row:
-            folder_name = folder_row['name']
-        else:
-            # Cek apakah ada file di folder ini (meski folder root tidak tersimpan)
-            count = conn.execute(
-                "SELECT COUNT(*) FROM files WHERE parent_id = ?", (folder_id,)
-            ).fetchone()[0]
-            if count == 0:
-                abort(404)
-
-    # Ambil semua item di folder ini
-    items = conn.execute(
-        "SELECT * FROM files WHERE parent_id = ? ORDER BY is_directory DESC, name",
-        (folder_id,)
-    ).fetchall()
-    conn.close()
-
-    return render_template('folder.html', folder_id=folder_id, folder_name=folder_name, items=items)
+    with get_db_connection() as conn:
+        all_stats = folder_stats.get_all(conn)
+        stats = all_stats.get(folder_id)
+
+        # Breadcrumb dari path folder; elemen terakhir = folder ini (judul halaman)
+        path = folder_path(conn, folder_id)
+        if path == f"/{folder_id}/" and folder_id not in ROOT_NAMES and not stats:
+            # Tidak tersimpan dan tidak punya isi (folder root memang tidak tersimpan)
+            abort(404)
+        trail = breadcrumbs(conn, path, ROOT_NAMES)
+        folder_name = trail[-1]['name']
+
+        # Halaman pertama saja; sisanya dimuat lewat /api/folder/<id>/items saat scroll
+        items, next_cursor = list_folder_page(conn, folder_id, request.args.get('cursor'))
+
+    # Ukuran & jumlah isi tiap subfolder untuk ditampilkan di kartu folder
+    subfolder_stats = {
+        item['id']: all_stats.get(item['id']) for item in items if item['is_directory']
+    }
+
+    return render_template('folder.html', folder_id=folder_id, folder_name=folder_name, items=items,
+                           stats=stats, subfolder_stats=subfolder_stats, next_cursor=next_cursor,
+                           trail=trail)
+
+
+@app.route('/api/folder/<folder_id>/items')
+@response_cache.cached()
+def api_folder_items(folder_id):
+    """Next page of a folder listing for infinite scroll (?cursor=...)"""
+    with get_db_connection() as conn:
+        all_stats = folder_stats.get_all(conn)
+        items, next_cursor = list_folder_page(conn, folder_id, request.args.get('cursor'))
+
+    results = []
+    for item in items:
+        entry = {
+            "id": item['id'],
+            "name": item['name'],
+            "mime_type": item['mime_type'],
+            "modified_time": item['modified_time'],
+            "is_directory": bool(item['is_directory']),
+            "size": item['size'],
+            "size_label": sizeof_fmt(item['size']),
+        }
+        if item['is_directory']:
+            sub = all_stats.get(item['id'])
+            entry["recursive_count"] = sub['recursive_count'] if sub else None
+            entry["total_bytes_label"] = sizeof_fmt(sub['total_bytes']) if sub else None
+        results.append(entry)
+    return jsonify({"items": results, "next_cursor": next_cursor})
+
+
+@app.route('/api/folder/<folder_id>/info')
+@response_cache.cached()
+def api_folder_info(folder_id):
+    """Breadcrumb and totals of everything below a folder, at any depth"""
+    with get_db_connection() as conn:
+        trail = breadcrumbs(conn, folder_path(conn, folder_id), ROOT_NAMES)
+        totals = subtree_stats(conn, folder_id)
+    return jsonify({"breadcrumbs": trail, **totals})
 
 
 # === PREVIEW FILE (PDF) ===
 @app.route('/file/<file_id>')
 def file_preview(file_id):
-    conn = get_db_connection()
-    try:
-        file = conn.execute(
-            "SELECT * FROM files WHERE id = ? AND is_directory = 0", (file_id,)
-        ).fetchone()
+    with get_db_connection() as conn:
+        file = conn.execute(FILE_SQL, (file_id,)).fetchone()
         if not file:
             abort(404)
 
@@ -153,15 +215,30 @@ def file_preview(file_id):
         sidebar_items = []
         if parent_id:
             # show sibling folders (directories) in the same parent for navigation
-            sidebar_items = conn.execute(
-                "SELECT id, name FROM files WHERE parent_id = ? AND is_directory = 1 ORDER BY name",
-                (parent_id,)
-            ).fetchall()
-    finally:
-        conn.close()
+            sidebar_items = conn.execute(SUBFOLDERS_SQL, (parent_id,)).fetchall()
+
+        trail = breadcrumbs(conn, file['path'], ROOT_NAMES)[:-1] if file['path'] else []
 
     # Render a PDF.js single-page viewer (falls back to Drive preview if CORS prevents loading)
-    return render_template('pdfjs_viewer.html', file=file, sidebar_items=sidebar_items)
+    return render_template('pdfjs_viewer.html', file=file, sidebar_items=sidebar_items, trail=trail)
+
+
+def _if_range_matches(etag, last_modified):
+    """True if the request has no If-Range, or its validator still matches."""
+    if_range = request.if_range
+    if if_range.etag:
+        return etag is not None and if_range.etag == etag
+    if if_range.date:
+        return last_modified is not None and if_range.date == last_modified
+    return True
+
+
+def _set_validators(resp, etag, last_modified):
+    resp.headers['Accept-Ranges'] = 'bytes'
+    if etag:
+        resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
 
 
 @app.route('/download/<file_id>')
@@ -169,83 +246,161 @@ def download_proxy(file_id):
     """Proxy endpoint that downloads a file from Google Drive using a service account
     and streams it back to the client. This avoids client-side CORS issues when
     PDF.js requests the PDF binary directly.
+
+    Range requests are forwarded to Drive (206 + Content-Range), so PDF.js can
+    load large manuals progressively. If-None-Match / If-Modified-Since are
+    answered with 304 from files.modified_time without contacting Drive.
+    Files up to BLOB_CACHE_MAX_OBJECT_BYTES are served from the local blob
+    cache after the first download; a miss is proxied while the cache fills.
     """
+    with get_db_connection() as conn:
+        meta = conn.execute(
+            "SELECT mime_type, size, modified_time FROM files WHERE id = ?", (file_id,)
+        ).fetchone()
+    modified_time = meta['modified_time'] if meta else None
+    etag = file_etag(file_id, modified_time)
+    last_modified = parse_modified_time(modified_time)
+
+    if etag and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        resp = Response(status=304)
+        _set_validators(resp, etag, last_modified)
+        return resp
+
+    # If-Range yang tidak cocok berarti file sudah berubah: kirim file utuh
+    range_header = request.headers.get('Range')
+    if range_header and not _if_range_matches(etag, last_modified):
+        range_header = None
+
+    # Hitung hanya request pertama, bukan setiap potongan Range dari PDF.js
+    if not range_header or range_header.replace(' ', '').startswith('bytes=0-'):
+        record_download(file_id, DATABASE)
+
+    # File yang sudah ada di cache lokal dikirim dengan sendfile (termasuk Range).
+    # Miss tidak pernah menunggu file utuh: download penuh disalin ke cache sambil
+    # dikirim, Range (PDF.js) di-proxy seperti biasa dan cache diisi di background.
+    cache_miss = False
+    if BLOB_CACHE_ENABLED and meta and blob_cache.cacheable(meta['size']):
+        path = blob_cache.lookup(file_id, modified_time)
+        if path is None:
+            cache_miss = True
+            if range_header:
+                blob_cache.fill_in_background(file_id, modified_time, lambda f: download_to_file(file_id, f))
+        if path:
+            try:
+                resp = send_file(
+                    path,
+                    mimetype=meta['mime_type'] or 'application/octet-stream',
+                    conditional=True,
+                    etag=etag or False,
+                    last_modified=last_modified,
+                )
+            except FileNotFoundError:
+                # Di-evict antara lookup dan send_file: ambil dari Drive seperti miss
+                cache_miss = True
+            else:
+                resp.headers['Accept-Ranges'] = 'bytes'
+                return resp
+
     # ensure credentials file exists
-    creds_file = os.path.join(os.path.dirname(__file__), 'credentials.json')
-    if not os.path.exists(creds_file):
+    if not drive_token.available():
         app.logger.error('credentials.json not found')
         abort(404)
 
     try:
-        creds = service_account.Credentials.from_service_account_file(
-            creds_file, scopes=['https://www.googleapis.com/auth/drive.readonly']
-        )
-        creds.refresh(AuthRequest())
-        token = creds.token
+        token = drive_token.get_token()
     except Exception:
         app.logger.exception('Failed to obtain service account token')
         abort(500)
 
-    drive_url = f'https://www.googleapis.com/drive/v3/files/{file_id}?alt=media'
-    headers = {'Authorization': f'Bearer {token}'}
     try:
-        r = requests.get(drive_url, headers=headers, stream=True, timeout=60)
+        r = drive_session.get(
+            media_url(file_id), headers=media_headers(token, range_header), stream=True, timeout=60
+        )
     except Exception:
         app.logger.exception('Error requesting file from Drive')
         abort(502)
 
-    if r.status_code != 200:
+    if r.status_code == 416:
+        r.close()
+        resp = Response('Requested range not satisfiable', status=416)
+        if r.headers.get('Content-Range'):
+            resp.headers['Content-Range'] = r.headers['Content-Range']
+        _set_validators(resp, etag, last_modified)
+        return resp
+
+    if r.status_code not in (200, 206):
         app.logger.error('Drive returned status %s for file %s', r.status_code, file_id)
+        r.close()
         return (f'Failed to download file (status {r.status_code})', 502)
 
     def generate():
-        for chunk in r.iter_content(chunk_size=8192):
-            if chunk:
-                yield chunk
+        # close() mengembalikan koneksi keep-alive ke pool drive_session
+        try:
+            r.raw.decode_content = True
+            chunks = iter_chunks(r.raw)
+            if cache_miss and r.status_code == 200:
+                chunks = blob_cache.tee(file_id, modified_time, chunks, r.headers.get('Content-Length'))
+            yield from download_meter.track(chunks, label=file_id, logger=app.logger)
+        finally:
+            r.close()
 
     content_type = r.headers.get('Content-Type', 'application/octet-stream')
-    resp = Response(stream_with_context(generate()), content_type=content_type)
-    disp = r.headers.get('Content-Disposition')
-    if disp:
-        resp.headers['Content-Disposition'] = disp
+    resp = Response(stream_with_context(generate()), status=r.status_code, content_type=content_type)
+    for header in ('Content-Length', 'Content-Range', 'Content-Disposition'):
+        if r.headers.get(header):
+            resp.headers[header] = r.headers[header]
+    _set_validators(resp, etag, last_modified)
     return resp
 
 
 # === PENCARIAN GLOBAL ===
 @app.route('/search')
+@response_cache.cached()
 def search():
     query = request.args.get('q', '').strip()
     if not query:
         return index()
 
-    conn = get_db_connection()
-    results = conn.execute(
-        "SELECT *, (CASE WHEN root_folder_name = 'EBOOKS' THEN '📚 EBOOKS' " +
-        "WHEN root_folder_name = 'Pengetahuan' THEN '🧠 Pengetahuan' " +
-        "WHEN root_folder_name = 'Service_Manual_1' THEN '🔧 Service Manual (1)' " +
-        "WHEN root_folder_name = 'Service_Manual_2' THEN '⚙️ Service Manual (2)' " +
-        "ELSE root_folder_name END) as display_root " +
-        "FROM files WHERE name LIKE ? ORDER BY root_folder_name, name",
-        (f"%{query}%",)
-    ).fetchall()
-    conn.close()
-    return render_template('search.html', query=query, results=results)
+    columns = ("f.*, (CASE WHEN f.root_folder_name = 'EBOOKS' THEN '📚 EBOOKS' " +
+               "WHEN f.root_folder_name = 'Pengetahuan' THEN '🧠 Pengetahuan' " +
+               "WHEN f.root_folder_name = 'Service_Manual_1' THEN '🔧 Service Manual (1)' " +
+               "WHEN f.root_folder_name = 'Service_Manual_2' THEN '⚙️ Service Manual (2)' " +
+               "ELSE f.root_folder_name END) as display_root")
+    fuzzy = False
+    with get_db_connection() as conn:
+        # ?in=<folder_id>: hanya di dalam folder itu (berapa pun kedalamannya)
+        within = request.args.get('in')
+        path = folder_path(conn, within) if within else None
+        scope = breadcrumbs(conn, path, ROOT_NAMES) if path else []
+        results = search_files(conn, query, columns=columns, db_path=DATABASE, within=path)
+        if not results:
+            matches = fuzzy_search.search(query)
+            if matches:
+                results = [
+                    row for row in load_rows(conn, matches, columns=columns)
+                    if not path or (row['path'] or '').startswith(path) and row['path'] != path
+                ]
+                fuzzy = bool(results)
+    return render_template('search.html', query=query, results=results, fuzzy=fuzzy, scope=scope)
 
 
 # === API untuk integrasi (misal: Compyle) ===
 @app.route('/api/search', methods=['POST'])
+@response_cache.cached()
 def api_search():
     data = request.get_json() or {}
     query = data.get('query', '').strip()
     if not query:
         return jsonify({"results": []})
     
-    conn = get_db_connection()
-    results = conn.execute(
-        "SELECT name, id FROM files WHERE is_directory = 0 AND name LIKE ? LIMIT 10",
-        (f"%{query}%",)
-    ).fetchall()
-    conn.close()
+    with get_db_connection() as conn:
+        within = data.get('in')
+        results = search_files(
+            conn, query, columns="f.name, f.id", files_only=True, limit=10, db_path=DATABASE,
+            within=folder_path(conn, within) if within else None
+        )
+    if not results and not within:
+        results = fuzzy_search.search(query, limit=10, files_only=True) or []
     
     return jsonify([
         {
@@ -258,17 +413,22 @@ def api_search():
 
 # === API untuk Autocomplete ===
 @app.route('/api/autocomplete')
+@response_cache.cached()
 def api_autocomplete():
     query = request.args.get('q', '').strip()
     if not query or len(query) < 2:
         return jsonify([])
     
-    conn = get_db_connection()
-    results = conn.execute(
-        "SELECT name, id, is_directory, mime_type FROM files WHERE name LIKE ? LIMIT 8",
-        (f"%{query}%",)
-    ).fetchall()
-    conn.close()
+    results = prefix_index.suggest(query, limit=8)
+    if results == []:
+        # Tidak ada awalan yang cocok: mungkin salah ketik
+        results = fuzzy_search.search(query, limit=8)
+    if results is None:
+        # Index belum siap / sedang dibangun ulang setelah sync
+        with get_db_connection() as conn:
+            results = search_files(
+                conn, query, columns="f.name, f.id, f.is_directory, f.mime_type", limit=8, db_path=DATABASE
+            )
     
     return jsonify([
         {
@@ -0,0 +1,127 @@
+"""
+Benchmark: dashboard KPI latency over N synthetic orders
+
+Fills a temporary database (init_payment_db schema, rollups maintained by
+their triggers) with N orders spread over two years, then times
+  - 8 queries over orders      (the original get_dashboard_stats)
+  - 1 pass over orders          (conditional aggregation, no rollups)
+  - compute_kpis                (one query over the order rollups)
+  - analytics.kpis()            (memoized, TTL not expired)
+and counts how many KPI queries 32 threads trigger when the memo expires.
+
+Run: python benchmarks/bench_analytics.py [--sizes 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_prefix_index import timed
+from analytics import Analytics, compute_kpis
+from order_manager import init_payment_db
+
+STATUSES = ["COMPLETED"] * 6 + ["PENDING"] * 2 + ["FAILED", "EXPIRED"]
+
+ORIGINAL_QUERIES = [
+    "SELECT SUM(amount) FROM orders WHERE status = 'COMPLETED'",
+    "SELECT SUM(amount) FROM orders WHERE status = 'COMPLETED' AND DATE(created_at) = DATE('now')",
+    "SELECT COUNT(DISTINCT user_email) FROM orders WHERE user_email IS NOT NULL",
+    "SELECT COUNT(*) FROM orders",
+    "SELECT COUNT(*) FROM orders WHERE status = 'COMPLETED'",
+    "SELECT COUNT(*) FROM orders WHERE status = 'PENDING'",
+    "SELECT COUNT(*) FROM orders WHERE status = 'FAILED'",
+    "SELECT AVG(amount) FROM orders WHERE status = 'COMPLETED'",
+]
+
+SINGLE_PASS = """
+SELECT
+    SUM(CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END),
+    SUM(CASE WHEN status = 'COMPLETED' AND created_at >= DATE('now') THEN amount ELSE 0 END),
+    COUNT(DISTINCT user_email),
+    COUNT(*),
+    COUNT(CASE WHEN status = 'COMPLETED' THEN 1 END),
+    COUNT(CASE WHEN status = 'PENDING' THEN 1 END),
+    COUNT(CASE WHEN status = 'FAILED' THEN 1 END)
+FROM orders
+"""
+
+
+def build_db(path: str, size: int, rng: random.Random):
+    init_payment_db(path)
+    conn = sqlite3.connect(path)
+    now = time.time()
+    rows = (
+        (f"ord_{i}", f"user_{rng.randrange(size // 20 + 1)}", f"user{rng.randrange(size // 20 + 1)}@mail.test",
+         f"doc_premium_{rng.randint(1, 3)}", "Premium", "document", float(rng.choice([25000, 50000, 99000])),
+         rng.choice(STATUSES),
+         time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - rng.random() * 730 * 86400)))
+        for i in range(size)
+    )
+    conn.executemany("""
+    INSERT INTO orders (id, user_id, user_email, product_id, product_name, product_type, amount, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.close()
+
+
+def run(size: int, repeats: int):
+    rng = random.Random(size)
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bench.db")
+    started = time.perf_counter()
+    build_db(db_path, size, rng)
+    print(f"\n{size:,} orders (built in {time.perf_counter() - started:.1f}s)")
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    analytics = Analytics(db_path, ttl=60)
+    runs = list(range(repeats))
+    results = {
+        "8 queries/orders": timed(lambda _: [conn.execute(q).fetchone() for q in ORIGINAL_QUERIES], runs),
+        "1 pass/orders": timed(lambda _: conn.execute(SINGLE_PASS).fetchone(), runs),
+        "compute_kpis": timed(lambda _: compute_kpis(conn), runs),
+        "analytics.kpis": timed(lambda _: analytics.kpis(), runs * 100),
+    }
+    for label, (p50, p95) in results.items():
+        print(f"  {label:<18} p50 {p50:12.1f} us   p95 {p95:12.1f} us")
+
+    # Memo kedaluwarsa saat 32 thread polling bersamaan
+    analytics = Analytics(db_path, ttl=0.05)
+    analytics.kpis()
+    time.sleep(0.1)
+    barrier = threading.Barrier(32)
+
+    def poll():
+        barrier.wait()
+        analytics.kpis()
+
+    threads = [threading.Thread(target=poll) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = analytics.stats()
+    print(f"  32 concurrent polls after expiry: {stats['computed'] - 1} recomputation(s), "
+          f"{stats['stale']} served the previous result")
+
+    conn.close()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeats)
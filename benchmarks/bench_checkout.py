@@ -0,0 +1,102 @@
+"""
+Benchmark: premium checkout, synchronous DANA call vs the checkout queue
+
+Runs the payment blueprint on a throwaway Flask app against a temp
+database and fake_dana with a slow create endpoint. T clients each POST
+/payment/docs/premium and, in async mode, poll /payment/status/<order_id>
+every 100 ms until payment_url is set (like premium.html). Reports
+  - POST handler time (how long a gunicorn worker is occupied)
+  - worker time per checkout (POST + status polls)
+  - time until the client has its payment URL
+
+Run: python benchmarks/bench_checkout.py [--checkouts 200] [--threads 16] [--latency 0.3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_dana import FakeDana, serve
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--checkouts", type=int, default=200)
+parser.add_argument("--threads", type=int, default=16)
+parser.add_argument("--latency", type=float, default=0.3)
+args = parser.parse_args()
+
+fake = FakeDana(latency=args.latency)
+server = serve(fake)
+# Konfigurasi dibaca saat import: set sebelum modul aplikasi dimuat
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DANA_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+os.environ["RECONCILE_ENABLED"] = "false"
+os.environ["CHECKOUT_POLL_INTERVAL"] = "0.05"
+
+from flask import Flask
+
+import payment_routes
+from checkout_queue import checkout_worker
+from config import DATABASE_PATH
+from order_manager import init_payment_db
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[max(0, int(len(samples) * q) - 1)]
+
+
+def run(mode: str, app: Flask):
+    payment_routes.CHECKOUT_ASYNC = mode == "async"
+    post_ms, busy_ms, ready_ms, lock = [], [], [], threading.Lock()
+
+    def client(count: int):
+        http = app.test_client()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = http.post("/payment/docs/premium", json={"product_id": "doc_premium_1",
+                                                                 "email": "bench@mail.test"})
+            post = (time.perf_counter() - started) * 1000
+            busy = post
+            data = response.get_json()
+            while not data.get("payment_url"):
+                time.sleep(0.1)
+                poll_started = time.perf_counter()
+                data = http.get(data.get("status_url") or f"/payment/status/{data['order_id']}").get_json()
+                busy += (time.perf_counter() - poll_started) * 1000
+            with lock:
+                post_ms.append(post)
+                busy_ms.append(busy)
+                ready_ms.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(args.checkouts // args.threads,)) for _ in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"  {mode:<6} POST p50 {statistics.median(post_ms):7.1f} ms  p95 {percentile(post_ms, 0.95):7.1f} ms   "
+          f"worker time/checkout {statistics.mean(busy_ms):6.1f} ms   "
+          f"payment URL p50 {statistics.median(ready_ms):6.0f} ms  p95 {percentile(ready_ms, 0.95):6.0f} ms   "
+          f"{len(post_ms) / elapsed:5.1f} checkouts/s")
+
+
+if __name__ == '__main__':
+    init_payment_db(DATABASE_PATH)
+    app = Flask(__name__, template_folder=os.path.join(ROOT, "templates"))
+    app.register_blueprint(payment_routes.payment_bp)
+    checkout_worker.start()
+
+    print(f"{args.checkouts} checkouts, {args.threads} clients, DANA create latency {args.latency * 1000:.0f} ms")
+    run("sync", app)
+    run("async", app)
+    print(f"  checkout worker {checkout_worker.stats()}")
+    server.shutdown()
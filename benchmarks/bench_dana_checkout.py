@@ -0,0 +1,98 @@
+"""
+Benchmark: checkout calls to DANA, bare requests vs the pooled HTTPClient
+
+Starts fake_dana in-process (latency and a share of transient 503s), then
+runs create_payment_order + verify_payment for N checkouts from T threads
+through DANAPaymentGateway with
+  - bare: requests.request per call (new TCP connection each time, no
+    retries), like the original gateway
+  - pooled: http_client.HTTPClient (keep-alive pool, jittered retries)
+and reports checkouts/s, failed checkouts, TCP connections accepted by
+the fake, and the per-call latency histograms.
+
+Run: python benchmarks/bench_dana_checkout.py [--checkouts 2000] [--threads 16]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dana_payment import DANAPaymentGateway
+from fake_dana import FakeDana, serve
+from http_client import HTTPClient
+from token_store import SharedToken
+
+
+class BareHTTP(HTTPClient):
+    """One request per call, no session and no retries (original behaviour)"""
+
+    def request(self, name, method, path, idempotent=False, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = requests.request(method, f"{self.base_url}{path}", **kwargs)
+            ok = response.status_code < 400
+            return response
+        finally:
+            self._observe(name, (time.perf_counter() - started) * 1000, ok, 0)
+
+
+def run(label: str, client_class, checkouts: int, threads: int, latency: float, error_rate: float):
+    fake = FakeDana(latency=latency, error_rate=error_rate, auto_settle=True, seed=1)
+    server = serve(fake)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    gateway = DANAPaymentGateway()
+    gateway.base_url = base_url
+    gateway.http = client_class(base_url, pool_size=threads, backoff_base=0.01)
+    gateway.token = SharedToken(f"dana:bench:{label}", gateway._fetch_access_token,
+                                db_path=os.path.join(tempfile.mkdtemp(), "tokens.db"))
+
+    failed = [0]
+    lock = threading.Lock()
+
+    def worker(count: int, offset: int):
+        for i in range(count):
+            order_id = f"{label}_{offset}_{i}"
+            created = gateway.create_payment_order(order_id, 500.0, "Premium", "bench",
+                                                   "http://x/notify", "http://x/return")
+            verified = created.get("success") and gateway.verify_payment(order_id, created["dana_order_id"])
+            if not (verified and verified.get("verified")):
+                with lock:
+                    failed[0] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(checkouts // threads, t)) for t in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done = checkouts // threads * threads
+    server.shutdown()
+
+    print(f"  {label:<7} {done / elapsed:8.1f} checkouts/s   failed {failed[0] / done:6.1%}   "
+          f"tcp connections {fake.connections}")
+    for name, h in gateway.http.stats().items():
+        print(f"           {name:<22} calls {h['calls']:6}  retries {h['retries']:5}  "
+              f"errors {h['errors']:5}  avg {h['avg_ms']:7.2f} ms  p95 <= {h['p95_ms']} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    print(f"{args.checkouts} checkouts, {args.threads} threads, fake latency {args.latency * 1000:.0f} ms, "
+          f"{args.error_rate:.0%} transient 503s")
+    run("bare", BareHTTP, args.checkouts, args.threads, args.latency, args.error_rate)
+    run("pooled", HTTPClient, args.checkouts, args.threads, args.latency, args.error_rate)
@@ -0,0 +1,83 @@
+"""
+Benchmark: orders export, fetchall + str += vs the streaming exporter
+
+Uses the synthetic orders of bench_analytics and reports wall time and
+peak Python memory (tracemalloc) for
+  - fetchall + str +=           (the original export_orders_csv)
+  - order_export csv / ndjson   (fetchmany chunks, bytes discarded as a
+                                 WSGI server would after sending them)
+  - order_export csv + gzip
+
+Run: python benchmarks/bench_export.py [--sizes 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_analytics import build_db
+from order_export import export_orders
+
+
+def original_export(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+    SELECT id, user_email, product_name, amount, status, created_at, completed_at
+    FROM orders
+    ORDER BY created_at DESC
+    """).fetchall()
+    conn.close()
+    csv_data = "Order ID,Email,Product,Amount,Status,Created,Completed\n"
+    for row in rows:
+        csv_data += f"{row['id']},{row['user_email']},{row['product_name']},{row['amount']},{row['status']},{row['created_at']},{row['completed_at']}\n"
+    return len(csv_data)
+
+
+def streamed(db_path: str, fmt: str, compress: bool = False) -> int:
+    return sum(len(chunk) for chunk in export_orders(db_path, fmt, compress=compress))
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def run(size: int):
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bench.db")
+    build_db(db_path, size, random.Random(size))
+    print(f"\n{size:,} orders")
+    cases = {
+        "fetchall + str +=": lambda: original_export(db_path),
+        "stream csv": lambda: streamed(db_path, "csv"),
+        "stream ndjson": lambda: streamed(db_path, "ndjson"),
+        "stream csv + gzip": lambda: streamed(db_path, "csv", compress=True),
+    }
+    for label, fn in cases.items():
+        elapsed, peak, output = measure(fn)
+        print(f"  {label:<18} {elapsed:7.2f} s   peak {peak / 2**20:8.1f} MiB   output {output / 2**20:7.1f} MiB")
+
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size)
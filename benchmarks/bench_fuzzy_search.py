@@ -0,0 +1,104 @@
+"""
+Benchmark: typo-tolerant search latency and recall
+
+Uses the synthetic catalogue of bench_prefix_index, then searches for
+names with one typo per long word (swap, drop, double or replace a
+letter) and a few dash/dot spellings of engine codes. Reports p50/p95
+for fuzzy_search and for the FTS5 path, which finds nothing for most of
+these queries, and the share of queries whose source file is matched
+at all / in the top 10 (synthetic names repeat, so many results tie).
+
+Run: python benchmarks/bench_fuzzy_search.py [--sizes 10000 100000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_prefix_index import build_db, timed
+from fuzzy_search import FuzzyMatcher
+from prefix_index import MappedIndex, build_index
+from search_index import search_files
+
+
+def typo(word: str, rng: random.Random) -> str:
+    if len(word) < 5 or not word.isalpha():
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 1:
+        return word[:i] + word[i + 1:]
+    if kind == 2:
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice("aeiounrst") + word[i + 1:]
+
+
+def make_queries(conn: sqlite3.Connection, rng: random.Random, count: int):
+    total = conn.execute("SELECT max(rowid) FROM files").fetchone()[0]
+    queries = []
+    for _ in range(count):
+        file_id, name = conn.execute(
+            "SELECT id, name FROM files WHERE rowid = ?", (rng.randint(1, total),)
+        ).fetchone()
+        words = name.replace(".pdf", "").split()
+        picked = rng.sample(words, k=min(len(words), rng.randint(2, 3)))
+        if rng.random() < 0.2:
+            # Kode mesin ditulis tanpa tanda hubung / dengan titik
+            picked = [w.replace("-", rng.choice(["", "."])) for w in picked]
+        queries.append((" ".join(typo(w, rng) for w in picked), file_id))
+    return queries
+
+
+def run(size: int, queries_per_path: int):
+    rng = random.Random(size)
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bench.db")
+    build_db(db_path, size, rng)
+    build_index(db_path, f"{db_path}.prefix")
+    matcher = FuzzyMatcher(MappedIndex(f"{db_path}.prefix"))
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    queries = make_queries(conn, rng, queries_per_path)
+
+    found = top10 = 0
+    for query, file_id in queries:
+        ids = [matcher.index.doc(doc)["id"] for doc, _edits in matcher.search(query, size)]
+        found += file_id in ids
+        top10 += file_id in ids[:10]
+    fts_empty = sum(
+        not search_files(conn, query, columns="f.id", limit=10, db_path=db_path)
+        for query, _file_id in queries
+    )
+
+    texts = [query for query, _file_id in queries]
+    results = {
+        "FTS5 bm25": timed(lambda q: search_files(conn, q, columns="f.id", limit=10, db_path=db_path), texts),
+        "fuzzy_search": timed(lambda q: matcher.search(q, 10), texts),
+    }
+    print(f"\n{size:,} names, {len(queries)} typo queries "
+          f"(FTS5 finds nothing for {fts_empty / len(queries):.0%})")
+    for label, (p50, p95) in results.items():
+        print(f"  {label:<14} p50 {p50:10.1f} us   p95 {p95:10.1f} us")
+    print(f"  fuzzy recall: {found / len(queries):.1%} matched, {top10 / len(queries):.1%} in top 10")
+
+    conn.close()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.queries)
@@ -0,0 +1,123 @@
+"""
+Benchmark: autocomplete latency, SQL vs the mmap prefix index
+
+Builds a synthetic catalogue of N file names (manual-like: brand, model,
+engine code, document type) in a temporary SQLite database with the
+normal migrations, then times top-8 suggestions for the same queries via
+  - LIKE '%q%'            (the original /api/autocomplete)
+  - FTS5 + bm25           (search_index.search_files)
+  - prefix_index          (sorted tokens + bisect over an mmap)
+
+Run: python benchmarks/bench_prefix_index.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import run_migrations
+from prefix_index import MappedIndex, build_index
+from search_index import search_files
+
+BRANDS = ["Toyota", "Honda", "Suzuki", "Daihatsu", "Mitsubishi", "Nissan", "Isuzu", "Hino",
+          "Mazda", "Hyundai", "Kia", "Wuling", "Chevrolet", "Ford", "Mercedes", "BMW"]
+MODELS = ["Avanza", "Xenia", "Innova", "Fortuner", "Rush", "Jazz", "Brio", "Ertiga", "Pajero",
+          "Livina", "Panther", "Dutro", "Terios", "Agya", "Ayla", "Calya", "Sigra", "Xpander",
+          "CR-V", "HR-V", "Carry", "APV", "L300", "Colt", "Elf", "Grand Max", "Hilux", "Yaris"]
+DOCS = ["Service Manual", "Wiring Diagram", "Repair Manual", "Engine Manual", "Body Repair",
+        "Electrical", "Transmission", "Parts Catalog", "Training", "Maintenance"]
+
+
+def make_name(rng: random.Random) -> str:
+    engine = f"{rng.randint(1, 4)}{rng.choice('NKTARGZ')}{rng.choice('RZDEK')}-{rng.choice(['FE', 'VE', 'GE', 'E'])}"
+    return f"{rng.choice(DOCS)} {rng.choice(BRANDS)} {rng.choice(MODELS)} {engine} {rng.randint(1995, 2024)}.pdf"
+
+
+def make_queries(rng: random.Random, count: int):
+    queries = []
+    for _ in range(count):
+        words = make_name(rng).replace(".pdf", "").split()
+        kind = rng.random()
+        if kind < 0.5:
+            word = rng.choice(words)
+            queries.append(word[:rng.randint(2, len(word))])
+        else:
+            start = rng.randrange(len(words) - 1)
+            last = words[start + 1]
+            queries.append(f"{words[start]} {last[:rng.randint(1, len(last))]}")
+    return queries
+
+
+def build_db(path: str, size: int, rng: random.Random):
+    run_migrations(path)
+    conn = sqlite3.connect(path)
+    rows = ((f"id{i:08d}", make_name(rng), "application/pdf", 1024, None, "root", "Bench", 0)
+            for i in range(size))
+    conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, queries):
+    samples = []
+    for q in queries:
+        started = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def run(size: int, queries_per_path: int):
+    rng = random.Random(size)
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, "bench.db")
+    started = time.perf_counter()
+    build_db(db_path, size, rng)
+    db_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    build_index(db_path, f"{db_path}.prefix")
+    index_seconds = time.perf_counter() - started
+    index = MappedIndex(f"{db_path}.prefix")
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    queries = make_queries(rng, queries_per_path)
+    like_queries = queries[:max(20, queries_per_path // 20)]
+
+    results = {
+        "LIKE '%q%'": timed(lambda q: conn.execute(
+            "SELECT name, id, is_directory FROM files WHERE name LIKE ? LIMIT 8", (f"%{q}%",)
+        ).fetchall(), like_queries),
+        "FTS5 bm25": timed(lambda q: search_files(
+            conn, q, columns="f.name, f.id, f.is_directory, f.mime_type", limit=8, db_path=db_path
+        ), queries),
+        "prefix_index": timed(lambda q: index.suggest(q, 8), queries),
+    }
+
+    print(f"\n{size:,} names  (db {db_seconds:.1f}s, index build {index_seconds:.1f}s, "
+          f"{index.size / 1024 ** 2:.1f} MiB mmap)")
+    for label, (p50, p95) in results.items():
+        print(f"  {label:<14} p50 {p50:10.1f} us   p95 {p95:10.1f} us")
+
+    conn.close()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.queries)
@@ -0,0 +1,127 @@
+"""
+Benchmark: success page and PENDING order reconciliation
+
+N PENDING orders aged 1 minute to 6 hours, and a fake_dana where most of
+them have settled (or failed) without a webhook. Measures
+  - success page work: the original inline verify_payment +
+    update_order_status vs reading local state (get_order)
+  - one Reconciler round: DANA calls, orders updated, write transactions
+    and wall time with bounded concurrency, then a second round right
+    after (the age-based schedule should poll nothing)
+
+Run: python benchmarks/bench_reconciler.py [--orders 2000] [--latency 0.02]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from dana_payment import DANAPaymentGateway
+from fake_dana import FakeDana, serve
+from query_plans import ORDER_QUERIES, explain
+from order_manager import OrderManager, init_payment_db
+from reconciler import Reconciler
+from token_store import SharedToken
+
+
+def make_db(orders: int, rng: random.Random) -> str:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    init_payment_db(path)
+    manager = OrderManager(path)
+    now = datetime.utcnow()
+    for i in range(orders):
+        manager.create_order(f"ord_{i}", f"user_{i}", "doc_premium_1", "Premium", 50000.0,
+                             user_email=f"user{i % 500}@mail.test")
+    with db.connection(path) as conn:
+        conn.executemany("UPDATE orders SET created_at = ?, dana_order_id = ? WHERE id = ?", [
+            ((now - timedelta(seconds=rng.randint(60, 6 * 3600))).strftime("%Y-%m-%d %H:%M:%S"),
+             f"dana_{i}", f"ord_{i}")
+            for i in range(orders)
+        ])
+    return path
+
+
+def make_fake(orders: int, latency: float, rng: random.Random) -> FakeDana:
+    fake = FakeDana(latency=latency)
+    for i in range(orders):
+        status = rng.choices(["COMPLETED", "EXPIRED", "PENDING"], weights=[6, 1, 3])[0]
+        fake.orders[f"ord_{i}"] = {"orderId": f"dana_{i}", "status": status, "orderAmount": 50000}
+    return fake
+
+
+def make_gateway(base_url: str) -> DANAPaymentGateway:
+    gateway = DANAPaymentGateway()
+    gateway.http.base_url = base_url
+    gateway.token = SharedToken("dana:bench", gateway._fetch_access_token,
+                                db_path=os.path.join(tempfile.mkdtemp(), "tokens.db"))
+    return gateway
+
+
+def timed(fn, samples):
+    durations = []
+    for order_id in samples:
+        started = time.perf_counter()
+        fn(order_id)
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return statistics.median(durations), durations[int(len(durations) * 0.95) - 1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    path = make_db(args.orders, rng)
+    fake = make_fake(args.orders, args.latency, rng)
+    server = serve(fake)
+    gateway = make_gateway(f"http://127.0.0.1:{server.server_address[1]}")
+    manager = OrderManager(path)
+    expected = sum(1 for order in fake.orders.values() if order["status"] != "PENDING")
+    print(f"{args.orders} PENDING orders, {expected} settled at DANA, {args.latency * 1000:.0f} ms DANA latency")
+
+    with db.connection(path, readonly=True) as conn:
+        plan = explain(conn, *ORDER_QUERIES["reconciler.claim"])
+    print(f"  claim plan     {' | '.join(plan)}")
+
+    samples = [f"ord_{i}" for i in rng.sample(range(args.orders), 200)]
+
+    def inline(order_id):
+        order = manager.get_order(order_id)
+        if gateway.verify_payment(order_id, order.get('dana_order_id')).get('verified'):
+            pass  # tanpa update agar order tetap PENDING untuk rekonsiliasi
+
+    p50, p95 = timed(inline, samples)
+    print(f"  success page   inline verify  p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+    p50, p95 = timed(manager.get_order, samples)
+    print(f"  success page   local state    p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+
+    reconciler = Reconciler(db_path=path, orders=manager, gateway=gateway, concurrency=args.concurrency,
+                            rate=args.rate, enabled=False)
+    calls_before = fake.calls.get("verify_payment", 0)
+    started = time.perf_counter()
+    polled = reconciler.run_once()
+    elapsed = time.perf_counter() - started
+    stats = reconciler.stats()
+    batches = -(-polled // reconciler.batch_size)
+    print(f"  reconcile      polled {polled}   updated {stats['updated']}/{expected}   "
+          f"DANA calls {fake.calls['verify_payment'] - calls_before}   "
+          f"write transactions {batches * 2}   {elapsed:.2f} s "
+          f"(throttled {stats['throttled_seconds']} s)")
+    print(f"  second round   polled {reconciler.run_once()}")
+    with db.connection(path, readonly=True) as conn:
+        left = conn.execute("SELECT COUNT(*) FROM orders WHERE status = 'PENDING'").fetchone()[0]
+    print(f"  still PENDING  {left} (expected {args.orders - expected})")
+    server.shutdown()
@@ -0,0 +1,128 @@
+"""
+Benchmark: waiting for a payment outcome, polling vs the status bus
+
+C clients each wait for their own PENDING order while "another worker"
+(a separate SQLite connection, no in-process wake-up) completes the orders
+at random times over S seconds. Compares, through the payment blueprint,
+  - poll: GET /payment/status/<order_id> every second (reload / button)
+  - longpoll: GET /payment/status/<order_id>?since=<seq>&wait=25
+  - sse: GET /payment/status/<order_id>/events (payment_pending.html)
+and reports HTTP requests, pooled SQLite connection checkouts, and the
+delay between the write and the client seeing COMPLETED.
+
+Run: python benchmarks/bench_status_push.py [--clients 200] [--seconds 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from flask import Flask
+
+import db
+import payment_routes
+from config import DATABASE_PATH
+from order_manager import OrderManager, init_payment_db
+from status_bus import STATUS_BUS_RESERVED_THREADS, status_bus
+
+
+def checkouts() -> int:
+    return sum(pool["opened"] + pool["reused"] for pool in db.pool_stats())
+
+
+def settle(orders, seconds: float, settled_at: dict, rng: random.Random):
+    """Complete every order once, from a connection outside the pool"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=5, isolation_level=None)
+    schedule = sorted((rng.uniform(0.5, seconds), order_id) for order_id in orders)
+    started = time.perf_counter()
+    for at, order_id in schedule:
+        time.sleep(max(0.0, at - (time.perf_counter() - started)))
+        conn.execute("UPDATE orders SET status = 'COMPLETED', completed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     (order_id,))
+        settled_at[order_id] = time.perf_counter()
+    conn.close()
+
+
+def poll_client(http, order_id, seen_at, requests):
+    while True:
+        requests[0] += 1
+        if http.get(f"/payment/status/{order_id}").get_json()["status"] == "COMPLETED":
+            seen_at[order_id] = time.perf_counter()
+            return
+        time.sleep(1.0)
+
+
+def longpoll_client(http, order_id, seen_at, requests):
+    since = None
+    while True:
+        requests[0] += 1
+        url = f"/payment/status/{order_id}" + (f"?since={since}&wait=25" if since is not None else "")
+        data = http.get(url).get_json()
+        if data["status"] == "COMPLETED":
+            seen_at[order_id] = time.perf_counter()
+            return
+        since = data["seq"]
+
+
+def sse_client(http, order_id, seen_at, requests):
+    while True:
+        requests[0] += 1
+        response = http.get(f"/payment/status/{order_id}/events", buffered=False)
+        for chunk in response.response:
+            for line in chunk.decode().splitlines():
+                if line.startswith("data: ") and json.loads(line[6:])["status"] == "COMPLETED":
+                    seen_at[order_id] = time.perf_counter()
+                    response.close()
+                    return
+        response.close()
+
+
+def run(mode: str, client, app: Flask, count: int, seconds: float, rng: random.Random):
+    manager = OrderManager(DATABASE_PATH)
+    orders = [f"{mode}_{i}" for i in range(count)]
+    for order_id in orders:
+        manager.create_order(order_id, "u", "doc_premium_1", "Premium", 50000.0, user_email="bench@mail.test")
+
+    settled_at, seen_at, requests = {}, {}, [0]
+    before = checkouts()
+    pool = [threading.Thread(target=client, args=(app.test_client(), order_id, seen_at, requests))
+            for order_id in orders]
+    for thread in pool:
+        thread.start()
+    settle(orders, seconds, settled_at, rng)
+    for thread in pool:
+        thread.join()
+
+    delays = sorted((seen_at[o] - settled_at[o]) * 1000 for o in orders)
+    print(f"  {mode:<9} requests {requests[0]:6}   db checkouts {checkouts() - before:6}   "
+          f"seen after p50 {statistics.median(delays):6.0f} ms  p95 {delays[int(len(delays) * 0.95) - 1]:6.0f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    init_payment_db(DATABASE_PATH)
+    # Satu thread per klien, seperti worker gthread / gateway dengan thread sebanyak itu
+    status_bus.set_threads(args.clients + STATUS_BUS_RESERVED_THREADS)
+    app = Flask(__name__, template_folder=os.path.join(ROOT, "templates"))
+    app.register_blueprint(payment_routes.payment_bp)
+    print(f"{args.clients} clients waiting, orders completed by another connection over {args.seconds:.0f} s")
+    rng = random.Random(1)
+    run("poll", poll_client, app, args.clients, args.seconds, rng)
+    run("longpoll", longpoll_client, app, args.clients, args.seconds, rng)
+    run("sse", sse_client, app, args.clients, args.seconds, rng)
+    print(f"  status bus {status_bus.stats()}")
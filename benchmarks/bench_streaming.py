@@ -0,0 +1,80 @@
+"""
+Benchmark: CPU cost per GB of the download proxy streaming loop
+
+Compares the old path (requests' iter_content with 8 KiB chunks) with
+streaming.iter_chunks (fixed 256 KiB and adaptive 256 KiB-1 MiB) over an
+in-memory upstream, so only the Python-side cost is measured.
+
+Run: python benchmarks/bench_streaming.py [--gb 1]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from urllib3.response import HTTPResponse
+
+from streaming import CHUNK_MAX, CHUNK_MIN, iter_chunks
+
+
+class NullStream(io.RawIOBase):
+    """Upstream body of `size` bytes that costs (almost) nothing to produce"""
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Isi buffer tidak disentuh: yang diukur hanya overhead Python, bukan memcpy
+        n = min(len(buffer), self.remaining)
+        self.remaining -= n
+        return n
+
+
+def make_response(size):
+    raw = HTTPResponse(body=io.BufferedReader(NullStream(size), buffer_size=CHUNK_MAX),
+                       preload_content=False, decode_content=True)
+    resp = requests.Response()
+    resp.raw = raw
+    resp.status_code = 200
+    return resp
+
+
+def consume(chunks):
+    """Stand-in for the WSGI server writing each chunk to the socket"""
+    total = 0
+    writes = 0
+    for chunk in chunks:
+        total += len(chunk)
+        writes += 1
+    return total, writes
+
+
+def run(label, size, make_chunks):
+    resp = make_response(size)
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    total, writes = consume(make_chunks(resp))
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    gb = total / 1024 ** 3
+    print(f"{label:<28} {cpu / gb:8.3f} s CPU/GB  {wall / gb:8.3f} s wall/GB  {writes:>9} writes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gb", type=float, default=1.0, help="bytes to stream, in GiB")
+    args = parser.parse_args()
+    size = int(args.gb * 1024 ** 3)
+
+    print(f"Streaming {args.gb} GiB per run (chunk min {CHUNK_MIN}, max {CHUNK_MAX})")
+    run("old: iter_content(8192)", size, lambda r: r.iter_content(chunk_size=8192))
+    run("new: fixed", size, lambda r: iter_chunks(r.raw, mode='fixed'))
+    run("new: adaptive", size, lambda r: iter_chunks(r.raw, mode='adaptive'))
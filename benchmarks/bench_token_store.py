@@ -0,0 +1,123 @@
+"""
+Benchmark: DANA access token, per-worker cache vs the shared token store
+
+Starts fake_dana with a short token lifetime, forks P worker processes
+with T threads each calling DANAPaymentGateway.get_access_token() in a
+loop for D seconds, then one more "restarted" worker. Compares
+  - per-worker: the original cache on the gateway instance (no lock, a
+    fresh fetch per process and per racing thread after expiry)
+  - shared: token_store.SharedToken in a SQLite row (early refresh, one
+    lease holder across processes)
+and reports token fetches seen by the fake, the slowest get_access_token
+call and the fetches made by the restarted worker.
+
+Run: python benchmarks/bench_token_store.py [--workers 4] [--threads 8] [--seconds 6]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dana_payment import DANAPaymentGateway
+from fake_dana import FakeDana, serve
+from token_store import SharedToken
+
+
+class PerWorkerToken:
+    """The original gateway cache: instance attributes, refresh 60 s early"""
+
+    def __init__(self, fetch, margin: float):
+        self.fetch = fetch
+        self.margin = margin
+        self.token = None
+        self.expiry = None
+
+    def get_token(self) -> str:
+        if self.token and self.expiry and time.time() < self.expiry:
+            return self.token
+        self.token, expires_at = self.fetch()
+        self.expiry = expires_at - self.margin
+        return self.token
+
+
+def make_gateway(mode: str, base_url: str, db_path: str, margin: float) -> DANAPaymentGateway:
+    gateway = DANAPaymentGateway()
+    gateway.base_url = base_url
+    gateway.http.base_url = base_url
+    if mode == "shared":
+        gateway.token = SharedToken("dana:bench", gateway._fetch_access_token, margin=margin, db_path=db_path)
+    else:
+        gateway.token = PerWorkerToken(gateway._fetch_access_token, margin)
+    return gateway
+
+
+def worker(mode: str, base_url: str, db_path: str, margin: float, threads: int, seconds: float, out):
+    gateway = make_gateway(mode, base_url, db_path, margin)
+    slowest, failures, lock = [0.0], [0], threading.Lock()
+    stop_at = time.time() + seconds
+
+    def loop():
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            token = gateway.get_access_token()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                slowest[0] = max(slowest[0], elapsed)
+                failures[0] += token is None
+            time.sleep(0.001)
+
+    pool = [threading.Thread(target=loop) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    out.put((slowest[0], failures[0]))
+
+
+def run(mode: str, workers: int, threads: int, seconds: float, ttl: int):
+    fake = FakeDana(latency=0.05, token_ttl=ttl)
+    server = serve(fake)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    db_path = os.path.join(tempfile.mkdtemp(), "tokens.db")
+    margin = ttl / 4
+    out = multiprocessing.Queue()
+
+    procs = [multiprocessing.Process(target=worker, args=(mode, base_url, db_path, margin, threads, seconds, out))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    results = [out.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    fetches = fake.calls.get("token", 0)
+
+    # Worker baru (restart) selagi token terakhir masih berlaku
+    restart = multiprocessing.Process(target=worker, args=(mode, base_url, db_path, margin, 1, 0.2, out))
+    restart.start()
+    out.get()
+    restart.join()
+    server.shutdown()
+
+    print(f"  {mode:<11} token fetches {fetches:4}   slowest get {max(r[0] for r in results):7.1f} ms   "
+          f"failed gets {sum(r[1] for r in results)}   fetches after restart "
+          f"{fake.calls.get('token', 0) - fetches}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=6)
+    parser.add_argument("--ttl", type=int, default=2, help="token lifetime from the fake (s)")
+    args = parser.parse_args()
+    multiprocessing.set_start_method("fork")
+    print(f"{args.workers} workers x {args.threads} threads for {args.seconds:.0f} s, "
+          f"token lifetime {args.ttl} s, 50 ms token endpoint")
+    run("per-worker", args.workers, args.threads, args.seconds, args.ttl)
+    run("shared", args.workers, args.threads, args.seconds, args.ttl)
@@ -0,0 +1,128 @@
+"""
+Benchmark: DANA webhook bursts, inline handling vs the webhook queue
+
+N orders, then a burst of notifications from T threads where a share are
+provider replays (same event id). Compares the time each request holds
+the handler (ack latency p50/p95) and wall time for
+  - inline: log_webhook + get_order + update_order_status (the original
+    handler, three connections/commits per request, replays re-applied)
+  - queued: webhook_queue.enqueue (one insert, replays dropped), followed
+    by WebhookWorker.drain() applying the batch
+and counts order status writes (each replay would be one more).
+
+Run: python benchmarks/bench_webhooks.py [--events 5000] [--threads 16]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from order_manager import OrderManager, init_payment_db
+from webhook_queue import STATUS_MAP, WebhookWorker, enqueue
+
+
+def make_db(orders: int) -> str:
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    init_payment_db(path)
+    manager = OrderManager(path)
+    for i in range(orders):
+        manager.create_order(f"ord_{i}", f"user_{i}", "doc_premium_1", "Premium", 50000.0,
+                             user_email=f"user{i % 500}@mail.test")
+    # Hitung setiap UPDATE status pada orders
+    with db.connection(path) as conn:
+        conn.execute("CREATE TABLE status_writes (n INTEGER)")
+        conn.execute("""
+        CREATE TRIGGER count_status_writes AFTER UPDATE OF status ON orders
+        BEGIN INSERT INTO status_writes VALUES (1); END
+        """)
+    return path
+
+
+def make_events(orders: int, count: int, replay_share: float, rng: random.Random):
+    events = []
+    for i in range(count):
+        if events and rng.random() < replay_share:
+            events.append(rng.choice(events))
+            continue
+        events.append({"eventId": f"ev_{i}", "orderId": f"ord_{rng.randrange(orders)}",
+                       "event": "PAYMENT", "status": rng.choice(["SETTLED", "COMPLETED", "EXPIRED"])})
+    return events
+
+
+def inline_handler(manager: OrderManager):
+    def handle(data):
+        manager.log_webhook(str(uuid.uuid4()), data["orderId"], data["event"], json.dumps(data))
+        if manager.get_order(data["orderId"]):
+            manager.update_order_status(data["orderId"], STATUS_MAP[data["status"]])
+    return handle
+
+
+def queued_handler(path: str):
+    def handle(data):
+        enqueue(data["eventId"], data["orderId"], data["event"], json.dumps(data), db_path=path)
+    return handle
+
+
+def burst(handle, events, threads: int):
+    samples, lock = [], threading.Lock()
+    chunks = [events[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        local = []
+        for data in chunk:
+            started = time.perf_counter()
+            handle(data)
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    samples.sort()
+    return time.perf_counter() - started, statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def status_writes(path: str) -> int:
+    with db.connection(path, readonly=True) as conn:
+        return conn.execute("SELECT COUNT(*) FROM status_writes").fetchone()[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--replays", type=float, default=0.2)
+    args = parser.parse_args()
+    events = make_events(args.orders, args.events, args.replays, random.Random(1))
+    unique = len({e["eventId"] for e in events})
+    print(f"{len(events)} notifications ({unique} unique), {args.threads} threads")
+
+    path = make_db(args.orders)
+    wall, p50, p95 = burst(inline_handler(OrderManager(path)), events, args.threads)
+    print(f"  inline   wall {wall:6.2f} s   ack p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   "
+          f"status writes {status_writes(path)}")
+
+    path = make_db(args.orders)
+    wall, p50, p95 = burst(queued_handler(path), events, args.threads)
+    worker = WebhookWorker(db_path=path, orders=OrderManager(path), enabled=False)
+    started = time.perf_counter()
+    worker.drain()
+    drained = time.perf_counter() - started
+    print(f"  queued   wall {wall:6.2f} s   ack p50 {p50:7.2f} ms   p95 {p95:7.2f} ms   "
+          f"status writes {status_writes(path)}   drain {drained:.2f} s "
+          f"({worker.stats()['batches']} batches)")
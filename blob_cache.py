@@ -0,0 +1,483 @@
+"""
+Blob Cache
+Local on-disk LRU cache for files proxied from Google Drive
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock di dalam proses
+    fcntl = None
+
+import db
+from config import BASE_DIR, DATABASE_PATH
+
+# === Konfigurasi cache (bisa diatur lewat environment) ===
+BLOB_CACHE_DIR = os.environ.get('BLOB_CACHE_DIR', os.path.join(BASE_DIR, 'blob_cache'))
+BLOB_CACHE_MAX_BYTES = int(os.environ.get('BLOB_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# File yang lebih besar dari ini tidak di-cache, langsung di-proxy dari Drive
+BLOB_CACHE_MAX_OBJECT_BYTES = int(os.environ.get('BLOB_CACHE_MAX_OBJECT_BYTES', 256 * 1024 ** 2))
+BLOB_CACHE_ENABLED = os.environ.get('BLOB_CACHE_ENABLED', 'true').lower() == 'true'
+# Berapa lama request menunggu worker lain yang sedang mengisi file yang sama
+FILL_WAIT_TIMEOUT = float(os.environ.get('BLOB_CACHE_FILL_WAIT_TIMEOUT', 60))
+# Maksimum pengisian cache di background per proses (miss pada request Range)
+BACKGROUND_FILLS = int(os.environ.get('BLOB_CACHE_BACKGROUND_FILLS', 2))
+
+
+def create_download_stats_table(conn: sqlite3.Connection):
+    """Per-file download counter used to pick files to prewarm"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS download_stats (
+        file_id TEXT PRIMARY KEY,
+        downloads INTEGER NOT NULL DEFAULT 0,
+        last_download TIMESTAMP
+    )
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_download_stats_downloads
+    ON download_stats(downloads DESC)
+    """)
+
+
+def record_download(file_id: str, db_path: str = DATABASE_PATH):
+    """Count one download of a file (errors are ignored, this is best-effort)"""
+    try:
+        with db.connection(db_path) as conn:
+            conn.execute("""
+            INSERT INTO download_stats (file_id, downloads, last_download)
+            VALUES (?, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT(file_id) DO UPDATE
+            SET downloads = downloads + 1, last_download = CURRENT_TIMESTAMP
+            """, (file_id,))
+    except Exception as e:
+        print(f"Error recording download: {e}")
+
+
+class BlobCache:
+    """Content cache keyed by Drive file id + modified_time.
+
+    Entries are plain files, so hits can be served with send_file (sendfile
+    and Range support). Recency is the file mtime, bumped on every hit;
+    when the total size exceeds `max_bytes` the least recently used entries
+    are deleted. Writes go to a temp file that is renamed into place, under
+    a per-entry lock file so only one thread or gunicorn worker fetches a
+    given file from Drive. Requests never wait for a fill: a full download
+    is copied into the cache while it streams to the client (tee), and a
+    Range request is proxied while the entry fills in the background.
+    """
+
+    def __init__(self, directory: str = BLOB_CACHE_DIR, max_bytes: int = BLOB_CACHE_MAX_BYTES,
+                 max_object_bytes: int = BLOB_CACHE_MAX_OBJECT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        # key -> [lock, pemakai]; entri dibuang saat tidak ada yang memakainya
+        self._locks: Dict[str, list] = {}
+        self._locks_guard = threading.Lock()
+        self._background = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "fills": 0,
+            "background_fills": 0,
+            "aborted_fills": 0,
+            "fill_errors": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+            "bytes_written": 0,
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def key(self, file_id: str, modified_time: Optional[str]) -> str:
+        return hashlib.sha1(f"{file_id}:{modified_time or ''}".encode()).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.blob")
+
+    def cacheable(self, size: Optional[int]) -> bool:
+        return bool(size) and int(size) <= self.max_object_bytes
+
+    def lookup(self, file_id: str, modified_time: Optional[str]) -> Optional[str]:
+        """Return the cached file path (and mark it recently used), or None"""
+        path = self.path_for(self.key(file_id, modified_time))
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+
+    def _thread_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _drop_thread_lock(self, key: str):
+        with self._locks_guard:
+            entry = self._locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def fill(self, file_id: str, modified_time: Optional[str],
+             fetch: Callable[[object], None]) -> Optional[str]:
+        """Fetch a missing entry once and return its path.
+
+        `fetch(fileobj)` must write the complete file body. Blocks while
+        another thread or worker fills the same entry. Returns None if the
+        fetch failed or the fill lock was held for longer than
+        FILL_WAIT_TIMEOUT. Used by prewarm and background fills; requests
+        never wait on this (see tee and fill_in_background).
+        """
+        key = self.key(file_id, modified_time)
+        path = self.path_for(key)
+        locks = self._acquire(key, path, wait=True)
+        if locks is None:
+            return None
+        if os.path.exists(path):
+            # Worker lain sudah mengisi entry ini selama kita menunggu
+            self._release(*locks)
+            self._count("coalesced")
+            return path
+
+        try:
+            entry = CacheFill(self, path, locks)
+        except OSError as e:
+            print(f"Error filling blob cache: {e}")
+            self._release(*locks)
+            return None
+        try:
+            fetch(entry)
+        except Exception as e:
+            print(f"Error filling blob cache: {e}")
+            self._count("fill_errors")
+            entry.abort()
+            return None
+        return entry.commit()
+
+    def begin_fill(self, file_id: str, modified_time: Optional[str]) -> Optional["CacheFill"]:
+        """Start writing an entry without waiting: None if it is already
+        cached or another thread/worker is filling it right now"""
+        key = self.key(file_id, modified_time)
+        path = self.path_for(key)
+        try:
+            locks = self._acquire(key, path, wait=False)
+        except OSError as e:
+            print(f"Error filling blob cache: {e}")
+            return None
+        if locks is None:
+            return None
+        if os.path.exists(path):
+            self._release(*locks)
+            return None
+        try:
+            return CacheFill(self, path, locks)
+        except OSError as e:
+            print(f"Error filling blob cache: {e}")
+            self._release(*locks)
+            return None
+
+    def tee(self, file_id: str, modified_time: Optional[str], chunks: Iterator[bytes],
+            expected_size: Optional[int] = None) -> Iterator[bytes]:
+        """Pass a full-body upstream stream through while copying it into
+        the cache.
+
+        The client gets every chunk as soon as it arrives; the entry is only
+        committed if the stream ran to the end (and matches expected_size).
+        The fill lock is taken when iteration starts, so a response that is
+        never sent holds no lock.
+        """
+        entry = self.begin_fill(file_id, modified_time)
+        if entry is None:
+            yield from chunks
+            return
+
+        completed = False
+        try:
+            for chunk in chunks:
+                entry = self._tee_write(entry, chunk)
+                yield chunk
+            completed = True
+        finally:
+            if entry is not None:
+                if completed:
+                    entry.commit(expected_size)
+                else:
+                    # Klien memutus download: file belum lengkap, jangan disimpan
+                    self._count("aborted_fills")
+                    entry.abort()
+
+    def _tee_write(self, entry: Optional["CacheFill"], chunk: bytes) -> Optional["CacheFill"]:
+        # Gagal menulis cache (disk penuh) tidak boleh memutus download
+        if entry is None:
+            return None
+        try:
+            entry.write(chunk)
+            return entry
+        except OSError as e:
+            print(f"Error filling blob cache: {e}")
+            self._count("fill_errors")
+            entry.abort()
+            return None
+
+    def fill_in_background(self, file_id: str, modified_time: Optional[str],
+                           fetch: Callable[[object], None]) -> bool:
+        """Run fill() on a daemon thread, at most BACKGROUND_FILLS per process.
+
+        Used for Range requests on a miss: the request is proxied as usual
+        and later requests are served from the cache. Returns False if the
+        entry is already being filled here or the limit is reached.
+        """
+        key = self.key(file_id, modified_time)
+        with self._locks_guard:
+            if key in self._background or len(self._background) >= BACKGROUND_FILLS:
+                return False
+            self._background.add(key)
+
+        def run():
+            try:
+                self.fill(file_id, modified_time, fetch)
+            finally:
+                with self._locks_guard:
+                    self._background.discard(key)
+
+        self._count("background_fills")
+        threading.Thread(target=run, name=f"blob-fill-{key[:8]}", daemon=True).start()
+        return True
+
+    def _acquire(self, key: str, path: str, wait: bool) -> Optional[tuple]:
+        """Take the per-process and cross-worker fill locks for one entry"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        thread_lock = self._thread_lock(key)
+        if wait:
+            acquired = thread_lock.acquire(timeout=FILL_WAIT_TIMEOUT)
+        else:
+            acquired = thread_lock.acquire(blocking=False)
+        if not acquired:
+            self._drop_thread_lock(key)
+            return None
+        lock_path = f"{path}.lock"
+        while True:
+            try:
+                lock_file = open(lock_path, "a+b")
+            except OSError:
+                thread_lock.release()
+                self._drop_thread_lock(key)
+                raise
+            if not self._flock(lock_file, wait):
+                self._release(key, thread_lock, lock_file)
+                return None
+            # evict() menghapus lock file sambil memegangnya; lock pada file
+            # yang sudah dihapus tidak melindungi apa-apa, buka ulang
+            if self._is_current(lock_file, lock_path):
+                return key, thread_lock, lock_file
+            lock_file.close()
+
+    def _is_current(self, lock_file, lock_path: str) -> bool:
+        """True if `lock_file` is still the file at `lock_path`"""
+        try:
+            current = os.stat(lock_path)
+        except FileNotFoundError:
+            return False
+        opened = os.fstat(lock_file.fileno())
+        return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+    def _release(self, key: str, thread_lock: threading.Lock, lock_file):
+        lock_file.close()
+        thread_lock.release()
+        self._drop_thread_lock(key)
+
+    def _flock(self, lock_file, wait: bool = True) -> bool:
+        if fcntl is None:
+            return True
+        deadline = time.monotonic() + FILL_WAIT_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if not wait or time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".blob"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        """Delete least recently used entries until usage fits max_bytes"""
+        entries = self._entries()
+        total = sum(size for _mtime, size, _path in entries)
+        evicted = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # Hapus hanya sambil memegang lock entry (yang sedang diisi dilewati),
+            # supaya tidak ada pengisi yang memegang lock file yang sudah dihapus
+            locks = self._acquire(os.path.basename(path)[:-len(".blob")], path, wait=False)
+            if locks is None:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            finally:
+                try:
+                    os.remove(f"{path}.lock")
+                except OSError:
+                    pass
+                self._release(*locks)
+            total -= size
+            evicted += 1
+            self._count("evictions")
+            self._count("evicted_bytes", size)
+        return evicted
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0
+        entries = self._entries()
+        stats.update(
+            entries=len(entries),
+            used_bytes=sum(size for _mtime, size, _path in entries),
+            max_bytes=self.max_bytes,
+            directory=self.directory,
+        )
+        return stats
+
+
+class CacheFill:
+    """One cache entry being written: a temp file plus the fill locks.
+
+    write() the body, then commit() to rename it into place or abort() to
+    drop it; either releases the locks.
+    """
+
+    def __init__(self, cache: BlobCache, path: str, locks: tuple):
+        self.cache = cache
+        self.path = path
+        self.size = 0
+        self._locks = locks
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, expected_size: Optional[int] = None) -> Optional[str]:
+        """Move the complete file into the cache; None if it is incomplete"""
+        try:
+            if expected_size is not None and self.size != int(expected_size):
+                raise IOError(f"got {self.size} of {expected_size} bytes")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.tmp_path, self.path)
+        except Exception as e:
+            print(f"Error filling blob cache: {e}")
+            self.cache._count("fill_errors")
+            self.abort()
+            return None
+        finally:
+            self._unlock()
+
+        self.cache._count("fills")
+        self.cache._count("bytes_written", self.size)
+        self.cache.evict()
+        return self.path
+
+    def abort(self):
+        if self._locks is None:
+            return
+        try:
+            self._file.close()
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+        self._unlock()
+
+    def _unlock(self):
+        if self._locks is not None:
+            locks, self._locks = self._locks, None
+            self.cache._release(*locks)
+
+
+blob_cache = BlobCache()
+
+
+def prewarm(top: int = 50, db_path: str = DATABASE_PATH) -> Dict:
+    """Fill the cache with the `top` most downloaded files"""
+    from drive_client import download_to_file
+
+    with db.connection(db_path, readonly=True) as conn:
+        rows = conn.execute("""
+        SELECT f.id, f.name, f.size, f.modified_time
+        FROM download_stats d JOIN files f ON f.id = d.file_id
+        WHERE f.is_directory = 0
+        ORDER BY d.downloads DESC
+        LIMIT ?
+        """, (top,)).fetchall()
+
+    result = {"cached": 0, "already_cached": 0, "skipped": 0, "failed": 0}
+    for row in rows:
+        if not blob_cache.cacheable(row['size']):
+            result["skipped"] += 1
+            continue
+        if blob_cache.lookup(row['id'], row['modified_time']):
+            result["already_cached"] += 1
+            continue
+        path = blob_cache.fill(row['id'], row['modified_time'],
+                               lambda f, file_id=row['id']: download_to_file(file_id, f))
+        if path:
+            result["cached"] += 1
+            print(f"✅ {row['name']}")
+        else:
+            result["failed"] += 1
+            print(f"❌ {row['name']}")
+    return result
+
+
+if __name__ == '__main__':
+    # python blob_cache.py prewarm --top 50   -> isi cache dengan file terpopuler
+    # python blob_cache.py stats              -> tampilkan statistik cache
+    # python blob_cache.py evict              -> paksa eviction ke batas ukuran
+    parser = argparse.ArgumentParser(description="Drive blob cache tools")
+    parser.add_argument("command", choices=["prewarm", "stats", "evict"])
+    parser.add_argument("--top", type=int, default=50, help="number of files to prewarm")
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        print(prewarm(args.top))
+    elif args.command == "evict":
+        print(f"Evicted {blob_cache.evict()} entries")
+    print(blob_cache.stats())
@@ -0,0 +1,444 @@
+"""
+Catalogue Generation & Folder Statistics
+Version stamp for the `files` table, materialized per-folder counts/sizes
+and materialized paths (breadcrumbs, subtree queries)
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+# Batas kedalaman saat menelusuri parent_id (mencegah loop jika data rusak)
+MAX_TREE_DEPTH = 64
+
+# Jumlah item per halaman folder (render pertama dan setiap "muat lagi")
+FOLDER_PAGE_SIZE = int(os.environ.get('FOLDER_PAGE_SIZE', 100))
+
+# Kolom yang ditampilkan di kartu folder; semuanya ada di idx_files_parent_keyset
+LISTING_COLUMNS = "id, name, mime_type, size, modified_time, is_directory"
+
+# Statement di route yang sering dipanggil; query_plans.py memeriksa semuanya
+# (tidak boleh full scan pada `files`), jadi selalu pakai konstanta ini
+GENERATION_SQL = "SELECT value FROM catalogue_meta WHERE key = 'generation'"
+FOLDER_PATH_SQL = "SELECT path FROM files WHERE id = ?"
+# {ids}: satu "?" per id di path
+BREADCRUMBS_SQL = "SELECT id, name FROM files WHERE id IN ({ids})"
+SUBTREE_STATS_SQL = """
+SELECT
+    COALESCE(SUM(CASE WHEN is_directory THEN 1 ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN is_directory THEN 0 ELSE 1 END), 0),
+    COALESCE(SUM(CASE WHEN is_directory THEN 0 ELSE COALESCE(size, 0) END), 0)
+FROM files WHERE path > ? AND path < ?
+"""
+FOLDER_PAGE_SQL = f"""
+SELECT {LISTING_COLUMNS} FROM files
+WHERE parent_id = ? AND is_directory = ?
+ORDER BY name, id LIMIT ?
+"""
+FOLDER_PAGE_AFTER_SQL = f"""
+SELECT {LISTING_COLUMNS} FROM files
+WHERE parent_id = ? AND is_directory = ? AND (name, id) > (?, ?)
+ORDER BY name, id LIMIT ?
+"""
+FILE_SQL = "SELECT * FROM files WHERE id = ? AND is_directory = 0"
+SUBFOLDERS_SQL = "SELECT id, name FROM files WHERE parent_id = ? AND is_directory = 1 ORDER BY name"
+
+
+def create_catalogue_tables(conn: sqlite3.Connection):
+    """Create catalogue_meta/folder_stats and the generation triggers.
+
+    Every insert, update or delete on `files` bumps the `generation` counter,
+    so caches only need a primary-key lookup to know whether they are stale.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS catalogue_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO catalogue_meta (key, value) VALUES ('generation', 1)")
+    conn.execute("INSERT OR IGNORE INTO catalogue_meta (key, value) VALUES ('folder_stats_generation', 0)")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS folder_stats (
+        folder_id TEXT PRIMARY KEY,
+        direct_folders INTEGER NOT NULL DEFAULT 0,
+        direct_files INTEGER NOT NULL DEFAULT 0,
+        direct_bytes INTEGER NOT NULL DEFAULT 0,
+        recursive_count INTEGER NOT NULL DEFAULT 0,
+        total_bytes INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    for event, name in (("INSERT", "ai"), ("DELETE", "ad"), ("UPDATE", "au")):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS files_generation_{name} AFTER {event} ON files BEGIN
+            UPDATE catalogue_meta SET value = value + 1 WHERE key = 'generation';
+        END
+        """)
+
+
+def create_sync_state_table(conn: sqlite3.Connection):
+    """Key/value state of drive_sync (Changes API page token, timestamps)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS drive_sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def get_generation(conn: sqlite3.Connection) -> int:
+    """Current catalogue generation (bumped on every change to `files`)"""
+    row = conn.execute(GENERATION_SQL).fetchone()
+    return row[0] if row else 0
+
+
+def stamp_path(db_path: str) -> str:
+    """File next to the database that mirrors the catalogue generation"""
+    return f"{db_path}.generation"
+
+
+def write_generation_stamp(db_path: str) -> int:
+    """Copy the current generation into the stamp file (atomic rename).
+
+    Writers of `files` (drive_sync) call this after committing, so readers
+    such as the response cache learn about changes from a stat() call
+    instead of a database query.
+    """
+    with db.connection(db_path, readonly=True) as conn:
+        generation = get_generation(conn)
+    path = stamp_path(db_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(generation))
+    os.replace(tmp_path, path)
+    return generation
+
+
+def read_generation_stamp(db_path: str) -> Optional[int]:
+    try:
+        with open(stamp_path(db_path)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class GenerationStamp:
+    """Catalogue generation read from the stamp file.
+
+    current() costs one stat() while the stamp is unchanged; the file is
+    re-read only when its mtime/size changes, and created from the
+    database if it is missing.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._stat: Optional[Tuple[int, int]] = None
+        self.generation = 0
+
+    def current(self) -> int:
+        path = stamp_path(self.db_path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            # Belum ada stamp (database baru / sync lama): buat dari database
+            try:
+                write_generation_stamp(self.db_path)
+                st = os.stat(path)
+            except Exception as e:
+                print(f"Error writing catalogue stamp: {e}")
+                return self.generation
+
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat != self._stat:
+            generation = read_generation_stamp(self.db_path)
+            if generation is not None:
+                self.generation, self._stat = generation, stat
+        return self.generation
+
+
+def rebuild_folder_stats(conn: sqlite3.Connection):
+    """Recompute folder_stats from `files` (runs inside the caller's transaction)"""
+    conn.execute("DELETE FROM folder_stats")
+    conn.execute(f"""
+    INSERT INTO folder_stats
+        (folder_id, direct_folders, direct_files, direct_bytes, recursive_count, total_bytes)
+    WITH RECURSIVE ancestry(size, ancestor, depth) AS (
+        -- Semua keturunan per folder (tiap item dihitung sekali per leluhurnya)
+        SELECT CASE WHEN is_directory THEN 0 ELSE COALESCE(size, 0) END, parent_id, 1
+        FROM files WHERE parent_id IS NOT NULL
+        UNION ALL
+        SELECT a.size, f.parent_id, a.depth + 1
+        FROM ancestry a JOIN files f ON f.id = a.ancestor
+        WHERE f.parent_id IS NOT NULL AND a.depth < {MAX_TREE_DEPTH}
+    ),
+    totals AS (
+        SELECT ancestor, COUNT(*) AS n, SUM(size) AS bytes
+        FROM ancestry GROUP BY ancestor
+    ),
+    direct AS (
+        -- Anak langsung per folder
+        SELECT
+            parent_id,
+            SUM(CASE WHEN is_directory THEN 1 ELSE 0 END) AS folders,
+            SUM(CASE WHEN is_directory THEN 0 ELSE 1 END) AS files,
+            SUM(CASE WHEN is_directory THEN 0 ELSE COALESCE(size, 0) END) AS bytes
+        FROM files
+        WHERE parent_id IS NOT NULL
+        GROUP BY parent_id
+    )
+    SELECT
+        totals.ancestor,
+        COALESCE(direct.folders, 0),
+        COALESCE(direct.files, 0),
+        COALESCE(direct.bytes, 0),
+        totals.n,
+        totals.bytes
+    FROM totals LEFT JOIN direct ON direct.parent_id = totals.ancestor
+    """)
+
+
+def create_listing_index(conn: sqlite3.Connection):
+    """Covering index for keyset-paginated folder listings.
+
+    Ordered like the listing (folders first, then name, id as tie-breaker)
+    and carrying every listed column, so a page is one index range read
+    with no lookups into `files`. It replaces idx_files_parent_listing,
+    which is a prefix of it.
+    """
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_files_parent_keyset
+    ON files(parent_id, is_directory DESC, name, id, size, mime_type, modified_time)
+    """)
+    conn.execute("DROP INDEX IF EXISTS idx_files_parent_listing")
+
+
+def encode_cursor(row) -> str:
+    """Opaque cursor pointing just after `row` in listing order"""
+    key = [int(row['is_directory']), row['name'], row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[int, str, str]]:
+    """Inverse of encode_cursor; None if the cursor is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        is_directory, name, file_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(bool(is_directory)), str(name), str(file_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def list_folder_page(conn: sqlite3.Connection, folder_id: str, cursor: Optional[str] = None,
+                     limit: int = FOLDER_PAGE_SIZE) -> Tuple[List[sqlite3.Row], Optional[str]]:
+    """One page of a folder's children, folders first then by name.
+
+    Keyset pagination on (is_directory, name, id): each page seeks
+    straight to the cursor instead of skipping OFFSET rows, so page N
+    costs the same as page 1 regardless of folder size. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    is_directory, name, file_id = after if after else (1, None, None)
+
+    rows: List[sqlite3.Row] = []
+    # Folder (is_directory = 1) lalu file (0); masing-masing satu range scan di index
+    for group in (1, 0):
+        if group > is_directory:
+            continue
+        want = limit + 1 - len(rows)
+        if want <= 0:
+            break
+        if group == is_directory and name is not None:
+            rows += conn.execute(FOLDER_PAGE_AFTER_SQL, (folder_id, group, name, file_id, want)).fetchall()
+        else:
+            rows += conn.execute(FOLDER_PAGE_SQL, (folder_id, group, want)).fetchall()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+# === Materialized path ===
+# files.path = id leluhur dari folder root sampai item itu sendiri: "/<root>/<folder>/<id>/".
+# Isi sebuah folder (berapa pun dalamnya) = rentang path > "/../<folder>/" dan < "/../<folder>0"
+# ('0' adalah karakter setelah '/'), satu range scan di idx_files_path.
+
+def create_path_column(conn: sqlite3.Connection):
+    """Add files.path with its index and fill it"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+    if 'path' not in columns:
+        conn.execute("ALTER TABLE files ADD COLUMN path TEXT")
+    # is_directory & size ikut di index supaya statistik subtree tidak membaca tabel
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_path ON files(path, is_directory, size)")
+    rebuild_paths(conn)
+
+
+def rebuild_paths(conn: sqlite3.Connection) -> int:
+    """Recompute every path from the top-level rows down (full sync,
+    migration). Runs inside the caller's transaction; returns rows changed."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS path_rebuild (id TEXT PRIMARY KEY, path TEXT)")
+    conn.execute("DELETE FROM temp.path_rebuild")
+    conn.execute(f"""
+    INSERT OR REPLACE INTO temp.path_rebuild (id, path)
+    WITH RECURSIVE tree(id, path, depth) AS (
+        -- Folder root tidak disimpan di `files`: anaknya menjadi puncak pohon
+        SELECT id, '/' || COALESCE(parent_id || '/', '') || id || '/', 1
+        FROM files
+        WHERE parent_id IS NULL OR parent_id NOT IN (SELECT id FROM files)
+        UNION ALL
+        SELECT f.id, t.path || f.id || '/', t.depth + 1
+        FROM tree t JOIN files f ON f.parent_id = t.id
+        WHERE t.depth < {MAX_TREE_DEPTH}
+    )
+    SELECT id, path FROM tree
+    """)
+    changed = conn.execute("""
+    UPDATE files SET path = (SELECT p.path FROM temp.path_rebuild p WHERE p.id = files.id)
+    WHERE id IN (
+        SELECT p.id FROM temp.path_rebuild p JOIN files f ON f.id = p.id WHERE f.path IS NOT p.path
+    )
+    """).rowcount
+    conn.execute("DROP TABLE temp.path_rebuild")
+    return changed
+
+
+def update_paths(conn: sqlite3.Connection, file_ids: List[str]) -> int:
+    """Fix paths after rows were inserted or moved (incremental sync).
+
+    Rows are handled parents-first; when a folder's path changes, its
+    whole subtree is rewritten with one prefix replace over the path
+    range. Runs inside the caller's transaction; returns rows changed.
+    """
+    parents: Dict[str, Optional[str]] = {}
+    ids = list(dict.fromkeys(file_ids))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        parents.update(conn.execute(
+            f"SELECT id, parent_id FROM files WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall())
+
+    depths: Dict[str, int] = {}
+
+    def depth(file_id: str) -> int:
+        # Kedalaman di antara baris yang berubah saja: induk diproses sebelum anaknya
+        if file_id not in depths:
+            depths[file_id] = 0  # cegah siklus
+            parent_id = parents.get(file_id)
+            depths[file_id] = depth(parent_id) + 1 if parent_id in parents else 0
+        return depths[file_id]
+
+    changed = 0
+    for file_id in sorted(parents, key=depth):
+        parent_id = parents[file_id]
+        row = conn.execute("SELECT path FROM files WHERE id = ?", (parent_id,)).fetchone()
+        parent_path = row[0] if row and row[0] else f"/{parent_id}/" if parent_id else "/"
+        path = f"{parent_path}{file_id}/"
+        old_path = conn.execute("SELECT path FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+        if old_path == path:
+            continue
+        conn.execute("UPDATE files SET path = ? WHERE id = ?", (path, file_id))
+        changed += 1
+        # Baris baru: anak yang tersimpan lebih dulu punya path "/<id>/..."
+        old_path = old_path or f"/{file_id}/"
+        changed += conn.execute(
+            "UPDATE files SET path = ? || substr(path, ?) WHERE path > ? AND path < ?",
+            (path, len(old_path) + 1, *subtree_range(old_path))
+        ).rowcount
+    return changed
+
+
+def subtree_range(path: str) -> Tuple[str, str]:
+    """(low, high) bounds, both exclusive, of the paths below `path`"""
+    return path, path[:-1] + '0'
+
+
+def folder_path(conn: sqlite3.Connection, folder_id: str) -> str:
+    """Path of a folder; root folders (not stored in `files`) are "/<id>/" """
+    row = conn.execute(FOLDER_PATH_SQL, (folder_id,)).fetchone()
+    return row[0] if row and row[0] else f"/{folder_id}/"
+
+
+def breadcrumbs(conn: sqlite3.Connection, path: str,
+                root_names: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """[{id, name}] from the root folder down to the item at `path`, in one
+    primary-key lookup. Names of root folders come from `root_names`."""
+    ids = [part for part in path.strip('/').split('/') if part]
+    if not ids:
+        return []
+    names = dict(conn.execute(BREADCRUMBS_SQL.format(ids=','.join('?' * len(ids))), ids).fetchall())
+    names.update({i: n for i, n in (root_names or {}).items() if i in ids and i not in names})
+    return [{"id": i, "name": names.get(i, "Folder")} for i in ids]
+
+
+def subtree_stats(conn: sqlite3.Connection, folder_id: str) -> Dict:
+    """Folders, files and bytes anywhere below a folder (index-only range scan)"""
+    row = conn.execute(SUBTREE_STATS_SQL, subtree_range(folder_path(conn, folder_id))).fetchone()
+    return {"folders": row[0], "files": row[1], "bytes": row[2]}
+
+
+def refresh_folder_stats(conn: sqlite3.Connection) -> int:
+    """Rebuild folder_stats if the catalogue changed since the last build.
+
+    Called by the writers of `files` (drive_sync) inside the transaction
+    that changed it, so the stats are committed together with the rows and
+    page renders never have to rebuild them. Returns the generation the
+    stats now correspond to.
+    """
+    rows = dict(conn.execute(
+        "SELECT key, value FROM catalogue_meta WHERE key IN ('generation', 'folder_stats_generation')"
+    ).fetchall())
+    generation = rows.get('generation', 0)
+    if rows.get('folder_stats_generation') != generation:
+        rebuild_folder_stats(conn)
+        conn.execute(
+            "UPDATE catalogue_meta SET value = ? WHERE key = 'folder_stats_generation'",
+            (generation,)
+        )
+    return generation
+
+
+class FolderStatsCache:
+    """Per-worker copy of folder_stats, reloaded only when the generation changes.
+
+    A page render costs one primary-key read of catalogue_meta; the
+    aggregates are recomputed by the sync that changed the catalogue.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._generation = None
+        self._stats: Dict[str, Dict] = {}
+
+    def get_all(self, conn: sqlite3.Connection) -> Dict[str, Dict]:
+        generation = get_generation(conn)
+        if generation == self._generation:
+            return self._stats
+
+        with self._lock:
+            if generation != self._generation:
+                self._load(generation)
+        return self._stats
+
+    def get(self, conn: sqlite3.Connection, folder_id: str) -> Dict:
+        return self.get_all(conn).get(folder_id)
+
+    def _load(self, generation: int):
+        # Hanya baca: folder_stats diperbarui oleh drive_sync di transaksi
+        # yang sama dengan perubahan `files`, bukan oleh request halaman
+        with db.connection(self.db_path, readonly=True) as conn:
+            stats = {
+                row['folder_id']: dict(row)
+                for row in conn.execute("SELECT * FROM folder_stats")
+            }
+        self._stats = stats
+        self._generation = generation
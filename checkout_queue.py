@@ -0,0 +1,280 @@
+"""
+Checkout Queue
+Async checkout: the request stores the order and a `checkout_jobs` row and
+returns at once; a background worker creates the DANA payment orders and
+fills in orders.payment_url, which the client polls on /payment/status
+
+Run: python checkout_queue.py [--drain] [--stats]
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import db
+from config import DATABASE_PATH
+from dana_payment import DANAPaymentGateway, dana_gateway
+from order_manager import OrderManager, order_manager
+from status_bus import status_bus
+
+# === Konfigurasi checkout (bisa diatur lewat environment) ===
+# true: POST /payment/docs/premium hanya menyimpan order + job (202, payment_url null).
+# Opt-in: klien lalu polling /payment/status, jadi hanya menghemat worker di gthread/ASGI
+CHECKOUT_ASYNC = os.environ.get('CHECKOUT_ASYNC', 'false').lower() == 'true'
+CHECKOUT_WORKER_ENABLED = os.environ.get('CHECKOUT_WORKER_ENABLED', 'true').lower() == 'true'
+# Job per batch (drain) dan panggilan create_payment_order paralel
+CHECKOUT_BATCH_SIZE = int(os.environ.get('CHECKOUT_BATCH_SIZE', 50))
+CHECKOUT_CONCURRENCY = int(os.environ.get('CHECKOUT_CONCURRENCY', 16))
+# Cek antrian walau tidak ada notify() (job dari worker gunicorn lain)
+CHECKOUT_POLL_INTERVAL = float(os.environ.get('CHECKOUT_POLL_INTERVAL', 1.0))
+# Percobaan sebelum order ditandai FAILED; jeda ulang 2^attempts detik
+CHECKOUT_MAX_ATTEMPTS = int(os.environ.get('CHECKOUT_MAX_ATTEMPTS', 4))
+# Job RUNNING lebih lama dari ini dianggap milik worker yang mati
+CHECKOUT_LEASE_SECONDS = int(os.environ.get('CHECKOUT_LEASE_SECONDS', 60))
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+Job = Tuple[str, float, str, str, str, str, int]
+
+
+def enqueue(order_id: str, amount: float, title: str, description: str, notify_url: str,
+            return_url: str, db_path: str = DATABASE_PATH) -> bool:
+    """Queue the DANA order creation for a stored order"""
+    try:
+        with db.connection(db_path) as conn:
+            conn.execute("""
+            INSERT INTO checkout_jobs (order_id, amount, title, description, notify_url, return_url)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(order_id) DO NOTHING
+            """, (order_id, amount, title, description, notify_url, return_url))
+        return True
+    except Exception as e:
+        print(f"Error queueing checkout: {e}")
+        return False
+
+
+class CheckoutWorker:
+    """Creates queued DANA payment orders in the background.
+
+    Jobs are claimed (QUEUED -> RUNNING, attempts + 1) in short BEGIN
+    IMMEDIATE transactions, so gunicorn workers never run the same job
+    twice. The thread keeps up to `concurrency` DANA calls in flight
+    outside any transaction and, each time it wakes, writes every result
+    that came back since in one transaction, then tops the pipeline up
+    (a new checkout does not wait for a whole batch).
+
+    create_payment_order is not idempotent, so only a call that never
+    reached DANA is retried (after 2^attempts seconds; the order is marked
+    FAILED after CHECKOUT_MAX_ATTEMPTS). Any other failure, and a job left
+    RUNNING past the lease, may already have created the DANA order: the
+    job is parked as UNKNOWN and the reconciler asks DANA about the order
+    by our order id instead of sending it again.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, orders: OrderManager = order_manager,
+                 gateway: DANAPaymentGateway = dana_gateway, batch_size: int = CHECKOUT_BATCH_SIZE,
+                 concurrency: int = CHECKOUT_CONCURRENCY, poll_interval: float = CHECKOUT_POLL_INTERVAL,
+                 enabled: bool = CHECKOUT_WORKER_ENABLED):
+        self.db_path = db_path
+        self.orders = orders
+        self.gateway = gateway
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._done: List[Tuple[Job, Dict]] = []
+        self._stats = {"batches": 0, "created": 0, "retried": 0, "failed": 0, "parked": 0,
+                       "last_batch_ms": 0.0}
+
+    # === Thread ===
+
+    def start(self):
+        """Start the worker thread in this process (no-op if running)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Pool dari proses induk tidak punya thread setelah fork
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="checkout")
+            self._in_flight, self._done = 0, []
+            self._thread = threading.Thread(target=self._run, name="checkout-worker", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.pump()
+            except Exception as e:
+                print(f"Checkout worker error: {e}")
+
+    def pump(self) -> int:
+        """Write finished jobs, then claim new ones up to `concurrency` in flight"""
+        with self._lock:
+            done, self._done = self._done, []
+        if done:
+            started = time.perf_counter()
+            self.finish([job for job, _result in done], [result for _job, result in done])
+            self._stats["batches"] += 1
+            self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        jobs = self.claim(self.concurrency - self._in_flight) if self._in_flight < self.concurrency else []
+        for job in jobs:
+            with self._lock:
+                self._in_flight += 1
+            self._pool.submit(self._run_job, job)
+        return len(jobs)
+
+    def _run_job(self, job: Job):
+        result = self._create(job)
+        with self._lock:
+            self._in_flight -= 1
+            self._done.append((job, result))
+        self._wake.set()
+
+    # === Pemrosesan ===
+
+    def drain(self) -> int:
+        """Process batches in this thread until no job is due; returns jobs handled"""
+        total = 0
+        while True:
+            handled = self.process_batch()
+            total += handled
+            if handled < self.batch_size:
+                return total
+
+    def process_batch(self) -> int:
+        started = time.perf_counter()
+        jobs = self.claim(self.batch_size)
+        if not jobs:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(jobs))) as pool:
+            results = list(pool.map(self._create, jobs))
+        self.finish(jobs, results)
+        self._stats["batches"] += 1
+        self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return len(jobs)
+
+    def claim(self, limit: int) -> List[Job]:
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=CHECKOUT_LEASE_SECONDS)).strftime(TIMESTAMP_FORMAT)
+        now = now.strftime(TIMESTAMP_FORMAT)
+        with db.connection(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            jobs = conn.execute("""
+            SELECT order_id, amount, title, description, notify_url, return_url, attempts
+            FROM checkout_jobs
+            WHERE status = 'QUEUED' AND run_after <= ?
+            ORDER BY run_after
+            LIMIT ?
+            """, (now, limit)).fetchall()
+            # Worker yang mati mungkin sudah mengirim order ke DANA: serahkan ke reconciler
+            parked = conn.execute("""
+            UPDATE checkout_jobs SET status = 'UNKNOWN', error = 'lease expired', updated_at = ?
+            WHERE status = 'RUNNING' AND updated_at <= ?
+            """, (now, stale)).rowcount
+            self._stats["parked"] += parked
+            conn.executemany("""
+            UPDATE checkout_jobs SET status = 'RUNNING', attempts = attempts + 1, updated_at = ?
+            WHERE order_id = ?
+            """, [(now, job['order_id']) for job in jobs])
+        return [tuple(job) for job in jobs]
+
+    def _create(self, job: Job) -> Dict:
+        order_id, amount, title, description, notify_url, return_url, _attempts = job
+        try:
+            return self.gateway.create_payment_order(
+                order_id=order_id,
+                amount=amount,
+                title=title,
+                description=description,
+                notify_url=notify_url,
+                return_url=return_url
+            )
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def finish(self, jobs: List[Job], results: List[Dict]):
+        """Store payment URLs, reschedule or fail the rest (one transaction)"""
+        now = datetime.utcnow()
+        with db.connection(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, result in zip(jobs, results):
+                order_id, attempts = job[0], job[6] + 1
+                if result.get('success'):
+                    self.orders.write_checkout(conn, order_id, result.get('dana_order_id'),
+                                               result.get('payment_url'))
+                    conn.execute("""
+                    UPDATE checkout_jobs SET status = 'DONE', error = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                    """, (order_id,))
+                    self._stats["created"] += 1
+                elif result.get('sent', True):
+                    # Timeout / 5xx: DANA mungkin sudah membuat order, jangan kirim ulang
+                    conn.execute("""
+                    UPDATE checkout_jobs SET status = 'UNKNOWN', error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                    """, (result.get('error'), order_id))
+                    self._stats["parked"] += 1
+                elif attempts >= CHECKOUT_MAX_ATTEMPTS:
+                    conn.execute("""
+                    UPDATE checkout_jobs SET status = 'FAILED', error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                    """, (result.get('error'), order_id))
+                    row = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
+                    if row and row['status'] == "PENDING":
+                        self.orders.write_status(conn, order_id, "FAILED")
+                    self._stats["failed"] += 1
+                else:
+                    run_after = (now + timedelta(seconds=2 ** attempts)).strftime(TIMESTAMP_FORMAT)
+                    conn.execute("""
+                    UPDATE checkout_jobs
+                    SET status = 'QUEUED', error = ?, run_after = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                    """, (result.get('error'), run_after, order_id))
+                    self._stats["retried"] += 1
+        status_bus.wake()
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats, enabled=self.enabled, in_flight=self._in_flight)
+        stats["running"] = bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+        return stats
+
+
+def queue_depth(db_path: str = DATABASE_PATH) -> Dict[str, int]:
+    with db.connection(db_path, readonly=True) as conn:
+        return {row[0]: row[1] for row in conn.execute(
+            "SELECT status, COUNT(*) FROM checkout_jobs GROUP BY status")}
+
+
+checkout_worker = CheckoutWorker()
+
+
+if __name__ == '__main__':
+    # python checkout_queue.py --drain -> proses job yang jatuh tempo sekali
+    # python checkout_queue.py --stats -> jumlah job per status
+    parser = argparse.ArgumentParser(description="Async checkout queue")
+    parser.add_argument("--drain", action="store_true", help="process all due checkout jobs once")
+    parser.add_argument("--stats", action="store_true", help="print job counts per status")
+    args = parser.parse_args()
+
+    if args.drain:
+        print(f"✅ {checkout_worker.drain()} checkout jobs processed")
+    if args.stats or not args.drain:
+        print(queue_depth())
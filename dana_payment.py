@@ -5,17 +5,20 @@ Sandbox Configuration & Payment Processing
 
 import os
 import json
-import requests
 import hashlib
 import hmac
 import time
 from datetime import datetime
 from typing import Dict, Optional, Tuple
 
+from http_client import HTTPClient, never_sent
+from token_store import SharedToken
+
 # DANA Sandbox Configuration
 DANA_CONFIG = {
     "sandbox": {
-        "base_url": "https://api.sandbox.dana.id",
+        # DANA_BASE_URL: mis. http://127.0.0.1:8765 untuk fake_dana.py
+        "base_url": os.environ.get("DANA_BASE_URL", "https://api.sandbox.dana.id"),
         "merchant_id": os.environ.get("DANA_MERCHANT_ID", "216620010026043209503"),
         "client_id": os.environ.get("DANA_CLIENT_ID", "2025112621324475258385"),
         "client_secret": os.environ.get("DANA_CLIENT_SECRET", "0320254759fb001aa2f48b2f941949eb39a817758c949a391fbc6709ec738f3b"),
@@ -35,18 +38,22 @@ class DANAPaymentGateway:
         self.merchant_id = self.config["merchant_id"]
         self.client_id = self.config["client_id"]
         self.client_secret = self.config["client_secret"]
-        self.access_token = None
-        self.token_expiry = None
+        # Token OAuth dibagi semua worker lewat file TOKEN_STORE_PATH (di luar database katalog)
+        self.token = SharedToken(f"dana:{environment}:{self.client_id}", self._fetch_access_token)
+        # Session keep-alive bersama untuk semua panggilan ke DANA di worker ini
+        self.http = HTTPClient(self.base_url)
     
     def get_access_token(self) -> Optional[str]:
         """
-        Get OAuth2 Access Token from DANA
+        Get OAuth2 Access Token from DANA (shared across workers)
         """
-        if self.access_token and self.token_expiry and time.time() < self.token_expiry:
-            return self.access_token
-        
-        token_url = f"{self.base_url}/oauth2/token"
-        
+        try:
+            return self.token.get_token()
+        except Exception as e:
+            print(f"Error getting DANA access token: {e}")
+            return None
+    
+    def _fetch_access_token(self) -> Tuple[str, float]:
         payload = {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
@@ -58,18 +65,12 @@ class DANAPaymentGateway:
             "Content-Type": "application/x-www-form-urlencoded"
         }
         
-        try:
-            response = requests.post(token_url, data=payload, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.access_token = data.get("access_token")
-            self.token_expiry = time.time() + data.get("expires_in", 3600) - 60  # Refresh 60s before expiry
-            
-            return self.access_token
-        except Exception as e:
-            print(f"Error getting DANA access token: {e}")
-            return None
+        response = self.http.request("token", "POST", "/oauth2/token", idempotent=True,
+                                     data=payload, headers=headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        return data["access_token"], time.time() + data.get("expires_in", 3600)
     
     def generate_signature(self, data: str, method: str = "SHA256") -> str:
         """
@@ -100,13 +101,12 @@ class DANAPaymentGateway:
             return_url: Return URL after payment
         
         Returns:
-            Dict with payment URL and order details
+            Dict with payment URL and order details. On failure `sent` is
+            False only if the request never reached DANA (safe to resend)
         """
         access_token = self.get_access_token()
         if not access_token:
-            return {"error": "Failed to get access token"}
-        
-        url = f"{self.base_url}/payment/orders/v1/create"
+            return {"error": "Failed to get access token", "sent": False}
         
         timestamp = datetime.utcnow().isoformat() + "Z"
         
@@ -134,11 +134,13 @@ class DANAPaymentGateway:
         }
         
         try:
-            response = requests.post(
-                url,
+            # Tidak idempotent: timeout / 5xx bisa terjadi setelah DANA membuat order,
+            # jadi hanya koneksi yang gagal dibuka yang dicoba ulang
+            response = self.http.request(
+                "create_payment_order", "POST", "/payment/orders/v1/create",
+                idempotent=False,
                 json=payload,
-                headers=headers,
-                timeout=10
+                headers=headers
             )
             response.raise_for_status()
             
@@ -154,7 +156,8 @@ class DANAPaymentGateway:
             print(f"Error creating payment order: {e}")
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "sent": not never_sent(e)
             }
     
     def verify_payment(self, order_id: str, dana_transaction_id: str) -> Dict:
@@ -165,8 +168,6 @@ class DANAPaymentGateway:
         if not access_token:
             return {"error": "Failed to get access token"}
         
-        url = f"{self.base_url}/payment/orders/v1/{order_id}/status"
-        
         headers = {
             "Authorization": f"Bearer {access_token}",
             "X-Merchant-Id": self.merchant_id,
@@ -174,7 +175,8 @@ class DANAPaymentGateway:
         }
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.http.request("verify_payment", "GET", f"/payment/orders/v1/{order_id}/status",
+                                         idempotent=True, headers=headers)
             response.raise_for_status()
             
             data = response.json()
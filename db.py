@@ -0,0 +1,174 @@
+"""
+Database Connection Pool
+Shared SQLite connections (WAL, tuned pragmas) for app.py, OrderManager and AdminDashboard
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from config import DATABASE_PATH
+
+# === Konfigurasi pool (bisa diatur lewat environment) ===
+# Satu worker gunicorn sync hanya butuh 1-2 koneksi; worker gthread/gevent
+# butuh kira-kira sebanyak jumlah thread/greenlet aktif.
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', 4)))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+
+def _configure(conn: sqlite3.Connection, readonly: bool):
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        # WAL: pembaca tidak terblokir oleh penulis (webhook, sync)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+
+class ConnectionPool:
+    """LIFO pool of SQLite connections for one database file.
+
+    Connections are handed to one caller at a time, so they can move between
+    threads or greenlets (check_same_thread=False). When the pool is empty a
+    new connection is opened; when it is full on release the connection is
+    closed instead of kept. The pool resets itself after a fork so gunicorn
+    workers never share a connection inherited from the master.
+    """
+
+    def __init__(self, db_path: str, readonly: bool = False, size: int = POOL_SIZE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._pid = os.getpid()
+        self._stats = {
+            "opened": 0,
+            "closed": 0,
+            "reused": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+        }
+
+    def _open(self) -> sqlite3.Connection:
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                   timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                   check_same_thread=False)
+        _configure(conn, self.readonly)
+        return conn
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # Koneksi milik proses induk: buang tanpa menutup
+            self._idle = []
+            self._pid = os.getpid()
+            self._stats["in_use"] = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self._check_fork()
+            conn = self._idle.pop() if self._idle else None
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+            if conn is not None:
+                self._stats["reused"] += 1
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._stats["in_use"] -= 1
+                raise
+            with self._lock:
+                self._stats["opened"] += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        # Jangan kembalikan koneksi dengan transaksi yang masih terbuka
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            keep = True
+        except sqlite3.Error:
+            keep = False
+
+        with self._lock:
+            self._check_fork()
+            self._stats["in_use"] = max(0, self._stats["in_use"] - 1)
+            if keep and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._stats["closed"] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; commits on success, rolls back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats.update(db_path=self.db_path, readonly=self.readonly, size=self.size, pid=self._pid)
+        return stats
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DATABASE_PATH, readonly: bool = False) -> ConnectionPool:
+    """Return the process-wide pool for (db_path, readonly)"""
+    key = (os.path.abspath(db_path), readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(key[0], readonly=readonly)
+                _pools[key] = pool
+    return pool
+
+
+def connection(db_path: Optional[str] = None, readonly: bool = False):
+    """Context manager yielding a pooled connection.
+
+    Browse routes should pass readonly=True: those connections are opened
+    with mode=ro and never take the write lock.
+    """
+    return get_pool(db_path or DATABASE_PATH, readonly=readonly).connection()
+
+
+def pool_stats() -> List[Dict]:
+    """Metrics for every pool in this process"""
+    return [pool.stats() for pool in list(_pools.values())]
@@ -0,0 +1,485 @@
+"""
+Download Gateway
+ASGI entry point: /download/<file_id> is streamed with asyncio, every other
+route is handed to the Flask app unchanged.
+
+Run: gunicorn download_gateway:application -k uvicorn.workers.UvicornWorker
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import http_date, is_resource_modified, parse_range_header
+from werkzeug.wrappers import Request
+
+import db
+from app import DATABASE, app as flask_app
+from blob_cache import BACKGROUND_FILLS, BLOB_CACHE_ENABLED, CacheFill, blob_cache, record_download
+from drive_client import drive_token, file_etag, media_headers, media_url, parse_modified_time
+from status_bus import status_bus
+from streaming import CHUNK_MIN, download_meter
+
+# === Konfigurasi gateway (bisa diatur lewat environment) ===
+# Jumlah transfer aktif per proses; request berikutnya antre paling lama QUEUE_TIMEOUT
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', 200))
+DOWNLOAD_QUEUE_TIMEOUT = float(os.environ.get('DOWNLOAD_QUEUE_TIMEOUT', 10))
+# Batas bandwidth per IP klien (byte/detik, 0 = tanpa batas), dibagi semua download klien itu
+CLIENT_BANDWIDTH_BYTES = int(os.environ.get('DOWNLOAD_CLIENT_BANDWIDTH_BYTES', 2 * 1024 * 1024))
+CLIENT_BURST_BYTES = int(os.environ.get('DOWNLOAD_CLIENT_BURST_BYTES', 4 * 1024 * 1024))
+# Proxy tepercaya di depan gateway (Render: 1). Batas bandwidth memakai alamat yang
+# ditambahkan proxy terluar ke X-Forwarded-For, dihitung dari kanan; entri di
+# kirinya dikirim klien sendiri dan bisa dipalsukan. 0 = alamat koneksi langsung.
+TRUSTED_PROXY_HOPS = int(os.environ.get('DOWNLOAD_TRUSTED_PROXY_HOPS', 0))
+# Thread untuk route Flask biasa (halaman, search, webhook, admin)
+WSGI_THREADS = int(os.environ.get('GATEWAY_WSGI_THREADS', 16))
+
+DOWNLOAD_PREFIX = '/download/'
+
+
+class BandwidthLimiter:
+    """Token bucket per client key, shared by all of that client's transfers.
+
+    Runs on a single event loop, so no locking is needed. A transfer that
+    overdraws the bucket waits until the debt is paid back, which slows
+    the upstream read as well (nothing is buffered ahead).
+    """
+
+    def __init__(self, rate: int = CLIENT_BANDWIDTH_BYTES, burst: int = CLIENT_BURST_BYTES,
+                 max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, rate)
+        self.max_clients = max_clients
+        self._buckets: Dict[str, List[float]] = {}
+        self.throttled_seconds = 0.0
+
+    def reserve(self, key: str, amount: int) -> float:
+        """Take `amount` bytes from the client's bucket; returns seconds to wait"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._prune(now)
+            bucket = self._buckets[key] = [float(self.burst), now]
+
+        tokens, updated = bucket
+        tokens = min(self.burst, tokens + (now - updated) * self.rate) - amount
+        bucket[0], bucket[1] = tokens, now
+        if tokens >= 0:
+            return 0.0
+        delay = -tokens / self.rate
+        self.throttled_seconds += delay
+        return delay
+
+    def _prune(self, now: float):
+        # Buang bucket yang sudah penuh lagi (klien tidak aktif)
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self._buckets[key]
+
+    def stats(self) -> Dict:
+        return {
+            "rate_bytes": self.rate,
+            "burst_bytes": self.burst,
+            "clients": len(self._buckets),
+            "throttled_seconds": round(self.throttled_seconds, 2),
+        }
+
+
+class DownloadGateway:
+    """ASGI application serving Drive downloads without blocking a thread.
+
+    Behaviour matches app.download_proxy (304 from the catalogue, Range and
+    If-Range, blob cache, download counting); the difference is that each
+    transfer is a coroutine, so hundreds of slow clients cost sockets, not
+    worker threads. At most MAX_CONCURRENT_DOWNLOADS transfers run at once;
+    the rest wait up to DOWNLOAD_QUEUE_TIMEOUT and then get 503.
+    """
+
+    def __init__(self, wsgi_app, max_concurrent: int = MAX_CONCURRENT_DOWNLOADS,
+                 queue_timeout: float = DOWNLOAD_QUEUE_TIMEOUT,
+                 limiter: Optional[BandwidthLimiter] = None):
+        self.wsgi = WSGIMiddleware(wsgi_app, workers=WSGI_THREADS)
+        # SSE / long-poll /payment/status memegang thread dari pool ini
+        status_bus.set_threads(WSGI_THREADS)
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.limiter = limiter or BandwidthLimiter()
+        # Dibuat di event loop worker (setelah fork), bukan saat import
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Task pengisian cache untuk miss pada request Range (key blob -> task)
+        self._fills: Dict[str, asyncio.Task] = {}
+        self._stats = {"served": 0, "from_cache": 0, "rejected": 0, "upstream_errors": 0,
+                       "background_fills": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if (scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD')
+                and scope['path'].startswith(DOWNLOAD_PREFIX)):
+            file_id = unquote(scope['path'][len(DOWNLOAD_PREFIX):])
+            if file_id and '/' not in file_id:
+                return await self.download(scope, receive, send, file_id)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._client is not None:
+                    await self._client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60, connect=10),
+                limits=httpx.Limits(max_connections=self.max_concurrent,
+                                    max_keepalive_connections=20),
+            )
+        return self._client
+
+    # === Handler /download/<file_id> ===
+
+    async def download(self, scope, receive, send, file_id: str):
+        request = Request(_environ(scope))
+        head = scope['method'] == 'HEAD'
+        client_key = _client_key(scope)
+
+        meta = await asyncio.to_thread(_file_meta, file_id)
+        modified_time = meta['modified_time'] if meta else None
+        etag = file_etag(file_id, modified_time)
+        last_modified = parse_modified_time(modified_time)
+        validators = _validators(etag, last_modified)
+
+        if etag and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return await _respond(send, 304, validators)
+
+        # If-Range yang tidak cocok berarti file sudah berubah: kirim file utuh
+        range_header = request.headers.get('Range')
+        if range_header and not _if_range_matches(request, etag, last_modified):
+            range_header = None
+
+        if not range_header or range_header.replace(' ', '').startswith('bytes=0-'):
+            await asyncio.to_thread(record_download, file_id, DATABASE)
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["rejected"] += 1
+            return await _respond(send, 503, [('Retry-After', '5')], b'Too many downloads, retry shortly')
+
+        disconnected = asyncio.Event()
+        watcher = asyncio.create_task(_watch_disconnect(receive, disconnected))
+        try:
+            self._stats["served"] += 1
+            # Miss tidak menunggu file utuh: body penuh disalin ke cache sambil
+            # dikirim, Range di-proxy dan cache diisi oleh task terpisah
+            cache_miss = False
+            if BLOB_CACHE_ENABLED and meta and blob_cache.cacheable(meta['size']):
+                path = await asyncio.to_thread(blob_cache.lookup, file_id, modified_time)
+                if path and await self._send_cached(send, range_header, path, meta, validators,
+                                                    head, client_key, disconnected, file_id):
+                    self._stats["from_cache"] += 1
+                    return
+                cache_miss = not head
+                if range_header and cache_miss:
+                    self._fill_in_background(file_id, modified_time)
+            return await self._send_upstream(send, file_id, range_header, validators,
+                                             head, client_key, disconnected,
+                                             modified_time=modified_time, fill_cache=cache_miss)
+        finally:
+            watcher.cancel()
+            self._slots.release()
+
+    async def _send_cached(self, send, range_header, path, meta, validators, head,
+                           client_key, disconnected, file_id) -> bool:
+        """Serve a cache hit; False (nothing sent) if the entry was evicted
+        after the lookup"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return False
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            headers = validators + [('Content-Type', meta['mime_type'] or 'application/octet-stream')]
+            start, stop, status = 0, size, 200
+            ranges = parse_range_header(range_header) if range_header else None
+            if ranges is not None:
+                span = ranges.range_for_length(size)
+                if span is None:
+                    await _respond(send, 416, validators + [('Content-Range', f'bytes */{size}')],
+                                   b'Requested range not satisfiable')
+                    return True
+                start, stop = span
+                status = 206
+                headers.append(('Content-Range', f'bytes {start}-{stop - 1}/{size}'))
+            headers.append(('Content-Length', str(stop - start)))
+
+            await send(_start(status, headers))
+            if head:
+                await send({'type': 'http.response.body', 'body': b''})
+                return True
+
+            await asyncio.to_thread(f.seek, start)
+            await self._stream(send, _read_file(f, stop - start), client_key, disconnected, file_id)
+        return True
+
+    async def _send_upstream(self, send, file_id, range_header, validators, head,
+                             client_key, disconnected, modified_time: Optional[str] = None,
+                             fill_cache: bool = False):
+        """Proxy from Drive. With `fill_cache` a full 200 body is also copied
+        into the blob cache while it streams to the client."""
+        if not drive_token.available():
+            flask_app.logger.error('credentials.json not found')
+            return await _respond(send, 404, [], b'Not Found')
+        try:
+            token = await asyncio.to_thread(drive_token.get_token)
+        except Exception:
+            flask_app.logger.exception('Failed to obtain service account token')
+            return await _respond(send, 500, [], b'Internal Server Error')
+
+        client = self._http()
+        try:
+            upstream = await client.send(
+                client.build_request('GET', media_url(file_id),
+                                     headers=media_headers(token, range_header)),
+                stream=True,
+            )
+        except httpx.HTTPError:
+            self._stats["upstream_errors"] += 1
+            flask_app.logger.exception('Error requesting file from Drive')
+            return await _respond(send, 502, [], b'Bad Gateway')
+
+        try:
+            if upstream.status_code == 416:
+                headers = list(validators)
+                if upstream.headers.get('Content-Range'):
+                    headers.append(('Content-Range', upstream.headers['Content-Range']))
+                return await _respond(send, 416, headers, b'Requested range not satisfiable')
+
+            if upstream.status_code not in (200, 206):
+                self._stats["upstream_errors"] += 1
+                flask_app.logger.error('Drive returned status %s for file %s',
+                                       upstream.status_code, file_id)
+                return await _respond(send, 502, [],
+                                      f'Failed to download file (status {upstream.status_code})'.encode())
+
+            headers = validators + [
+                ('Content-Type', upstream.headers.get('Content-Type', 'application/octet-stream'))
+            ]
+            for header in ('Content-Length', 'Content-Range', 'Content-Disposition'):
+                if upstream.headers.get(header):
+                    headers.append((header, upstream.headers[header]))
+
+            await send(_start(upstream.status_code, headers))
+            if head:
+                return await send({'type': 'http.response.body', 'body': b''})
+            # Accept-Encoding: identity, jadi byte mentah = byte yang dikirim
+            chunks = upstream.aiter_raw(CHUNK_MIN)
+            if fill_cache and upstream.status_code == 200:
+                entry = await asyncio.to_thread(blob_cache.begin_fill, file_id, modified_time)
+                if entry is not None:
+                    chunks = _tee_to_cache(chunks, entry, upstream.headers.get('Content-Length'))
+            try:
+                await self._stream(send, chunks, client_key, disconnected, file_id)
+            finally:
+                # Commit / buang entry cache sekarang, bukan saat GC
+                await chunks.aclose()
+        finally:
+            await upstream.aclose()
+
+    def _fill_in_background(self, file_id: str, modified_time: Optional[str]):
+        """Start an async fill of a missed entry, at most BACKGROUND_FILLS at once"""
+        key = blob_cache.key(file_id, modified_time)
+        if key in self._fills or len(self._fills) >= BACKGROUND_FILLS:
+            return
+        task = asyncio.create_task(self._background_fill(file_id, modified_time))
+        self._fills[key] = task
+        task.add_done_callback(lambda _task: self._fills.pop(key, None))
+        self._stats["background_fills"] += 1
+
+    async def _background_fill(self, file_id: str, modified_time: Optional[str]):
+        if not drive_token.available():
+            return
+        entry = await asyncio.to_thread(blob_cache.begin_fill, file_id, modified_time)
+        if entry is None:
+            return  # sudah ada di cache atau sedang diisi worker lain
+        chunks = None
+        try:
+            token = await asyncio.to_thread(drive_token.get_token)
+            client = self._http()
+            async with client.stream('GET', media_url(file_id), headers=media_headers(token)) as upstream:
+                if upstream.status_code != 200:
+                    raise httpx.HTTPStatusError(f'Drive returned status {upstream.status_code}',
+                                                request=upstream.request, response=upstream)
+                chunks = _tee_to_cache(upstream.aiter_raw(CHUNK_MIN), entry,
+                                       upstream.headers.get('Content-Length'))
+                async for _chunk in chunks:
+                    pass
+        except Exception:
+            flask_app.logger.exception('Error filling blob cache for %s', file_id)
+            if chunks is None:
+                await asyncio.to_thread(entry.abort)
+        finally:
+            if chunks is not None:
+                await chunks.aclose()
+
+    async def _stream(self, send, chunks, client_key, disconnected, label):
+        tracked = download_meter.atrack(chunks, label=label, logger=flask_app.logger)
+        try:
+            async for chunk in tracked:
+                delay = self.limiter.reserve(client_key, len(chunk))
+                if delay:
+                    try:
+                        # Klien yang putus tidak perlu menunggu sisa jatah bandwidth
+                        await asyncio.wait_for(disconnected.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                if disconnected.is_set():
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await tracked.aclose()
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        slots = self._slots
+        stats.update(
+            active=self.max_concurrent - slots._value if slots else 0,
+            max_concurrent=self.max_concurrent,
+            bandwidth=self.limiter.stats(),
+        )
+        return stats
+
+
+# === Helper ===
+
+def _environ(scope) -> Dict:
+    """Minimal WSGI environ, enough for werkzeug's header parsing"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        environ[key] = value.decode('latin-1')
+    return environ
+
+
+def _client_key(scope, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """Bandwidth bucket key: the address the outermost trusted proxy saw"""
+    peer = scope['client'][0] if scope.get('client') else 'unknown'
+    if trusted_hops <= 0:
+        return peer
+    hops = []
+    for name, value in scope['headers']:
+        if name == b'x-forwarded-for':
+            hops.extend(hop.strip() for hop in value.decode('latin-1').split(','))
+    hops = [hop for hop in hops if hop]
+    # Lebih sedikit hop dari proxy tepercaya: request tidak lewat proxy
+    return hops[-trusted_hops] if len(hops) >= trusted_hops else peer
+
+
+def _file_meta(file_id: str):
+    with db.connection(DATABASE, readonly=True) as conn:
+        return conn.execute(
+            "SELECT mime_type, size, modified_time FROM files WHERE id = ?", (file_id,)
+        ).fetchone()
+
+
+def _if_range_matches(request: Request, etag, last_modified) -> bool:
+    if_range = request.if_range
+    if if_range.etag:
+        return etag is not None and if_range.etag == etag
+    if if_range.date:
+        return last_modified is not None and if_range.date == last_modified
+    return True
+
+
+def _validators(etag, last_modified) -> List[Tuple[str, str]]:
+    headers = [('Accept-Ranges', 'bytes')]
+    if etag:
+        headers.append(('ETag', f'"{etag}"'))
+    if last_modified:
+        headers.append(('Last-Modified', http_date(last_modified)))
+    return headers
+
+
+def _start(status: int, headers: List[Tuple[str, str]]) -> Dict:
+    return {
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    }
+
+
+async def _respond(send, status: int, headers: List[Tuple[str, str]], body: bytes = b''):
+    headers = list(headers)
+    if status != 304:
+        headers += [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', str(len(body)))]
+    await send(_start(status, headers))
+    await send({'type': 'http.response.body', 'body': body if status != 304 else b''})
+
+
+async def _read_file(f, length: int, chunk_size: int = CHUNK_MIN):
+    remaining = length
+    while remaining > 0:
+        chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def _tee_to_cache(chunks, entry: CacheFill, expected_size: Optional[str]):
+    """Yield upstream chunks while writing them into a blob cache entry;
+    the entry is committed only if the stream ran to the end"""
+    completed = False
+    try:
+        async for chunk in chunks:
+            if entry is not None:
+                try:
+                    await asyncio.to_thread(entry.write, chunk)
+                except OSError:
+                    # Disk penuh dsb.: download tetap jalan tanpa cache
+                    flask_app.logger.exception('Error writing blob cache entry')
+                    await asyncio.to_thread(entry.abort)
+                    entry = None
+            yield chunk
+        completed = True
+    finally:
+        if entry is not None and completed:
+            await asyncio.to_thread(entry.commit, expected_size)
+        elif entry is not None:
+            await asyncio.to_thread(entry.abort)
+
+
+async def _watch_disconnect(receive, event: asyncio.Event):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            event.set()
+            return
+
+
+application = DownloadGateway(flask_app)
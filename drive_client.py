@@ -0,0 +1,137 @@
+"""
+Google Drive Client
+Worker-shared service-account token and pooled HTTP session for googleapis.com
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import CREDENTIALS_FILE, SCOPES
+from token_store import SharedToken
+
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3"
+
+# Token diperbarui sebelum kedaluwarsa (detik)
+TOKEN_REFRESH_MARGIN = int(os.environ.get('DRIVE_TOKEN_REFRESH_MARGIN', 300))
+# Jumlah koneksi keep-alive ke googleapis.com per worker
+DRIVE_POOL_SIZE = int(os.environ.get('DRIVE_POOL_SIZE', 10))
+
+
+def create_session(pool_size: int = DRIVE_POOL_SIZE) -> requests.Session:
+    """requests.Session with a keep-alive connection pool for googleapis.com"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+class ServiceAccountToken:
+    """Holds one service-account credential per process.
+
+    The access token itself lives in a token_store.SharedToken, so all
+    gunicorn workers share one OAuth round-trip per token lifetime: it is
+    refreshed TOKEN_REFRESH_MARGIN seconds before expiry by whichever
+    worker takes the lease, and the others adopt it from the store.
+    """
+
+    def __init__(self, credentials_file: str = CREDENTIALS_FILE, scopes=None,
+                 session: Optional[requests.Session] = None, db_path: Optional[str] = None):
+        self.credentials_file = credentials_file
+        self.scopes = scopes or SCOPES
+        self.session = session
+        self._creds = None
+        key = hashlib.sha1(f"{os.path.abspath(credentials_file)}|{' '.join(self.scopes)}".encode()).hexdigest()[:12]
+        self._shared = SharedToken(f"google:{key}", self._fetch, margin=TOKEN_REFRESH_MARGIN, db_path=db_path)
+
+    def available(self) -> bool:
+        return self._creds is not None or os.path.exists(self.credentials_file)
+
+    def get_token(self) -> str:
+        """Return a valid access token, refreshing it ahead of expiry"""
+        return self._shared.get_token()
+
+    def _fetch(self):
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import Request as AuthRequest
+
+        if self._creds is None:
+            self._creds = service_account.Credentials.from_service_account_file(
+                self.credentials_file, scopes=self.scopes
+            )
+        self._creds.refresh(AuthRequest(session=self.session))
+        # google-auth menyimpan expiry sebagai datetime UTC tanpa timezone
+        return self._creds.token, self._creds.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+    def stats(self) -> Dict:
+        shared = self._shared.stats()
+        expires_at = shared["expires_at"]
+        return {
+            "refresh_count": shared["fetches"],
+            "refresh_errors": shared["fetch_errors"],
+            "refreshes_per_hour": shared["fetches_per_hour"],
+            "last_refresh": shared["last_fetch"],
+            "token_expiry": datetime.utcfromtimestamp(expires_at).isoformat() + "Z" if expires_at else None,
+            "adopted_from_store": shared["adopted"],
+            "waits": shared["waits"],
+        }
+
+
+# Shared per worker process
+drive_session = create_session()
+drive_token = ServiceAccountToken(session=drive_session)
+
+
+def media_url(file_id: str) -> str:
+    return f"{DRIVE_API_URL}/files/{file_id}?alt=media"
+
+
+def download_to_file(file_id: str, fileobj, chunk_size: int = 1024 * 1024):
+    """Download the full body of a Drive file into an open binary file"""
+    token = drive_token.get_token()
+    with drive_session.get(media_url(file_id), headers=media_headers(token),
+                           stream=True, timeout=60) as r:
+        r.raise_for_status()
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                fileobj.write(chunk)
+
+
+def media_headers(token: str, range_header: Optional[str] = None) -> Dict[str, str]:
+    """Upstream headers for a media download.
+
+    Compression is disabled so Content-Length and Content-Range from Drive
+    describe exactly the bytes we relay.
+    """
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Accept-Encoding': 'identity',
+    }
+    if range_header:
+        headers['Range'] = range_header
+    return headers
+
+
+def file_etag(file_id: str, modified_time: Optional[str]) -> Optional[str]:
+    """Strong validator for a Drive file revision (id + modifiedTime)"""
+    if not modified_time:
+        return None
+    return hashlib.sha1(f"{file_id}:{modified_time}".encode()).hexdigest()[:24]
+
+
+def parse_modified_time(modified_time: Optional[str]) -> Optional[datetime]:
+    """Parse Drive's RFC 3339 modifiedTime ("2025-10-31T07:01:39.541Z")"""
+    if not modified_time:
+        return None
+    try:
+        parsed = datetime.fromisoformat(modified_time.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    # Header HTTP hanya presisi detik
+    return parsed.replace(microsecond=0)
@@ -0,0 +1,365 @@
+"""
+Drive Sync
+Fills the `files` catalogue from Google Drive: a parallel initial crawl of
+ROOT_FOLDERS, then incremental updates from the Drive Changes API.
+
+Run: python drive_sync.py [--full] [--loop SECONDS]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import db
+from catalogue import refresh_folder_stats, rebuild_paths, update_paths, write_generation_stamp
+from config import DATABASE_PATH, ROOT_FOLDERS
+from drive_client import DRIVE_API_URL, drive_session, drive_token
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+FILE_FIELDS = "id, name, mimeType, size, modifiedTime, parents, trashed"
+
+# === Konfigurasi sync (bisa diatur lewat environment) ===
+SYNC_WORKERS = int(os.environ.get('DRIVE_SYNC_WORKERS', 8))
+PAGE_SIZE = 1000  # maksimum files.list / changes.list
+BATCH_SIZE = int(os.environ.get('DRIVE_SYNC_BATCH_SIZE', 1000))
+MAX_RETRIES = 5
+
+# Kolom `files` dalam urutan yang dipakai executemany
+FILE_COLUMNS = ("id", "name", "mime_type", "size", "modified_time", "parent_id",
+                "root_folder_name", "is_directory")
+
+UPSERT_FILE = f"""
+INSERT INTO files ({", ".join(FILE_COLUMNS)})
+VALUES ({", ".join("?" for _ in FILE_COLUMNS)})
+ON CONFLICT(id) DO UPDATE SET
+    name = excluded.name,
+    mime_type = excluded.mime_type,
+    size = excluded.size,
+    modified_time = excluded.modified_time,
+    parent_id = excluded.parent_id,
+    root_folder_name = excluded.root_folder_name,
+    is_directory = excluded.is_directory
+WHERE files.name IS NOT excluded.name
+   OR files.mime_type IS NOT excluded.mime_type
+   OR files.size IS NOT excluded.size
+   OR files.modified_time IS NOT excluded.modified_time
+   OR files.parent_id IS NOT excluded.parent_id
+   OR files.root_folder_name IS NOT excluded.root_folder_name
+   OR files.is_directory IS NOT excluded.is_directory
+"""
+
+# Hapus satu file beserta seluruh isinya (folder yang dihapus/di-trash/dipindah keluar)
+DELETE_SUBTREE = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT ?
+    UNION
+    SELECT f.id FROM files f JOIN subtree s ON f.parent_id = s.id
+)
+DELETE FROM files WHERE id IN (SELECT id FROM subtree)
+"""
+
+RETAG_SUBTREE = """
+WITH RECURSIVE subtree(id) AS (
+    SELECT id FROM files WHERE parent_id = ?
+    UNION
+    SELECT f.id FROM files f JOIN subtree s ON f.parent_id = s.id
+)
+UPDATE files SET root_folder_name = ? WHERE id IN (SELECT id FROM subtree)
+"""
+
+FileRow = Tuple[str, str, Optional[str], int, Optional[str], str, str, int]
+
+
+def get_state(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM drive_sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_state(conn: sqlite3.Connection, key: str, value: Optional[str]):
+    conn.execute("""
+    INSERT INTO drive_sync_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    """, (key, value))
+
+
+class DriveAPI:
+    """Minimal Drive v3 REST client for the sync (files.list, changes.list).
+
+    Uses the shared keep-alive session and service-account token from
+    drive_client, so it is safe to call from several threads at once.
+    """
+
+    def __init__(self, session=drive_session, token=drive_token):
+        self.session = session
+        self.token = token
+
+    def _get(self, path: str, params: Dict) -> Dict:
+        params = dict(params, supportsAllDrives="true")
+        for attempt in range(MAX_RETRIES):
+            headers = {'Authorization': f'Bearer {self.token.get_token()}'}
+            r = self.session.get(f"{DRIVE_API_URL}/{path}", params=params, headers=headers, timeout=60)
+            # 403/429 = rate limit, 5xx = gangguan sementara: coba lagi dengan backoff
+            rate_limited = r.status_code == 403 and 'ateLimitExceeded' in r.text
+            if rate_limited or r.status_code == 429 or r.status_code >= 500:
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(min(2 ** attempt, 30))
+                    continue
+            r.raise_for_status()
+            return r.json()
+
+    def list_children(self, folder_id: str) -> List[Dict]:
+        """All non-trashed direct children of a folder (every page)"""
+        params = {
+            "q": f"'{folder_id}' in parents and trashed = false",
+            "fields": f"nextPageToken, files({FILE_FIELDS})",
+            "pageSize": PAGE_SIZE,
+            "includeItemsFromAllDrives": "true",
+        }
+        children = []
+        while True:
+            data = self._get("files", params)
+            children.extend(data.get("files", []))
+            if not data.get("nextPageToken"):
+                return children
+            params["pageToken"] = data["nextPageToken"]
+
+    def get_start_page_token(self) -> str:
+        return self._get("changes/startPageToken", {})["startPageToken"]
+
+    def list_changes(self, page_token: str) -> Tuple[List[Dict], str]:
+        """All changes since `page_token`; returns (changes, new start token)"""
+        params = {
+            "pageToken": page_token,
+            "fields": f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+            "pageSize": PAGE_SIZE,
+            "includeRemoved": "true",
+            "includeItemsFromAllDrives": "true",
+        }
+        changes = []
+        while True:
+            data = self._get("changes", params)
+            changes.extend(data.get("changes", []))
+            if data.get("newStartPageToken"):
+                return changes, data["newStartPageToken"]
+            params["pageToken"] = data["nextPageToken"]
+
+
+def to_row(item: Dict, parent_id: str, root_name: str) -> FileRow:
+    is_directory = item.get("mimeType") == FOLDER_MIME
+    return (
+        item["id"],
+        item.get("name", ""),
+        item.get("mimeType"),
+        0 if is_directory else int(item.get("size") or 0),
+        item.get("modifiedTime"),
+        parent_id,
+        root_name,
+        1 if is_directory else 0,
+    )
+
+
+def crawl(api, start: List[Tuple[str, str]], workers: int = SYNC_WORKERS) -> Iterator[List[FileRow]]:
+    """Walk the given (folder_id, root_name) folders breadth-first, listing
+    up to `workers` folders in parallel. Yields the rows of each listed
+    folder as it completes."""
+    pending = list(start)
+    seen_folders: Set[str] = {folder_id for folder_id, _root in start}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending:
+            level, pending = pending, []
+            listings = pool.map(lambda job: (job, api.list_children(job[0])), level)
+            for (folder_id, root_name), children in listings:
+                rows = [to_row(item, folder_id, root_name) for item in children]
+                for row in rows:
+                    # Cegah loop jika satu folder punya beberapa parent
+                    if row[7] and row[0] not in seen_folders:
+                        seen_folders.add(row[0])
+                        pending.append((row[0], root_name))
+                yield rows
+
+
+def _batches(rows: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def full_sync(db_path: str = DATABASE_PATH, api=None, roots: Dict[str, str] = ROOT_FOLDERS) -> Dict:
+    """Re-crawl all roots and make `files` match Drive exactly.
+
+    The Changes API token is taken *before* the crawl, so anything that
+    changes while we walk is replayed by the next incremental_sync.
+    """
+    api = api or DriveAPI()
+    started = time.perf_counter()
+    page_token = api.get_start_page_token()
+
+    rows: List[FileRow] = []
+    for folder_rows in crawl(api, [(folder_id, name) for name, folder_id in roots.items()]):
+        rows.extend(folder_rows)
+
+    with db.connection(db_path) as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS sync_seen (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.sync_seen")
+        for batch in _batches(rows):
+            conn.executemany(UPSERT_FILE, batch)
+            conn.executemany("INSERT OR IGNORE INTO temp.sync_seen (id) VALUES (?)",
+                             [(row[0],) for row in batch])
+        removed = conn.execute(
+            "DELETE FROM files WHERE id NOT IN (SELECT id FROM temp.sync_seen)"
+        ).rowcount
+        conn.execute("DROP TABLE temp.sync_seen")
+        rebuild_paths(conn)
+        refresh_folder_stats(conn)
+        set_state(conn, "page_token", page_token)
+        set_state(conn, "last_full_sync", str(int(time.time())))
+    write_generation_stamp(db_path)
+
+    return {
+        "mode": "full",
+        "files": len(rows),
+        "removed": removed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def incremental_sync(db_path: str = DATABASE_PATH, api=None, roots: Dict[str, str] = ROOT_FOLDERS) -> Dict:
+    """Apply Drive changes since the stored page token (full_sync if none)"""
+    api = api or DriveAPI()
+    with db.connection(db_path, readonly=True) as conn:
+        page_token = get_state(conn, "page_token")
+    if not page_token:
+        return full_sync(db_path, api, roots)
+
+    started = time.perf_counter()
+    changes, new_token = api.list_changes(page_token)
+    # Satu file bisa muncul beberapa kali; yang terakhir yang berlaku
+    latest: Dict[str, Dict] = {}
+    for change in changes:
+        latest[change["fileId"]] = change
+
+    with db.connection(db_path, readonly=True) as conn:
+        upserts, deletes, retag, new_folders = _plan_changes(conn, latest, roots)
+    # Folder yang masuk dari luar root membawa isi yang tidak muncul di changes
+    for folder_rows in crawl(api, new_folders):
+        upserts.extend(folder_rows)
+
+    with db.connection(db_path) as conn:
+        for batch in _batches(deletes):
+            conn.executemany(DELETE_SUBTREE, [(file_id,) for file_id in batch])
+        for batch in _batches(upserts):
+            conn.executemany(UPSERT_FILE, batch)
+        # Folder yang pindah ke root lain: isinya ikut berganti root_folder_name
+        if retag:
+            conn.executemany(RETAG_SUBTREE, retag)
+        # Path baris baru / yang dipindah, termasuk seluruh isi folder yang dipindah
+        update_paths(conn, [row[0] for row in upserts])
+        refresh_folder_stats(conn)
+        set_state(conn, "page_token", new_token)
+        set_state(conn, "last_sync", str(int(time.time())))
+    write_generation_stamp(db_path)
+
+    return {
+        "mode": "incremental",
+        "changes": len(changes),
+        "upserted": len(upserts),
+        "removed": len(deletes),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def _plan_changes(conn: sqlite3.Connection, latest: Dict[str, Dict], roots: Dict[str, str]):
+    """Turn a batch of changes into (rows to upsert, ids to delete, folders
+    to retag, folders new to the catalogue that must be crawled).
+
+    A file belongs to the catalogue if its parent is a root, a known folder,
+    or a folder created in the same batch. Anything else (removed, trashed,
+    moved outside the roots) is deleted together with its subtree.
+    """
+    root_by_id = {folder_id: name for name, folder_id in roots.items()}
+    resolved: Dict[str, Optional[str]] = {}
+
+    def root_of(folder_id: str, depth: int = 0) -> Optional[str]:
+        if folder_id in root_by_id:
+            return root_by_id[folder_id]
+        if folder_id in resolved:
+            return resolved[folder_id]
+        resolved[folder_id] = None  # cegah siklus
+        change = latest.get(folder_id)
+        if change is not None:
+            item = change.get("file") or {}
+            if (not change.get("removed") and not item.get("trashed")
+                    and item.get("mimeType") == FOLDER_MIME and item.get("parents") and depth < 64):
+                resolved[folder_id] = root_of(item["parents"][0], depth + 1)
+        else:
+            # Telusuri leluhur: folder di atasnya mungkin ikut dihapus/dipindah di batch ini
+            row = conn.execute(
+                "SELECT parent_id FROM files WHERE id = ? AND is_directory = 1", (folder_id,)
+            ).fetchone()
+            if row and row[0] and depth < 64:
+                resolved[folder_id] = root_of(row[0], depth + 1)
+        return resolved[folder_id]
+
+    upserts: List[FileRow] = []
+    deletes: List[str] = []
+    retag: List[Tuple[str, str]] = []
+    new_folders: List[Tuple[str, str]] = []
+    for file_id, change in latest.items():
+        item = change.get("file") or {}
+        parents = item.get("parents") or []
+        root_name = None
+        if not change.get("removed") and not item.get("trashed") and parents:
+            root_name = root_of(parents[0])
+        if root_name is None:
+            deletes.append(file_id)
+            continue
+
+        row = to_row(item, parents[0], root_name)
+        if row[7]:
+            old = conn.execute(
+                "SELECT root_folder_name FROM files WHERE id = ?", (file_id,)
+            ).fetchone()
+            if old is None:
+                new_folders.append((file_id, root_name))
+            elif old[0] != root_name:
+                retag.append((file_id, root_name))
+        upserts.append(row)
+    return upserts, deletes, retag, new_folders
+
+
+def sync(db_path: str = DATABASE_PATH, api=None, full: bool = False) -> Dict:
+    if full:
+        return full_sync(db_path, api)
+    return incremental_sync(db_path, api)
+
+
+if __name__ == '__main__':
+    # python drive_sync.py              -> sync delta (full crawl jika belum pernah)
+    # python drive_sync.py --full       -> crawl ulang semua root
+    # python drive_sync.py --loop 300   -> sync delta setiap 5 menit
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Sync the files catalogue from Google Drive")
+    parser.add_argument("--full", action="store_true", help="re-crawl every root folder")
+    parser.add_argument("--loop", type=int, default=0, help="repeat every N seconds")
+    args = parser.parse_args()
+
+    run_migrations(DATABASE_PATH)
+    while True:
+        try:
+            print(sync(DATABASE_PATH, full=args.full))
+        except Exception as e:
+            print(f"Error syncing from Drive: {e}")
+        if not args.loop:
+            break
+        args.full = False
+        time.sleep(args.loop)
@@ -0,0 +1,169 @@
+"""
+Fake DANA
+Local HTTP stand-in for the DANA endpoints DANAPaymentGateway calls
+(OAuth token, create order, order status), with configurable latency and
+transient failures, for offline checkout load tests.
+
+Run: python fake_dana.py [--port 8765] [--latency 0.05] [--error-rate 0.05]
+     then start the app with DANA_BASE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+STATUS_PATH = re.compile(r"^/payment/orders/v1/([^/]+)/status$")
+
+
+class FakeDana:
+    """Order book and failure knobs shared by the request handlers.
+
+    `error_rate` of the requests answer 503 (with Retry-After: 0) before
+    doing anything, like a sandbox under load. Orders created here stay
+    PENDING until `settle()` marks them COMPLETED (or `auto_settle`
+    settles them on the first status check).
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, auto_settle: bool = False,
+                 token_ttl: int = 3600, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.auto_settle = auto_settle
+        self.token_ttl = token_ttl
+        self.orders: Dict[str, Dict] = {}
+        self.calls: Dict[str, int] = {}
+        self.connections = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> bool:
+        """Record a call; False if this one should fail"""
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return self._rng.random() >= self.error_rate
+
+    def settle(self, order_id: str, status: str = "COMPLETED"):
+        with self._lock:
+            self.orders[order_id]["status"] = status
+
+
+def make_handler(fake: FakeDana):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 agar client bisa memakai ulang koneksi (keep-alive)
+        protocol_version = "HTTP/1.1"
+        # Header dan body dikirim terpisah: tanpa ini keep-alive kena jeda Nagle/delayed ACK
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with fake._lock:
+                fake.connections += 1
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: Dict, headers: Optional[Dict] = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _serve(self, name: str, handler):
+            body = self._body()
+            if fake.latency:
+                time.sleep(fake.latency)
+            if not fake.count(name):
+                self._send(503, {"error": "Service temporarily unavailable"}, {"Retry-After": "0"})
+                return
+            handler(body)
+
+        def do_POST(self):
+            if self.path == "/oauth2/token":
+                self._serve("token", self._token)
+            elif self.path == "/payment/orders/v1/create":
+                self._serve("create_payment_order", self._create)
+            else:
+                self._send(404, {"error": "Not found"})
+
+        def do_GET(self):
+            match = STATUS_PATH.match(self.path)
+            if match:
+                self._serve("verify_payment", lambda body: self._status(match.group(1)))
+            else:
+                self._send(404, {"error": "Not found"})
+
+        def _token(self, body: bytes):
+            form = parse_qs(body.decode())
+            if form.get("grant_type") != ["client_credentials"]:
+                self._send(400, {"error": "unsupported_grant_type"})
+                return
+            self._send(200, {"access_token": uuid.uuid4().hex, "token_type": "Bearer",
+                             "expires_in": fake.token_ttl})
+
+        def _create(self, body: bytes):
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self._send(401, {"error": "Unauthorized"})
+                return
+            data = json.loads(body or b"{}")
+            order_id = data.get("orderId")
+            with fake._lock:
+                order = fake.orders.setdefault(order_id, {
+                    "orderId": f"dana_{uuid.uuid4().hex[:16]}",
+                    "status": "PENDING",
+                    "orderAmount": data.get("orderAmount"),
+                })
+            self._send(200, {"orderId": order["orderId"],
+                             "paymentUrl": f"http://127.0.0.1/fake-dana/pay/{order['orderId']}"})
+
+        def _status(self, order_id: str):
+            with fake._lock:
+                order = fake.orders.get(order_id)
+                if order and fake.auto_settle:
+                    order["status"] = "COMPLETED"
+            if order is None:
+                self._send(404, {"error": "Order not found"})
+                return
+            self._send(200, {"orderId": order_id, "status": order["status"],
+                             "orderAmount": order["orderAmount"]})
+
+    return Handler
+
+
+def serve(fake: FakeDana, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the fake in a daemon thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake DANA API for offline checkout tests")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument("--auto-settle", action="store_true", help="orders become COMPLETED on first status check")
+    args = parser.parse_args()
+
+    fake = FakeDana(latency=args.latency, error_rate=args.error_rate, auto_settle=args.auto_settle)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"Fake DANA on http://127.0.0.1:{args.port} (latency {args.latency}s, errors {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Calls: {fake.calls}, connections: {fake.connections}")
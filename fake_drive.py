@@ -0,0 +1,242 @@
+"""
+Fake Drive
+In-memory stand-in for DriveAPI (files.list + Changes API) to exercise
+drive_sync without credentials or network access.
+
+Run: python fake_drive.py [--folders 200] [--files 12000] [--latency 0.05]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from drive_sync import FOLDER_MIME, full_sync, incremental_sync
+
+
+class FakeDrive:
+    """Drive tree held in a dict, with a change log like changes.list.
+
+    Every mutation appends a change; page tokens are positions in that log.
+    `latency` adds a sleep per API call so parallel crawling can be measured.
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 1000):
+        self.latency = latency
+        self.page_size = page_size
+        self.items: Dict[str, Dict] = {}
+        self.changes: List[Dict] = []
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    # === Mutasi ===
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return f"fake{self._next_id:07d}"
+
+    def _record(self, file_id: str, removed: bool = False):
+        item = self.items.get(file_id)
+        self.changes.append({
+            "fileId": file_id,
+            "removed": removed,
+            "file": dict(item) if item and not removed else None,
+        })
+
+    def add_folder(self, name: str, parent_id: str, file_id: Optional[str] = None) -> str:
+        file_id = file_id or self._new_id()
+        self.items[file_id] = {
+            "id": file_id, "name": name, "mimeType": FOLDER_MIME,
+            "modifiedTime": "2025-01-01T00:00:00.000Z", "parents": [parent_id], "trashed": False,
+        }
+        self._record(file_id)
+        return file_id
+
+    def add_file(self, name: str, parent_id: str, size: int = 1024,
+                 mime_type: str = "application/pdf") -> str:
+        file_id = self._new_id()
+        self.items[file_id] = {
+            "id": file_id, "name": name, "mimeType": mime_type, "size": str(size),
+            "modifiedTime": "2025-01-01T00:00:00.000Z", "parents": [parent_id], "trashed": False,
+        }
+        self._record(file_id)
+        return file_id
+
+    def update(self, file_id: str, **fields):
+        self.items[file_id].update(fields)
+        self.items[file_id]["modifiedTime"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        self._record(file_id)
+
+    def move(self, file_id: str, new_parent_id: str):
+        self.update(file_id, parents=[new_parent_id])
+
+    def trash(self, file_id: str):
+        # Drive hanya mencatat perubahan untuk item yang di-trash, bukan isinya
+        self.update(file_id, trashed=True)
+
+    def delete(self, file_id: str):
+        del self.items[file_id]
+        self._record(file_id, removed=True)
+
+    # === API yang dipakai drive_sync (sama dengan DriveAPI) ===
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def list_children(self, folder_id: str) -> List[Dict]:
+        children = [
+            dict(item) for item in self.items.values()
+            if folder_id in item["parents"] and not item["trashed"]
+        ]
+        # Satu call per halaman, seperti files.list
+        for _ in range(max(1, -(-len(children) // self.page_size))):
+            self._call()
+        return children
+
+    def get_start_page_token(self) -> str:
+        self._call()
+        return str(len(self.changes))
+
+    def list_changes(self, page_token: str) -> Tuple[List[Dict], str]:
+        self._call()
+        return self.changes[int(page_token):], str(len(self.changes))
+
+    # === Hasil yang diharapkan di tabel files ===
+
+    def expected_rows(self, roots: Dict[str, str]) -> Dict[str, tuple]:
+        """{id: (name, parent_id, root_folder_name, is_directory, path)} for
+        every item reachable from the roots through non-trashed folders"""
+        expected = {}
+        pending = [(folder_id, name, f"/{folder_id}/") for name, folder_id in roots.items()]
+        while pending:
+            folder_id, root_name, folder_path = pending.pop()
+            for item in self.list_children_quiet(folder_id):
+                is_directory = item["mimeType"] == FOLDER_MIME
+                path = f"{folder_path}{item['id']}/"
+                expected[item["id"]] = (item["name"], folder_id, root_name, int(is_directory), path)
+                if is_directory:
+                    pending.append((item["id"], root_name, path))
+        return expected
+
+    def list_children_quiet(self, folder_id: str) -> List[Dict]:
+        return [item for item in self.items.values()
+                if folder_id in item["parents"] and not item["trashed"]]
+
+
+def build_tree(drive: FakeDrive, roots: Dict[str, str], folders: int, files: int, seed: int = 1):
+    """Random catalogue shaped like the real one (a few levels of folders)"""
+    rng = random.Random(seed)
+    folder_ids = list(roots.values())
+    for i in range(folders):
+        folder_ids.append(drive.add_folder(f"Folder {i}", rng.choice(folder_ids)))
+    for i in range(files):
+        drive.add_file(f"Manual {i}.pdf", rng.choice(folder_ids), size=rng.randint(1, 50) * 1024 ** 2)
+    return folder_ids
+
+
+def catalogue_rows(db_path: str) -> Dict[str, tuple]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            row[0]: tuple(row[1:])
+            for row in conn.execute(
+                "SELECT id, name, parent_id, root_folder_name, is_directory, path FROM files"
+            )
+        }
+    finally:
+        conn.close()
+
+
+def check(folders: int = 200, files: int = 12000, latency: float = 0.0) -> bool:
+    """Full crawl, then a batch of edits synced as deltas; both must match
+    the fake tree exactly. Returns True if they do."""
+    from migrations import run_migrations
+
+    roots = {"EBOOKS": "rootA", "Pengetahuan": "rootB", "Service_Manual_1": "rootC"}
+    drive = FakeDrive(latency=latency)
+    folder_ids = build_tree(drive, roots, folders, files)
+
+    fd, db_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    ok = True
+    try:
+        run_migrations(db_path)
+        drive.calls = 0
+        result = full_sync(db_path, drive, roots)
+        print(f"full sync: {result} ({drive.calls} API calls)")
+        ok &= _compare("full sync", drive.expected_rows(roots), catalogue_rows(db_path))
+        ok &= _stats_fresh("full sync", db_path)
+
+        # Perubahan kecil: rename, pindah antar root, trash folder, hapus, folder baru
+        rng = random.Random(2)
+        subfolders = folder_ids[len(roots):]
+        for file_id in rng.sample([i for i in drive.items if i not in subfolders], 20):
+            drive.update(file_id, name=drive.items[file_id]["name"] + " (rev)")
+        drive.move(subfolders[5], "rootC")
+        drive.move(subfolders[20], subfolders[30])
+        drive.trash(subfolders[10])
+        drive.delete(subfolders[15])
+        outside = drive.add_folder("Outside", "not-synced")
+        drive.add_file("Brought in.pdf", outside)
+        drive.move(outside, "rootB")
+        new_folder = drive.add_folder("New folder", "rootA")
+        drive.add_file("New manual.pdf", new_folder)
+
+        drive.calls = 0
+        result = incremental_sync(db_path, drive, roots)
+        print(f"incremental sync: {result} ({drive.calls} API calls)")
+        ok &= _compare("incremental sync", drive.expected_rows(roots), catalogue_rows(db_path))
+        ok &= _stats_fresh("incremental sync", db_path)
+
+        result = incremental_sync(db_path, drive, roots)
+        ok &= result["changes"] == 0
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(db_path + suffix)
+            except OSError:
+                pass
+    print("✅ catalogue matches fake Drive" if ok else "❌ catalogue differs from fake Drive")
+    return ok
+
+
+def _compare(label: str, expected: Dict[str, tuple], actual: Dict[str, tuple]) -> bool:
+    missing = expected.keys() - actual.keys()
+    extra = actual.keys() - expected.keys()
+    wrong = [k for k in expected.keys() & actual.keys() if expected[k] != actual[k]]
+    if missing or extra or wrong:
+        print(f"❌ {label}: {len(missing)} missing, {len(extra)} extra, {len(wrong)} different")
+        return False
+    return True
+
+
+def _stats_fresh(label: str, db_path: str) -> bool:
+    """folder_stats must be committed by the sync itself, not left to page renders"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = dict(conn.execute(
+            "SELECT key, value FROM catalogue_meta WHERE key IN ('generation', 'folder_stats_generation')"
+        ).fetchall())
+    finally:
+        conn.close()
+    if rows.get('generation') != rows.get('folder_stats_generation'):
+        print(f"❌ {label}: folder_stats is behind the catalogue generation")
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check drive_sync against an in-memory Drive")
+    parser.add_argument("--folders", type=int, default=200)
+    parser.add_argument("--files", type=int, default=12000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per fake API call")
+    args = parser.parse_args()
+    raise SystemExit(0 if check(args.folders, args.files, args.latency) else 1)
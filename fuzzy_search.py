@@ -0,0 +1,230 @@
+"""
+Fuzzy Search
+Typo-tolerant name search ("serivce manual", "avnza 1nr") over the token
+vocabulary of the prefix index: trigram candidates, edit-distance check,
+AND across query words, ranked by total edits
+"""
+
+import heapq
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from prefix_index import MappedIndex, PrefixIndex, trigrams
+from search_index import compact_text, tokenize_query
+
+# === Konfigurasi fuzzy search (bisa diatur lewat environment) ===
+FUZZY_SEARCH_ENABLED = os.environ.get('FUZZY_SEARCH_ENABLED', 'true').lower() == 'true'
+# Batas hasil untuk halaman /search
+FUZZY_MAX_RESULTS = int(os.environ.get('FUZZY_MAX_RESULTS', 200))
+# Batas token per awalan hasil pertukaran huruf (kata terakhir)
+MAX_SWAP_TOKENS = 64
+
+
+def max_edits(word: str) -> int:
+    """Typos tolerated in a query word: none for short codes like "1nr" """
+    if len(word) <= 3:
+        return 0
+    return 1 if len(word) <= 6 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (a swap of two letters is one
+    edit). Returns limit + 1 as soon as the distance must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1,
+                        previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def prefix_distance(word: str, token: str, limit: int) -> int:
+    """Edits between a word still being typed and the closest prefix of token"""
+    lengths = range(max(1, len(word) - limit), min(len(token), len(word) + limit) + 1)
+    return min((edit_distance(word, token[:n], limit) for n in lengths), default=limit + 1)
+
+
+class _Term:
+    """Docs matching one query word: exact/prefix token range plus similar tokens"""
+
+    def __init__(self, index: MappedIndex, lo: int, hi: int, similar: Dict[int, int]):
+        self.index = index
+        self.lo, self.hi = lo, hi
+        self.similar = similar
+        self.size = index.posting_count(lo, hi) + sum(
+            index.posting_count(t, t + 1) for t in similar)
+        self._exact = None
+
+    def exact_docs(self):
+        return self.index.prefix_docs(self.lo, self.hi)
+
+    def exact_set(self) -> set:
+        if self._exact is None:
+            self._exact = set(self.exact_docs())
+        return self._exact
+
+    def similar_docs(self) -> Dict[int, int]:
+        """doc -> edits for docs that only match through a similar token"""
+        docs: Dict[int, int] = {}
+        for token_id, edits in self.similar.items():
+            for doc in self.index.prefix_docs(token_id, token_id + 1):
+                if docs.get(doc, edits + 1) > edits:
+                    docs[doc] = edits
+        return docs
+
+
+class FuzzyMatcher:
+    """Query evaluation against one mapped index"""
+
+    def __init__(self, index: MappedIndex):
+        self.index = index
+
+    def similar_tokens(self, word: str, prefix: bool) -> Dict[int, int]:
+        """Vocabulary tokens within max_edits of `word` -> edits. With
+        prefix=True the word may still be incomplete, so it is compared
+        against token prefixes of about the same length."""
+        limit = max_edits(word)
+        if limit == 0:
+            return {}
+        grams = trigrams(word, prefix=prefix)
+        counts: Counter = Counter()
+        for gram in grams:
+            counts.update(self.index.tokens_with_gram(gram.encode()))
+        # Satu edit mengubah paling banyak tiga trigram, pertukaran huruf empat
+        needed = max(1, len(grams) - 4 * limit)
+
+        candidates = {token_id for token_id, shared in counts.items() if shared >= needed}
+        if prefix:
+            # Kata terakhir bisa juga sudah lengkap ("hnoda" vs "honda")
+            candidates.update(self.index.tokens_with_gram(f"{word[-2:]}$".encode()))
+        # Dua huruf tertukar di awal kata tidak menyisakan trigram yang sama: cari langsung
+        for i in range(len(word) - 1):
+            swapped = (word[:i] + word[i + 1] + word[i] + word[i + 2:]).encode()
+            lo, hi = self.index.token_range(swapped)
+            if not prefix:
+                hi = lo + 1 if lo < hi and self.index.tokens[lo] == swapped else lo
+            candidates.update(range(lo, min(hi, lo + MAX_SWAP_TOKENS)))
+
+        similar = {}
+        for token_id in candidates:
+            token = self.index.tokens[token_id].decode()
+            edits = edit_distance(word, token, limit)
+            if prefix:
+                edits = min(edits, prefix_distance(word, token, limit))
+            if 0 < edits <= limit:
+                similar[token_id] = edits
+        return similar
+
+    def term(self, word: str, prefix: bool) -> Optional[_Term]:
+        encoded = word.encode()
+        lo, hi = self.index.token_range(encoded)
+        if not prefix:
+            # Kata lengkap: hanya token yang sama persis
+            hi = lo + 1 if lo < hi and self.index.tokens[lo] == encoded else lo
+        similar = {} if lo < hi else self.similar_tokens(word, prefix)
+        if lo == hi and not similar:
+            return None
+        return _Term(self.index, lo, hi, similar)
+
+    def search(self, query: str, limit: int, files_only: bool = False) -> List[Tuple[int, int]]:
+        """[(doc, edits)] for docs matching every query word, fewest edits
+        first, then shortest name"""
+        results = self._search(tokenize_query(query), limit, files_only)
+        if not results and ('-' in query or '.' in query):
+            # "1nr-fe" / "1nr.fe" juga dicoba sebagai satu kode "1nrfe"
+            results = self._search(tokenize_query(compact_text(query)), limit, files_only)
+        return results
+
+    def _search(self, words: List[str], limit: int, files_only: bool) -> List[Tuple[int, int]]:
+        if not words:
+            return []
+        terms = []
+        for i, word in enumerate(words):
+            term = self.term(word, prefix=i == len(words) - 1)
+            if term is None:
+                return []
+            terms.append(term)
+        terms.sort(key=lambda t: t.size)
+
+        # exact: doc yang cocok tanpa typo sejauh ini; edited: doc -> jumlah edit
+        first = terms[0]
+        exact = set(first.exact_docs())
+        edited = {doc: edits for doc, edits in first.similar_docs().items() if doc not in exact}
+        for term in terms[1:]:
+            if not exact and not edited:
+                break
+            similar = term.similar_docs()
+            next_edited = {
+                doc: similar[doc] for doc in exact.intersection(similar)
+            } if similar else {}
+            exact.intersection_update(term.exact_docs())
+            next_edited = {doc: edits for doc, edits in next_edited.items() if doc not in exact}
+            if edited:
+                exact_set = term.exact_set()
+                for doc, edits in edited.items():
+                    if doc in exact_set:
+                        next_edited[doc] = edits
+                    elif doc in similar:
+                        next_edited[doc] = edits + similar[doc]
+            edited = next_edited
+
+        # Doc bernomor kecil = nama lebih pendek (urutan build prefix_index)
+        exact_docs = sorted(exact) if files_only else heapq.nsmallest(limit, exact)
+        ranked = heapq.merge(((0, doc) for doc in exact_docs),
+                             sorted((edits, doc) for doc, edits in edited.items()))
+        results = []
+        for edits, doc in ranked:
+            if files_only and self.index.docs.blob[self.index.docs.offsets[doc]]:
+                continue
+            results.append((doc, edits))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class FuzzySearch:
+    """Per-worker entry point; follows the PrefixIndex's current mapping"""
+
+    def __init__(self, prefix_index: PrefixIndex, enabled: bool = FUZZY_SEARCH_ENABLED):
+        self.prefix_index = prefix_index
+        self.enabled = enabled
+        self._stats = {"queries": 0, "unavailable": 0}
+
+    def search(self, query: str, limit: int = FUZZY_MAX_RESULTS,
+               files_only: bool = False) -> Optional[List[Dict]]:
+        """Matching files as {id, name, is_directory, mime_type, edits},
+        or None while the index is not available"""
+        index = self.prefix_index.current() if self.enabled else None
+        if index is None:
+            self._stats["unavailable"] += 1
+            return None
+        self._stats["queries"] += 1
+        matches = FuzzyMatcher(index).search(query, limit, files_only)
+        return [dict(index.doc(doc), edits=edits) for doc, edits in matches]
+
+    def stats(self) -> Dict:
+        return dict(self._stats, enabled=self.enabled)
+
+
+def load_rows(conn, matches: Sequence[Dict], columns: str = "f.*") -> List:
+    """Fetch `files` rows (aliased `f`) for fuzzy matches, keeping their order"""
+    if not matches:
+        return []
+    ids = [m['id'] for m in matches]
+    rows = conn.execute(
+        f"SELECT {columns}, f.id AS _match_id FROM files f WHERE f.id IN ({','.join('?' * len(ids))})",
+        ids,
+    ).fetchall()
+    by_id = {row['_match_id']: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
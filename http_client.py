@@ -0,0 +1,163 @@
+"""
+HTTP Client
+Pooled keep-alive session for outbound API calls (DANA), with bounded
+jittered retries and per-call latency histograms
+"""
+
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, NewConnectionError
+
+# === Konfigurasi client (bisa diatur lewat environment) ===
+# Koneksi keep-alive per worker ke satu host
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+# Percobaan ulang maksimal (di luar percobaan pertama)
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+# Backoff: acak antara 0 dan min(MAX, BASE * 2^percobaan) detik
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', 0.2))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', 2.0))
+# (connect, read) timeout dalam detik
+HTTP_TIMEOUT = (float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+                float(os.environ.get('HTTP_READ_TIMEOUT', 10)))
+
+# Status yang layak dicoba ulang untuk panggilan idempotent
+RETRY_STATUSES = {429, 502, 503, 504}
+# Batas atas bucket histogram (ms); bucket terakhir = lebih lambat dari itu
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram for one call name"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+
+    def observe(self, elapsed_ms: float, ok: bool, retries: int):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+        self.calls += 1
+        self.errors += not ok
+        self.retries += retries
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound (ms) of the bucket holding the q-th percentile"""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{b}" for b in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def never_sent(error: Exception) -> bool:
+    """True if the connection could not be opened, so the request never
+    reached the server and is safe to resend even when it is not idempotent"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests membungkus MaxRetryError dari urllib3; penyebab aslinya di .reason
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class HTTPClient:
+    """One keep-alive session per base URL and worker process.
+
+    `idempotent=True` calls are retried on connection errors, timeouts and
+    429/502/503/504 (honouring Retry-After up to HTTP_BACKOFF_MAX). Other
+    calls are retried only when the connection could not be opened, since
+    then the request never reached the server. Every call, retried or not,
+    lands in the latency histogram of its `name`.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = HTTP_POOL_SIZE,
+                 max_retries: int = HTTP_MAX_RETRIES, backoff_base: float = HTTP_BACKOFF_BASE,
+                 backoff_max: float = HTTP_BACKOFF_MAX, timeout=HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Retry diatur di request() agar jitter dan histogram konsisten
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.backoff_max, float(retry_after)))
+        return delay
+
+    def request(self, name: str, method: str, path: str, idempotent: bool = False,
+                **kwargs) -> requests.Response:
+        """Send a request; raises the last error once retries are exhausted.
+        The caller still decides what a non-retryable status means
+        (raise_for_status)."""
+        kwargs.setdefault("timeout", self.timeout)
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        started = time.perf_counter()
+        attempt = 0
+        ok = False
+        try:
+            while True:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt >= self.max_retries or not (idempotent or never_sent(e)):
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                if idempotent and response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    delay = self._backoff(attempt, response)
+                    response.close()
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                ok = response.status_code < 400
+                return response
+        finally:
+            self._observe(name, (time.perf_counter() - started) * 1000, ok, attempt)
+
+    def _observe(self, name: str, elapsed_ms: float, ok: bool, retries: int):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(elapsed_ms, ok, retries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {name: h.snapshot() for name, h in self._histograms.items()}
@@ -0,0 +1,178 @@
+"""
+Database Migrations
+Versioned schema changes for the `files` catalogue (and the payment
+tables sharing its database), applied at startup
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from config import DATABASE_PATH
+from blob_cache import create_download_stats_table
+from catalogue import (
+    create_catalogue_tables, create_listing_index, create_path_column, create_sync_state_table,
+    rebuild_folder_stats, refresh_folder_stats
+)
+from order_manager import (
+    create_checkout_tables, create_order_indexes, create_reconcile_column, create_webhook_index
+)
+from order_rollups import create_rollup_tables, rebuild_rollups
+from search_index import create_search_index, refresh_search_index, replace_search_triggers
+from status_bus import create_status_event_table
+
+
+# === Daftar migrasi ===
+# Setiap migrasi punya nomor versi berurutan dan disimpan di PRAGMA user_version.
+# Jangan ubah migrasi yang sudah dirilis; tambahkan migrasi baru di akhir.
+
+def _files_table(conn: sqlite3.Connection):
+    """Base `files` table (filled by drive_sync.py)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS files (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        mime_type TEXT,
+        size INTEGER DEFAULT 0,
+        modified_time TEXT,
+        parent_id TEXT,
+        root_folder_name TEXT,
+        is_directory BOOLEAN DEFAULT 0
+    )
+    """)
+
+
+def _files_indexes(conn: sqlite3.Connection):
+    """Indexes for folder listings, sibling lookups and root counts"""
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_files_parent_listing
+    ON files(parent_id, is_directory DESC, name)
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_files_root_folder
+    ON files(root_folder_name)
+    """)
+
+
+def _files_search_index(conn: sqlite3.Connection):
+    """FTS5 name index (skipped on SQLite builds without FTS5)"""
+    if not create_search_index(conn):
+        print('Notice: SQLite build has no FTS5, search falls back to LIKE scans')
+
+
+def _catalogue_stats(conn: sqlite3.Connection):
+    """Catalogue generation stamp and materialized folder_stats"""
+    create_catalogue_tables(conn)
+    rebuild_folder_stats(conn)
+    conn.execute("""
+    UPDATE catalogue_meta
+    SET value = (SELECT value FROM catalogue_meta WHERE key = 'generation')
+    WHERE key = 'folder_stats_generation'
+    """)
+
+
+def _path_column(conn: sqlite3.Connection):
+    """files.path; filling it bumps the generation, so folder_stats is
+    stamped again (same invariant drive_sync keeps)"""
+    create_path_column(conn)
+    refresh_folder_stats(conn)
+
+
+def _has_table(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def _orders_indexes(conn: sqlite3.Connection):
+    """Order indexes and dashboard rollups for payment tables created by an
+    older init_payment_db (nothing to do before the first init)"""
+    if not _has_table(conn, 'orders'):
+        return
+    create_order_indexes(conn)
+    create_rollup_tables(conn)
+    rebuild_rollups(conn)
+
+
+def _webhook_queue_index(conn: sqlite3.Connection):
+    """Queue index on payment_webhooks (the webhook worker claims RECEIVED rows)"""
+    if _has_table(conn, 'payment_webhooks'):
+        create_webhook_index(conn)
+
+
+def _reconcile_column(conn: sqlite3.Connection):
+    """orders.reconciled_at for the background reconciler"""
+    if _has_table(conn, 'orders'):
+        create_reconcile_column(conn)
+
+
+def _checkout_tables(conn: sqlite3.Connection):
+    """orders.payment_url and the checkout_jobs queue"""
+    if _has_table(conn, 'orders'):
+        create_checkout_tables(conn)
+
+
+def _status_events(conn: sqlite3.Connection):
+    """order_status_events feed for the status bus (SSE / long-poll)"""
+    if _has_table(conn, 'orders'):
+        create_status_event_table(conn)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "files table", _files_table),
+    (2, "files indexes", _files_indexes),
+    (3, "files search index", _files_search_index),
+    (4, "catalogue generation and folder stats", _catalogue_stats),
+    (5, "download stats", create_download_stats_table),
+    (6, "drive sync state", create_sync_state_table),
+    (7, "search index triggers for upserts", replace_search_triggers),
+    (8, "covering index for paginated folder listings", create_listing_index),
+    (9, "materialized folder paths", _path_column),
+    (10, "orders indexes and dashboard rollups", _orders_indexes),
+    (11, "webhook queue index", _webhook_queue_index),
+    (12, "orders reconcile column", _reconcile_column),
+    (13, "async checkout jobs", _checkout_tables),
+    (14, "order status events", _status_events),
+    (15, "search compact column also strips dots", refresh_search_index),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(db_path: str = DATABASE_PATH) -> int:
+    """Apply pending migrations and return the resulting schema version.
+
+    Safe to call from every gunicorn worker at once: the first worker takes
+    the write lock with BEGIN IMMEDIATE, the others wait for it and then see
+    the updated user_version and have nothing left to do.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        current = get_schema_version(conn)
+        if current >= MIGRATIONS[-1][0]:
+            return current
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Baca ulang di dalam lock, worker lain mungkin sudah selesai
+            current = get_schema_version(conn)
+            for version, description, migrate in MIGRATIONS:
+                if version <= current:
+                    continue
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                print(f"✅ Migration {version} applied: {description}")
+                current = version
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return current
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    # python migrations.py -> terapkan migrasi (cek query plan: python query_plans.py)
+    print(f"Schema version: {run_migrations(DATABASE_PATH)}")
@@ -0,0 +1,185 @@
+"""
+Order Export
+Streams `orders` as CSV, NDJSON or Parquet (optionally gzip-compressed) in
+fixed-size row chunks, so memory stays flat whatever the history size
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import db
+
+# === Konfigurasi export (bisa diatur lewat environment) ===
+# Baris per fetchmany() / per row group Parquet
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 2000))
+
+COLUMNS = ("id", "user_email", "product_name", "amount", "status", "created_at", "completed_at")
+CSV_HEADER = ("Order ID", "Email", "Product", "Amount", "Status", "Created", "Completed")
+
+# format -> (mimetype, ekstensi file)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(ValueError):
+    """Invalid export request (unknown format, bad date, missing pyarrow)"""
+
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid date: {value!r} (expected YYYY-MM-DD)")
+
+
+def build_query(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                status: Optional[str] = None) -> Tuple[str, list]:
+    """SELECT for the export; both dates are inclusive days and become a
+    half-open created_at range served by idx_orders_created /
+    idx_orders_status_created"""
+    where, params = [], []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if date_from:
+        where.append("created_at >= ?")
+        params.append(date_from.isoformat())
+    if date_to:
+        where.append("created_at < ?")
+        params.append((date_to + timedelta(days=1)).isoformat())
+    sql = f"SELECT {', '.join(COLUMNS)} FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY created_at DESC", params
+
+
+def iter_batches(db_path: str, sql: str, params: list,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[tuple]]:
+    """Row batches from one read transaction; the connection is held until
+    the generator is exhausted or closed"""
+    with db.connection(db_path, readonly=True) as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+
+# === Encoder per format ===
+
+def csv_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_HEADER)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    for rows in batches:
+        yield "".join(encode(dict(zip(COLUMNS, row))) + "\n" for row in rows).encode()
+
+
+class _DrainSink:
+    """Write-only file object whose bytes are handed out after each row group"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def parquet_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """One Parquet row group per batch (needs pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(name, pa.float64() if name == "amount" else pa.string()) for name in COLUMNS])
+    sink = _DrainSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": csv_chunks, "ndjson": ndjson_chunks, "parquet": parquet_chunks}
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = header gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_orders(db_path: str, fmt: str = "csv", date_from: Optional[str] = None,
+                  date_to: Optional[str] = None, status: Optional[str] = None,
+                  compress: bool = False) -> Iterator[bytes]:
+    """Validate the request and return the byte stream. Parameter errors
+    raise ExportError here, before the first row is read."""
+    if fmt not in ENCODERS:
+        raise ExportError(f"Unknown export format: {fmt!r}")
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+    sql, params = build_query(parse_day(date_from), parse_day(date_to), status or None)
+    chunks = ENCODERS[fmt](iter_batches(db_path, sql, params))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(fmt: str, compress: bool) -> str:
+    return f"orders.{FORMATS[fmt][1]}" + (".gz" if compress else "")
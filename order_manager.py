@@ -7,8 +7,17 @@ import sqlite3
 from datetime import datetime
 from typing import Optional, List, Dict
 
+import db
+from config import DATABASE_PATH
+from order_rollups import create_rollup_tables, rebuild_rollups
+from status_bus import create_status_event_table, status_bus
 
-def init_payment_db(db_path: str = "database.db"):
+# Status akhir order: tidak diubah lagi oleh notifikasi yang datang terlambat,
+# dan klien SSE / long-poll berhenti menunggu begitu status ini tercapai
+FINAL_STATUSES = {"COMPLETED", "FAILED"}
+
+
+def init_payment_db(db_path: str = DATABASE_PATH):
     """Initialize payment tables in existing database"""
     
     conn = sqlite3.connect(db_path)
@@ -80,15 +89,75 @@ def init_payment_db(db_path: str = "database.db"):
     )
     """)
     
+    create_order_indexes(conn)
+    create_webhook_index(conn)
+    create_reconcile_column(conn)
+    create_checkout_tables(conn)
+    create_status_event_table(conn)
+    
+    # Rollup dashboard (dijaga trigger); isi sekali untuk database lama
+    create_rollup_tables(conn)
+    if not conn.execute("SELECT 1 FROM order_daily_rollup LIMIT 1").fetchone():
+        rebuild_rollups(conn)
+    
     conn.commit()
     conn.close()
     print("✅ Payment database tables initialized")
 
 
+def create_order_indexes(conn: sqlite3.Connection):
+    """Indexes for order listings, date ranges and per-user lookups"""
+    # Laporan per status dalam rentang waktu: status = ? AND created_at >= ? AND created_at < ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)")
+    # Detail user & trigger rollup per user
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_email, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_product_status ON orders(product_id, status)")
+    # Order terbaru & export per rentang tanggal
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)")
+
+
+def create_webhook_index(conn: sqlite3.Connection):
+    """payment_webhooks doubles as the webhook queue: claim RECEIVED events oldest first"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payment_webhooks_status ON payment_webhooks(status, created_at)")
+
+
+def create_reconcile_column(conn: sqlite3.Connection):
+    """orders.reconciled_at: last time the reconciler asked DANA about the order"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(orders)")]
+    if 'reconciled_at' not in columns:
+        conn.execute("ALTER TABLE orders ADD COLUMN reconciled_at TIMESTAMP")
+
+
+def create_checkout_tables(conn: sqlite3.Connection):
+    """Async checkout: orders.payment_url and the checkout_jobs queue"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(orders)")]
+    if 'payment_url' not in columns:
+        conn.execute("ALTER TABLE orders ADD COLUMN payment_url TEXT")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS checkout_jobs (
+        order_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'QUEUED',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        amount REAL NOT NULL,
+        title TEXT,
+        description TEXT,
+        notify_url TEXT,
+        return_url TEXT,
+        error TEXT,
+        run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (order_id) REFERENCES orders(id)
+    )
+    """)
+    # Worker mengambil job QUEUED yang sudah jatuh tempo / memarkir RUNNING yang macet
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkout_jobs_status ON checkout_jobs(status, run_after)")
+
+
 class OrderManager:
     """Manage orders and payment records"""
     
-    def __init__(self, db_path: str = "database.db"):
+    def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
     
     def create_order(self, 
@@ -102,108 +171,99 @@ class OrderManager:
                     notes: str = None) -> Dict:
         """Create new order"""
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
-            INSERT INTO orders 
-            (id, user_id, user_email, product_id, product_name, product_type, amount, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (order_id, user_id, user_email, product_id, product_name, product_type, amount, notes))
+            with db.connection(self.db_path) as conn:
+                conn.execute("""
+                INSERT INTO orders 
+                (id, user_id, user_email, product_id, product_name, product_type, amount, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (order_id, user_id, user_email, product_id, product_name, product_type, amount, notes))
             
-            conn.commit()
             return {"success": True, "order_id": order_id}
         except Exception as e:
             print(f"Error creating order: {e}")
             return {"success": False, "error": str(e)}
-        finally:
-            conn.close()
     
     def get_order(self, order_id: str) -> Optional[Dict]:
         """Get order details"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-        order = cursor.fetchone()
-        conn.close()
+        with db.connection(self.db_path, readonly=True) as conn:
+            order = conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
         
         return dict(order) if order else None
     
     def update_order_status(self, order_id: str, status: str, dana_order_id: str = None) -> bool:
         """Update order status"""
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            if dana_order_id:
-                cursor.execute("""
-                UPDATE orders 
-                SET status = ?, dana_order_id = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-                """, (status, dana_order_id, order_id))
-            else:
-                cursor.execute("""
-                UPDATE orders 
-                SET status = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-                """, (status, order_id))
+            with db.connection(self.db_path) as conn:
+                self.write_status(conn, order_id, status, dana_order_id)
+            status_bus.wake()
             
-            if status == "COMPLETED":
-                cursor.execute("""
-                UPDATE orders SET completed_at = CURRENT_TIMESTAMP WHERE id = ?
-                """, (order_id,))
-            
-            conn.commit()
             return True
         except Exception as e:
             print(f"Error updating order: {e}")
             return False
-        finally:
-            conn.close()
     
-    def get_user_orders(self, user_id: str, limit: int = 50) -> List[Dict]:
-        """Get user's orders"""
+    def write_status(self, conn: sqlite3.Connection, order_id: str, status: str,
+                     dana_order_id: str = None):
+        """Status update inside the caller's transaction (batched webhook/reconcile writes)"""
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        if dana_order_id:
+            conn.execute("""
+            UPDATE orders 
+            SET status = ?, dana_order_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """, (status, dana_order_id, order_id))
+        else:
+            conn.execute("""
+            UPDATE orders 
+            SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """, (status, order_id))
         
-        cursor.execute("""
-        SELECT * FROM orders 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT ?
-        """, (user_id, limit))
+        if status == "COMPLETED":
+            conn.execute("""
+            UPDATE orders SET completed_at = CURRENT_TIMESTAMP WHERE id = ?
+            """, (order_id,))
+    
+    def write_checkout(self, conn: sqlite3.Connection, order_id: str, dana_order_id: str,
+                       payment_url: Optional[str]):
+        """DANA order created: store its id and payment URL (caller's transaction)"""
         
-        orders = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        conn.execute("""
+        UPDATE orders 
+        SET dana_order_id = ?, payment_url = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        """, (dana_order_id, payment_url, order_id))
+    
+    def get_user_orders(self, user_id: str, limit: int = 50) -> List[Dict]:
+        """Get user's orders"""
+        
+        with db.connection(self.db_path, readonly=True) as conn:
+            rows = conn.execute("""
+            SELECT * FROM orders 
+            WHERE user_id = ? 
+            ORDER BY created_at DESC 
+            LIMIT ?
+            """, (user_id, limit)).fetchall()
         
-        return orders
+        return [dict(row) for row in rows]
     
     def log_webhook(self, webhook_id: str, order_id: str, event_type: str, payload: str) -> bool:
         """Log webhook event"""
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
-            INSERT INTO payment_webhooks (id, order_id, event_type, payload)
-            VALUES (?, ?, ?, ?)
-            """, (webhook_id, order_id, event_type, payload))
+            with db.connection(self.db_path) as conn:
+                conn.execute("""
+                INSERT INTO payment_webhooks (id, order_id, event_type, payload)
+                VALUES (?, ?, ?, ?)
+                """, (webhook_id, order_id, event_type, payload))
             
-            conn.commit()
             return True
         except Exception as e:
             print(f"Error logging webhook: {e}")
             return False
-        finally:
-            conn.close()
 
 
 order_manager = OrderManager()
@@ -0,0 +1,222 @@
+"""
+Order Rollups
+Aggregate tables over `orders` for AdminDashboard: revenue/orders per day,
+product and status, and per-user totals per status
+
+Run: python order_rollups.py [--backfill] [--check]
+"""
+
+import argparse
+import sqlite3
+import sys
+from typing import Dict, List
+
+import db
+from config import DATABASE_PATH
+
+# Kunci rollup tidak boleh NULL (NULL tidak pernah bentrok di PRIMARY KEY)
+DAY_EXPR = "IFNULL(DATE({row}.created_at), '')"
+STATUS_EXPR = "IFNULL({row}.status, '')"
+
+# Selisih amount yang masih dianggap sama (penjumlahan REAL bertahap)
+AMOUNT_TOLERANCE = 0.005
+
+
+def create_rollup_tables(conn: sqlite3.Connection):
+    """Create the rollup tables and the triggers that keep them current.
+
+    Every insert, delete, or update of status/amount/created_at/product/
+    email on `orders` adjusts the affected rollup rows in the same
+    transaction, so OrderManager.create_order and update_order_status
+    never leave them behind. The triggers re-read one user's orders through
+    idx_orders_user_created (order_manager.create_order_indexes). Runs
+    inside the caller's transaction.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS order_daily_rollup (
+        day TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        product_name TEXT,
+        product_type TEXT,
+        orders INTEGER NOT NULL DEFAULT 0,
+        amount REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id, status)
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS order_user_rollup (
+        user_email TEXT NOT NULL,
+        status TEXT NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        amount REAL NOT NULL DEFAULT 0,
+        first_order TIMESTAMP,
+        last_order TIMESTAMP,
+        PRIMARY KEY (user_email, status)
+    )
+    """)
+    # Top customers: pelanggan COMPLETED dengan total terbesar
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_order_user_rollup_status_amount
+    ON order_user_rollup(status, amount)
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_ai AFTER INSERT ON orders BEGIN
+        {_add_order("new")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_ad AFTER DELETE ON orders BEGIN
+        {_remove_order("old")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS orders_rollup_au
+    AFTER UPDATE OF status, amount, created_at, product_id, product_name, product_type, user_email ON orders
+    WHEN old.status IS NOT new.status
+      OR old.amount IS NOT new.amount
+      OR old.created_at IS NOT new.created_at
+      OR old.product_id IS NOT new.product_id
+      OR old.product_name IS NOT new.product_name
+      OR old.product_type IS NOT new.product_type
+      OR old.user_email IS NOT new.user_email
+    BEGIN
+        {_remove_order("old")}
+        {_add_order("new")}
+    END
+    """)
+
+
+def _add_order(row: str) -> str:
+    """Trigger statements adding one order (`new`) to the rollups"""
+    day, status = DAY_EXPR.format(row=row), STATUS_EXPR.format(row=row)
+    return f"""
+        INSERT INTO order_daily_rollup (day, product_id, status, product_name, product_type, orders, amount)
+        VALUES ({day}, {row}.product_id, {status}, {row}.product_name, {row}.product_type,
+                1, IFNULL({row}.amount, 0))
+        ON CONFLICT(day, product_id, status) DO UPDATE SET
+            orders = orders + 1,
+            amount = amount + excluded.amount,
+            product_name = excluded.product_name,
+            product_type = excluded.product_type;
+        INSERT INTO order_user_rollup (user_email, status, orders, amount, first_order, last_order)
+        SELECT {row}.user_email, {status}, 1, IFNULL({row}.amount, 0), {row}.created_at, {row}.created_at
+        WHERE {row}.user_email IS NOT NULL
+        ON CONFLICT(user_email, status) DO UPDATE SET
+            orders = orders + 1,
+            amount = amount + excluded.amount,
+            first_order = MIN(first_order, excluded.first_order),
+            last_order = MAX(last_order, excluded.last_order);
+    """
+
+
+def _remove_order(row: str) -> str:
+    """Trigger statements taking one order (`old`) out of the rollups"""
+    day, status = DAY_EXPR.format(row=row), STATUS_EXPR.format(row=row)
+    daily_key = f"day = {day} AND product_id = {row}.product_id AND status = {status}"
+    user_key = f"user_email = {row}.user_email AND status = {status}"
+    # first/last dihitung ulang dari orders: baris ini sudah pindah status / terhapus
+    user_orders = f"FROM orders o WHERE o.user_email = {row}.user_email AND IFNULL(o.status, '') = {status}"
+    return f"""
+        UPDATE order_daily_rollup SET orders = orders - 1, amount = amount - IFNULL({row}.amount, 0)
+        WHERE {daily_key};
+        DELETE FROM order_daily_rollup WHERE {daily_key} AND orders <= 0;
+        UPDATE order_user_rollup SET
+            orders = orders - 1,
+            amount = amount - IFNULL({row}.amount, 0),
+            first_order = (SELECT MIN(o.created_at) {user_orders}),
+            last_order = (SELECT MAX(o.created_at) {user_orders})
+        WHERE {user_key};
+        DELETE FROM order_user_rollup WHERE {user_key} AND orders <= 0;
+    """
+
+
+# === Backfill & pemeriksaan ===
+
+DAILY_FROM_ORDERS = f"""
+SELECT {DAY_EXPR.format(row='orders')} AS day, product_id, {STATUS_EXPR.format(row='orders')} AS status,
+       MAX(product_name) AS product_name, MAX(product_type) AS product_type,
+       COUNT(*) AS orders, SUM(IFNULL(amount, 0)) AS amount
+FROM orders
+GROUP BY 1, 2, 3
+"""
+
+USERS_FROM_ORDERS = f"""
+SELECT user_email, {STATUS_EXPR.format(row='orders')} AS status,
+       COUNT(*) AS orders, SUM(IFNULL(amount, 0)) AS amount,
+       MIN(created_at) AS first_order, MAX(created_at) AS last_order
+FROM orders
+WHERE user_email IS NOT NULL
+GROUP BY 1, 2
+"""
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recompute both rollups from `orders` (inside the caller's transaction)"""
+    conn.execute("DELETE FROM order_daily_rollup")
+    conn.execute("DELETE FROM order_user_rollup")
+    daily = conn.execute(f"""
+    INSERT INTO order_daily_rollup (day, product_id, status, product_name, product_type, orders, amount)
+    {DAILY_FROM_ORDERS}
+    """).rowcount
+    users = conn.execute(f"""
+    INSERT INTO order_user_rollup (user_email, status, orders, amount, first_order, last_order)
+    {USERS_FROM_ORDERS}
+    """).rowcount
+    return {"daily_rows": daily, "user_rows": users}
+
+
+def check_rollups(conn: sqlite3.Connection) -> List[str]:
+    """Compare the rollups with a fresh aggregation of `orders`; returns
+    one line per differing key (empty list = consistent)"""
+    problems = []
+    checks = (
+        ("daily", DAILY_FROM_ORDERS, "order_daily_rollup", ("day", "product_id", "status"),
+         ("orders", "amount")),
+        ("user", USERS_FROM_ORDERS, "order_user_rollup", ("user_email", "status"),
+         ("orders", "amount", "first_order", "last_order")),
+    )
+    for label, fresh_sql, table, keys, values in checks:
+        expected = {tuple(row[k] for k in keys): row for row in conn.execute(fresh_sql)}
+        actual = {tuple(row[k] for k in keys): row for row in conn.execute(f"SELECT * FROM {table}")}
+        for key in expected.keys() | actual.keys():
+            want, have = expected.get(key), actual.get(key)
+            if want is None or have is None:
+                problems.append(f"{label} {key}: {'missing' if have is None else 'extra'}")
+                continue
+            for column in values:
+                a, b = want[column], have[column]
+                same = abs(a - b) <= AMOUNT_TOLERANCE if column == "amount" else a == b
+                if not same:
+                    problems.append(f"{label} {key}: {column} {b!r} != {a!r}")
+    return problems
+
+
+if __name__ == '__main__':
+    # python order_rollups.py --backfill -> buat tabel/trigger lalu hitung ulang dari orders
+    # python order_rollups.py --check    -> bandingkan rollup dengan agregasi orders
+    parser = argparse.ArgumentParser(description="Maintain the order rollup tables")
+    parser.add_argument("--backfill", action="store_true", help="recompute the rollups from orders")
+    parser.add_argument("--check", action="store_true", help="verify the rollups against orders")
+    args = parser.parse_args()
+
+    from order_manager import create_order_indexes
+
+    with db.connection(DATABASE_PATH) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        create_order_indexes(conn)
+        create_rollup_tables(conn)
+        if args.backfill:
+            print(f"✅ Rollups rebuilt: {rebuild_rollups(conn)}")
+
+    if args.check:
+        with db.connection(DATABASE_PATH, readonly=True) as conn:
+            problems = check_rollups(conn)
+        for line in problems[:50]:
+            print(f"❌ {line}")
+        if problems:
+            print(f"❌ {len(problems)} rollup rows differ from orders")
+            sys.exit(1)
+        print("✅ Rollups match orders")
@@ -3,13 +3,22 @@ Payment Routes for DANA Integration
 Add these routes to app.py
 """
 
-import uuid
 import json
+import time
+import uuid
 from datetime import datetime
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, request, jsonify, render_template, stream_with_context
 
+from analytics import analytics
+from checkout_queue import CHECKOUT_ASYNC, checkout_worker, enqueue as enqueue_checkout
 from dana_payment import dana_gateway
-from order_manager import order_manager
+from order_manager import FINAL_STATUSES, order_manager
+from reconciler import reconciler
+from status_bus import (
+    STATUS_HEARTBEAT_SECONDS, STATUS_LONGPOLL_MAX, STATUS_POLL_INTERVAL, STATUS_STREAM_SECONDS, BusFull,
+    status_bus
+)
+from webhook_queue import enqueue, event_id, webhook_worker
 
 payment_bp = Blueprint('payment', __name__, url_prefix='/payment')
 
@@ -85,14 +94,32 @@ def premium_docs():
         if not order_result['success']:
             return jsonify({"error": "Failed to create order"}), 500
         
+        title = "Premium Document Access"
+        description = f"Access to premium documents - {product_id}"
+        notify_url = f"{request.host_url.rstrip('/')}/payment/webhook/dana"
+        return_url = f"{request.host_url.rstrip('/')}/payment/success/{order_id}"
+        
+        if CHECKOUT_ASYNC:
+            # Order DANA dibuat checkout_worker; client menunggu payment_url di /payment/status
+            if not enqueue_checkout(order_id, amount / 100, title, description, notify_url, return_url):
+                return jsonify({"error": "Failed to create payment"}), 500
+            checkout_worker.notify()
+            
+            return jsonify({
+                "success": True,
+                "order_id": order_id,
+                "payment_url": None,
+                "status_url": f"/payment/status/{order_id}"
+            }), 202
+        
         # Create payment with DANA
         payment_result = dana_gateway.create_payment_order(
             order_id=order_id,
             amount=amount / 100,  # Convert to standard currency
-            title=f"Premium Document Access",
-            description=f"Access to premium documents - {product_id}",
-            notify_url=f"{request.host_url.rstrip('/')}/payment/webhook/dana",
-            return_url=f"{request.host_url.rstrip('/')}/payment/success/{order_id}"
+            title=title,
+            description=description,
+            notify_url=notify_url,
+            return_url=return_url
         )
         
         if not payment_result.get('success'):
@@ -123,81 +150,137 @@ def payment_success(order_id):
                              error="Order not found", 
                              order_id=order_id), 404
     
-    # Verify payment with DANA
-    verify_result = dana_gateway.verify_payment(
-        order_id=order_id,
-        dana_transaction_id=order.get('dana_order_id')
-    )
-    
-    if verify_result.get('verified'):
-        # Update order status
-        order_manager.update_order_status(order_id, "COMPLETED")
-        
+    # Status lokal (webhook_worker / reconciler); tidak menunggu DANA di sini
+    if order.get('status') == "COMPLETED":
         return render_template('payment_success.html',
                              order=order,
                              message="Payment successful! Access granted.")
-    else:
-        return render_template('payment_pending.html',
-                             order=order,
-                             message="Payment is being processed. Please wait...")
+    if order.get('status') == "FAILED":
+        return render_template('payment_error.html',
+                             error="Payment failed or expired",
+                             order_id=order_id)
+    
+    # User menunggu order ini: minta reconciler mengecek di putaran berikutnya
+    reconciler.prioritize(order_id)
+    return render_template('payment_pending.html',
+                         order=order,
+                         message="Payment is being processed. Please wait...")
 
 
 @payment_bp.route('/webhook/dana', methods=['POST'])
 def dana_webhook():
     """
     Webhook handler for DANA payment notifications
-    Receives payment status updates from DANA
+    Stores the notification (once per event id) and ACKs immediately;
+    webhook_worker applies the status change in the background
     """
     
     try:
-        webhook_id = str(uuid.uuid4())
         payload = request.get_data(as_text=True)
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "JSON object expected"}), 400
         
         order_id = data.get('orderId') or data.get('order_id')
         event_type = data.get('event') or data.get('eventType')
-        status = data.get('status')
+        webhook_id = event_id(data, request.headers, request.get_data())
         
-        # Log webhook
-        order_manager.log_webhook(webhook_id, order_id, event_type, payload)
+        created = enqueue(webhook_id, order_id, event_type, payload)
+        if created:
+            webhook_worker.notify()
         
-        if order_id:
-            order = order_manager.get_order(order_id)
-            
-            if order:
-                # Update order based on status
-                if status == "COMPLETED" or status == "SETTLED":
-                    order_manager.update_order_status(order_id, "COMPLETED")
-                elif status == "FAILED" or status == "EXPIRED":
-                    order_manager.update_order_status(order_id, "FAILED")
-                elif status == "PENDING":
-                    order_manager.update_order_status(order_id, "PENDING")
-                
-                return jsonify({"success": True, "webhook_id": webhook_id}), 200
-        
-        return jsonify({"success": True, "webhook_id": webhook_id}), 200
+        return jsonify({"success": True, "webhook_id": webhook_id, "duplicate": not created}), 200
     
     except Exception as e:
         print(f"Webhook error: {e}")
-        return jsonify({"error": str(e)}), 400
+        return jsonify({"error": str(e)}), 500
 
 
 @payment_bp.route('/status/<order_id>', methods=['GET'])
 def payment_status(order_id):
-    """Get payment status for an order"""
+    """Get payment status for an order
     
+    Long-poll: ?since=<seq from the previous answer>&wait=<seconds> holds
+    the request until the order changes (or `wait` runs out). When this
+    worker has no thread to spare it answers at once with `poll_after`
+    (seconds) and the client should poll again after that
+    """
+    
+    # seq dibaca sebelum order: perubahan sesudahnya pasti punya seq lebih besar
+    seq = status_bus.head_seq()
     order = order_manager.get_order(order_id)
     
     if not order:
         return jsonify({"error": "Order not found"}), 404
     
-    return jsonify({
+    since = request.args.get('since', type=int)
+    wait = min(request.args.get('wait', 0, type=float), STATUS_LONGPOLL_MAX)
+    poll_after = None
+    if since is not None and wait > 0 and order.get('status') not in FINAL_STATUSES:
+        try:
+            event = status_bus.wait(order_id, since, wait)
+        except BusFull:
+            # Worker sync atau semua thread cadangan terpakai: jangan menahan request
+            event = None
+            poll_after = STATUS_POLL_INTERVAL
+        if event:
+            seq = status_bus.head_seq()
+            order = order_manager.get_order(order_id)
+    
+    result = {
         "order_id": order_id,
         "status": order.get('status'),
+        "payment_url": order.get('payment_url'),
         "amount": order.get('amount'),
         "created_at": order.get('created_at'),
-        "completed_at": order.get('completed_at')
-    })
+        "completed_at": order.get('completed_at'),
+        "seq": seq
+    }
+    if poll_after is not None:
+        result["poll_after"] = poll_after
+    return jsonify(result)
+
+
+@payment_bp.route('/status/<order_id>/events', methods=['GET'])
+def payment_status_events(order_id):
+    """Server-sent events: the current status, then every change until the
+    order is COMPLETED/FAILED or STATUS_STREAM_SECONDS pass (EventSource
+    reconnects by itself). Without a thread to spare the stream ends after
+    the current status with `retry:` STATUS_POLL_INTERVAL, which turns the
+    EventSource into a short poll"""
+    
+    seq = status_bus.head_seq()
+    order = order_manager.get_order(order_id)
+    
+    if not order:
+        return jsonify({"error": "Order not found"}), 404
+    
+    def sse(seq, status, payment_url):
+        data = json.dumps({"order_id": order_id, "status": status, "payment_url": payment_url, "seq": seq})
+        return f"id: {seq}\nevent: status\ndata: {data}\n\n"
+    
+    def generate(seq, status, payment_url):
+        yield sse(seq, status, payment_url)
+        deadline = time.monotonic() + STATUS_STREAM_SECONDS
+        while status not in FINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = status_bus.wait(order_id, seq, min(remaining, STATUS_HEARTBEAT_SECONDS))
+            except BusFull:
+                # Worker sync atau thread penuh: EventSource menyambung lagi setelah jeda polling
+                yield f"retry: {int(STATUS_POLL_INTERVAL * 1000)}\n\n"
+                return
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            seq, status = event['seq'], event['status']
+            yield sse(seq, status, event['payment_url'])
+    
+    return Response(stream_with_context(generate(seq, order.get('status'), order.get('payment_url'))),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @payment_bp.route('/orders', methods=['GET'])
@@ -225,39 +308,22 @@ def payment_analytics():
     (Add authentication/authorization here)
     """
     
-    import sqlite3
-    
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
-    
-    # Total revenue
-    cursor.execute("SELECT SUM(amount) as total FROM orders WHERE status = 'COMPLETED'")
-    total_revenue = cursor.fetchone()[0] or 0
-    
-    # Total orders
-    cursor.execute("SELECT COUNT(*) FROM orders")
-    total_orders = cursor.fetchone()[0]
-    
-    # Completed orders
-    cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'COMPLETED'")
-    completed_orders = cursor.fetchone()[0]
-    
-    # Pending orders
-    cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'PENDING'")
-    pending_orders = cursor.fetchone()[0]
-    
-    conn.close()
+    kpis = analytics.kpis()
     
     return jsonify({
-        "total_revenue": total_revenue,
-        "total_orders": total_orders,
-        "completed_orders": completed_orders,
-        "pending_orders": pending_orders,
-        "conversion_rate": (completed_orders / total_orders * 100) if total_orders > 0 else 0
+        "total_revenue": kpis["total_revenue"],
+        "total_orders": kpis["total_orders"],
+        "completed_orders": kpis["completed_orders"],
+        "pending_orders": kpis["pending_orders"],
+        "conversion_rate": kpis["conversion_rate"]
     })
 
 
 def init_payment_routes(app):
     """Initialize payment routes with Flask app"""
     app.register_blueprint(payment_bp)
+    webhook_worker.start()
+    reconciler.start()
+    checkout_worker.start()
+    status_bus.start()
     print("✅ Payment routes initialized")
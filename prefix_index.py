@@ -0,0 +1,474 @@
+"""
+Prefix Index
+Memory-mapped sorted token index over files.name for /api/autocomplete,
+shared by all gunicorn workers through the page cache. Also holds the
+trigram table of the token vocabulary used by fuzzy_search.
+"""
+
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock di dalam proses
+    fcntl = None
+
+import db
+from catalogue import GenerationStamp, get_generation
+from config import DATABASE_PATH
+from search_index import compact_text, tokenize_query
+
+# === Konfigurasi index (bisa diatur lewat environment) ===
+PREFIX_INDEX_ENABLED = os.environ.get('PREFIX_INDEX_ENABLED', 'true').lower() == 'true'
+# Prefix sependek ini punya top-K yang dihitung saat build (rentangnya terlalu besar untuk di-merge)
+TOP_PREFIX_LEN = 2
+TOP_K = 8
+# Query multi-kata: kandidat terbaik diperiksa satu per satu dulu, baru irisan posting
+PROBE_LIMIT = 512
+FILTER_RATIO = 16
+
+MAGIC = b"PFX1"
+FORMAT_VERSION = 3
+# magic, versi format, generasi katalog, jumlah doc, token, posting, prefix top-K,
+# trigram, posting trigram
+HEADER = struct.Struct("<4sIQIIIIII")
+NO_DOC = 0xFFFFFFFF
+
+
+def index_path(db_path: str) -> str:
+    return f"{db_path}.prefix"
+
+
+def name_tokens(name: str) -> List[str]:
+    """Tokens of a file name, in order ("2NR-FE" also yields "2nrfe")"""
+    tokens = tokenize_query(name)
+    stem, extension = os.path.splitext(name)
+    if extension[1:].isalpha():
+        name = stem
+    if '-' in name or '.' in name:
+        # Seperti kolom `compact` di FTS: kode mesin/part ditulis tanpa tanda hubung atau titik
+        tokens += [t for t in tokenize_query(compact_text(name)) if t not in tokens]
+    return tokens
+
+
+def trigrams(token: str, prefix: bool = False) -> List[str]:
+    """Trigrams of "^token$" ("^token" for a prefix still being typed)"""
+    padded = f"^{token}" if prefix else f"^{token}$"
+    return [padded[i:i + 3] for i in range(max(1, len(padded) - 2))]
+
+
+def static_rank(position: int, name: str) -> int:
+    """Lower is better: token at the start of the name, then shorter names"""
+    return (min(position, 255) << 16) | min(len(name), 0xFFFF)
+
+
+# === Build ===
+
+def build_index(db_path: str = DATABASE_PATH, path: Optional[str] = None) -> int:
+    """Write a fresh index file for the catalogue and atomically replace
+    the old one. Returns the catalogue generation it was built from."""
+    path = path or index_path(db_path)
+    with db.connection(db_path, readonly=True) as conn:
+        # Generasi dan isi dibaca dari snapshot transaksi yang sama
+        conn.execute("BEGIN")
+        generation = get_generation(conn)
+        rows = conn.execute(
+            "SELECT id, name, is_directory, mime_type FROM files "
+            "ORDER BY length(name), name COLLATE NOCASE, id"
+        ).fetchall()
+
+    doc_offsets = [0]
+    doc_blob = bytearray()
+    # Nomor doc = urutan nama terpendek, jadi doc terkecil = hasil terbaik untuk query multi-kata
+    # token -> posting (rank << 32 | doc), urut rank lalu nama
+    postings: Dict[str, List[int]] = {}
+    for doc, row in enumerate(rows):
+        name = row['name'] or ''
+        doc_blob += bytes([1 if row['is_directory'] else 0])
+        tokens = name_tokens(name)
+        # Field terakhir: token nama (" a b c") untuk memfilter query multi-kata tanpa tokenisasi ulang
+        doc_blob += f"{row['id']}\x00{name}\x00{row['mime_type'] or ''}\x00 {' '.join(tokens)}".encode()
+        doc_offsets.append(len(doc_blob))
+        for position, token in enumerate(tokens):
+            postings.setdefault(token, []).append((static_rank(position, name) << 32) | doc)
+
+    tokens = sorted(postings, key=lambda t: t.encode())
+    token_offsets, token_blob, token_starts, packed, posting_docs = [0], bytearray(), [0], [], []
+    top: Dict[str, List[int]] = {}
+    for token in tokens:
+        entries = sorted(set(postings[token]))
+        packed.extend(entries)
+        posting_docs.extend(sorted(entry & 0xFFFFFFFF for entry in entries))
+        token_blob += token.encode()
+        token_offsets.append(len(token_blob))
+        token_starts.append(len(packed))
+        for n in range(1, TOP_PREFIX_LEN + 1):
+            if len(token) >= n:
+                top.setdefault(token[:n], []).extend(entries[:TOP_K * 4])
+
+    # Trigram -> token id, untuk mencari kata yang mirip (fuzzy_search)
+    gram_postings: Dict[str, List[int]] = {}
+    for token_id, token in enumerate(tokens):
+        for gram in set(trigrams(token)):
+            gram_postings.setdefault(gram, []).append(token_id)
+    grams = sorted(gram_postings, key=lambda g: g.encode())
+    gram_offsets, gram_blob, gram_starts, gram_tokens = [0], bytearray(), [0], []
+    for gram in grams:
+        gram_blob += gram.encode()
+        gram_offsets.append(len(gram_blob))
+        gram_tokens.extend(gram_postings[gram])
+        gram_starts.append(len(gram_tokens))
+
+    prefixes = sorted(top, key=lambda p: p.encode())
+    prefix_offsets, prefix_blob, prefix_top = [0], bytearray(), []
+    for prefix in prefixes:
+        prefix_blob += prefix.encode()
+        prefix_offsets.append(len(prefix_blob))
+        docs: List[int] = []
+        for entry in sorted(top[prefix]):
+            doc = entry & 0xFFFFFFFF
+            if doc not in docs:
+                docs.append(doc)
+                if len(docs) == TOP_K:
+                    break
+        prefix_top.extend(docs + [NO_DOC] * (TOP_K - len(docs)))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, generation, len(rows), len(tokens),
+                                len(packed), len(prefixes), len(grams), len(gram_tokens)))
+            _write_array(f, "I", doc_offsets)
+            _write_blob(f, doc_blob)
+            _write_array(f, "I", token_offsets)
+            _write_blob(f, token_blob)
+            _write_array(f, "I", token_starts)
+            _write_array(f, "Q", packed)
+            _write_array(f, "I", posting_docs)
+            _write_array(f, "I", prefix_offsets)
+            _write_blob(f, prefix_blob)
+            _write_array(f, "I", prefix_top)
+            _write_array(f, "I", gram_offsets)
+            _write_blob(f, gram_blob)
+            _write_array(f, "I", gram_starts)
+            _write_array(f, "I", gram_tokens)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return generation
+
+
+def _write_array(f, typecode: str, values: List[int]):
+    # Urutan byte native, sama dengan memoryview.cast() saat dibaca
+    _align(f, 8)
+    f.write(array(typecode, values).tobytes())
+
+
+def _write_blob(f, blob: bytes):
+    _align(f, 8)
+    f.write(blob)
+
+
+def _align(f, size: int):
+    padding = -f.tell() % size
+    if padding:
+        f.write(b"\x00" * padding)
+
+
+# === Baca (mmap) ===
+
+class _Strings:
+    """Sequence view of a sorted, offset-indexed UTF-8 blob (for bisect)"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+
+class MappedIndex:
+    """Read-only view of one index file; every array is a slice of the mmap"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        (magic, version, self.generation, n_docs, n_tokens, n_postings, n_prefixes,
+         n_grams, n_gram_tokens) = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a prefix index (version {FORMAT_VERSION})")
+
+        self._view = view
+        self._pos = HEADER.size
+        doc_offsets = self._array("I", n_docs + 1)
+        self.docs = _Strings(doc_offsets, self._array("B", doc_offsets[-1]))
+        token_offsets = self._array("I", n_tokens + 1)
+        self.tokens = _Strings(token_offsets, self._array("B", token_offsets[-1]))
+        self.token_starts = self._array("I", n_tokens + 1)
+        self.postings = self._array("Q", n_postings)
+        # Doc per token, urut nomor doc (= urut kualitas); prefix = satu potongan kontigu
+        self.posting_docs = self._array("I", n_postings)
+        prefix_offsets = self._array("I", n_prefixes + 1)
+        self.prefixes = _Strings(prefix_offsets, self._array("B", prefix_offsets[-1]))
+        self.prefix_top = self._array("I", n_prefixes * TOP_K)
+        gram_offsets = self._array("I", n_grams + 1)
+        self.grams = _Strings(gram_offsets, self._array("B", gram_offsets[-1]))
+        self.gram_starts = self._array("I", n_grams + 1)
+        self.gram_tokens = self._array("I", n_gram_tokens)
+        self.size = len(view)
+
+    def _array(self, typecode: str, count: int):
+        self._pos += -self._pos % 8
+        itemsize = struct.calcsize(typecode)
+        start, self._pos = self._pos, self._pos + count * itemsize
+        return self._view[start:self._pos].cast(typecode)
+
+    def token_range(self, prefix: bytes) -> Tuple[int, int]:
+        # UTF-8 tidak pernah memuat byte 0xff, jadi prefix + 0xff > semua token berawalan prefix
+        return (bisect.bisect_left(self.tokens, prefix),
+                bisect.bisect_left(self.tokens, prefix + b"\xff"))
+
+    def posting_count(self, lo: int, hi: int) -> int:
+        return self.token_starts[hi] - self.token_starts[lo]
+
+    def prefix_docs(self, lo: int, hi: int):
+        """Docs (with repeats) of every token in [lo, hi), as one mmap slice"""
+        return self.posting_docs[self.token_starts[lo]:self.token_starts[hi]]
+
+    def tokens_with_gram(self, gram: bytes):
+        """Ids of the vocabulary tokens containing a trigram"""
+        i = bisect.bisect_left(self.grams, gram)
+        if i >= len(self.grams) or self.grams[i] != gram:
+            return ()
+        return self.gram_tokens[self.gram_starts[i]:self.gram_starts[i + 1]]
+
+    def doc_tokens(self, i: int) -> bytes:
+        raw = self.docs[i]
+        return raw[raw.rindex(b"\x00") + 1:]
+
+    def ranked_docs(self, prefix: bytes, lo: int, hi: int) -> Iterator[int]:
+        """Docs having a token that starts with `prefix`, best rank first"""
+        if hi - lo == 1:
+            for i in range(self.token_starts[lo], self.token_starts[hi]):
+                yield self.postings[i] & 0xFFFFFFFF
+            return
+        # k-way merge: posting per token sudah urut rank
+        heap = [(self.postings[self.token_starts[t]], t, self.token_starts[t]) for t in range(lo, hi)]
+        heapq.heapify(heap)
+        while heap:
+            entry, t, i = heap[0]
+            yield entry & 0xFFFFFFFF
+            i += 1
+            if i < self.token_starts[t + 1]:
+                heapq.heapreplace(heap, (self.postings[i], t, i))
+            else:
+                heapq.heappop(heap)
+
+    def top_docs(self, prefix: bytes) -> Optional[List[int]]:
+        """Precomputed top-K for short prefixes, None if not stored"""
+        i = bisect.bisect_left(self.prefixes, prefix)
+        if i >= len(self.prefixes) or self.prefixes[i] != prefix:
+            return None
+        docs = self.prefix_top[i * TOP_K:(i + 1) * TOP_K]
+        return [doc for doc in docs if doc != NO_DOC]
+
+    def doc(self, i: int) -> Dict:
+        raw = self.docs[i]
+        file_id, name, mime_type, _tokens = raw[1:].decode().split("\x00")
+        return {"id": file_id, "name": name, "is_directory": raw[0], "mime_type": mime_type or None}
+
+    def suggest(self, query: str, limit: int = TOP_K) -> List[Dict]:
+        tokens = [t for t in tokenize_query(query) if t]
+        if not tokens:
+            return []
+        ranges = [(t.encode(), *self.token_range(t.encode())) for t in tokens]
+        if any(lo == hi for _prefix, lo, hi in ranges):
+            return []
+
+        if len(ranges) == 1:
+            prefix, lo, hi = ranges[0]
+            if limit <= TOP_K and len(prefix) <= TOP_PREFIX_LEN:
+                top = self.top_docs(prefix)
+                if top is not None:
+                    return [self.doc(i) for i in top[:limit]]
+            results: List[int] = []
+            for doc in self.ranked_docs(prefix, lo, hi):
+                if doc not in results:
+                    results.append(doc)
+                    if len(results) >= limit:
+                        break
+            return [self.doc(i) for i in results]
+
+        # Multi-kata: doc terbaik dari kata dengan posting paling sedikit, dicek
+        # terhadap token nama; biasanya `limit` hasil ketemu dalam beberapa puluh doc
+        ranges.sort(key=lambda r: self.posting_count(r[1], r[2]))
+        _prefix, lo, hi = ranges[0]
+        candidates = self.prefix_docs(lo, hi)
+        if hi - lo > 1:
+            candidates = sorted(set(candidates))
+        needles = [b" " + prefix for prefix, _lo, _hi in ranges[1:]]
+        results = []
+        for doc in candidates[:PROBE_LIMIT]:
+            doc_tokens = self.doc_tokens(doc)
+            if all(needle in doc_tokens for needle in needles):
+                results.append(doc)
+                if len(results) >= limit:
+                    break
+        if len(results) >= limit or len(candidates) <= PROBE_LIMIT:
+            return [self.doc(i) for i in results]
+
+        # Kombinasi jarang: irisan himpunan doc
+        docs = set(candidates)
+        for prefix, lo, hi in ranges[1:]:
+            if not docs:
+                break
+            if len(docs) * FILTER_RATIO < self.posting_count(lo, hi):
+                needle = b" " + prefix
+                docs = {doc for doc in docs if needle in self.doc_tokens(doc)}
+            else:
+                docs.intersection_update(self.prefix_docs(lo, hi))
+        return [self.doc(i) for i in heapq.nsmallest(limit, docs)]
+
+
+class PrefixIndex:
+    """Per-worker handle on the shared index file.
+
+    The file is built once (whichever worker gets the lock first) and
+    mapped read-only by every worker, so the kernel keeps one copy. When
+    the catalogue generation moves on, one worker rebuilds it in a
+    background thread and renames it into place; the others notice the new
+    file on their next query and remap it. While the index is missing or
+    stale suggest() returns None and callers fall back to SQL.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, path: Optional[str] = None,
+                 enabled: bool = PREFIX_INDEX_ENABLED):
+        self.db_path = db_path
+        self.path = path or index_path(db_path)
+        self.enabled = enabled
+        self._stamp = GenerationStamp(db_path)
+        self._index: Optional[MappedIndex] = None
+        self._file_stat: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._stats = {"queries": 0, "fallbacks": 0, "builds": 0, "build_seconds": 0.0, "reloads": 0}
+
+    def _load(self) -> Optional[MappedIndex]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        file_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if file_stat != self._file_stat:
+            try:
+                index = MappedIndex(self.path)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Error loading prefix index: {e}")
+                return None
+            # Mapping lama ditutup oleh GC setelah query yang masih memakainya selesai
+            self._index, self._file_stat = index, file_stat
+            self._stats["reloads"] += 1
+        return self._index
+
+    def current(self) -> Optional[MappedIndex]:
+        """The mapped index if it matches the catalogue generation, else None"""
+        if not self.enabled:
+            return None
+        generation = self._stamp.current()
+        index = self._index
+        if index is not None and index.generation == generation:
+            return index
+        index = self._load()
+        if index is not None and index.generation == generation:
+            return index
+        self._rebuild_in_background()
+        return None
+
+    def suggest(self, query: str, limit: int = TOP_K) -> Optional[List[Dict]]:
+        index = self.current()
+        if index is None:
+            self._stats["fallbacks"] += 1
+            return None
+        self._stats["queries"] += 1
+        return index.suggest(query, limit)
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def rebuild(self, force: bool = False) -> Optional[int]:
+        """Build the index unless another worker is doing it (or already did)"""
+        lock_file = open(f"{self.path}.lock", "a+b")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            index = self._load()
+            generation = self._stamp.current()
+            if not force and index is not None and index.generation == generation:
+                return generation
+            started = time.perf_counter()
+            generation = build_index(self.db_path, self.path)
+            self._stats["builds"] += 1
+            self._stats["build_seconds"] = round(time.perf_counter() - started, 3)
+            self._load()
+            return generation
+        except Exception as e:
+            print(f"Error building prefix index: {e}")
+            return None
+        finally:
+            lock_file.close()
+            with self._lock:
+                self._building = False
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        index = self._index
+        stats.update(
+            path=self.path,
+            generation=index.generation if index else None,
+            names=len(index.docs) if index else 0,
+            tokens=len(index.tokens) if index else 0,
+            bytes=index.size if index else 0,
+        )
+        return stats
+
+
+if __name__ == '__main__':
+    # python prefix_index.py            -> build ulang index untuk DATABASE_PATH
+    # python prefix_index.py "2nr fe"   -> tampilkan saran untuk query
+    import sys
+    from migrations import run_migrations
+
+    run_migrations(DATABASE_PATH)
+    prefix_index = PrefixIndex(DATABASE_PATH)
+    if len(sys.argv) > 1:
+        prefix_index.rebuild()
+        for item in prefix_index.suggest(" ".join(sys.argv[1:])) or []:
+            print(f"{'📁' if item['is_directory'] else '📄'} {item['name']}")
+    else:
+        print(f"Built generation {prefix_index.rebuild(force=True)}")
+        print(prefix_index.stats())
@@ -0,0 +1,88 @@
+"""
+Query Plan Check
+EXPLAIN QUERY PLAN guard for the queries behind hot routes: none of them
+may scan `files`/`orders` or sort with a temp B-tree
+
+Run: python query_plans.py  (applies migrations first, exits 1 on a scan)
+"""
+
+import sqlite3
+import sys
+from typing import Dict, List, Tuple, Union
+
+from admin_dashboard import REVENUE_BY_DATE_SQL, TOP_CUSTOMERS_SQL, USER_ORDERS_SQL, USER_SUMMARY_SQL, USERS_SQL
+from catalogue import (
+    BREADCRUMBS_SQL, FILE_SQL, FOLDER_PAGE_AFTER_SQL, FOLDER_PAGE_SQL, FOLDER_PATH_SQL, GENERATION_SQL,
+    SUBFOLDERS_SQL, SUBTREE_STATS_SQL
+)
+from config import DATABASE_PATH
+from reconciler import CLAIM_SQL
+
+# Query pada route yang sering dipanggil; tidak boleh melakukan full scan pada `files`.
+# Statement diimpor dari modul yang menjalankannya, jadi yang dicek selalu yang dipakai.
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "catalogue.generation": (GENERATION_SQL, ()),
+    "catalogue.folder_path": (FOLDER_PATH_SQL, ("folder",)),
+    "catalogue.breadcrumbs": (BREADCRUMBS_SQL.format(ids="?, ?, ?"), ("root", "folder", "file")),
+    "catalogue.subtree_stats": (SUBTREE_STATS_SQL, ("/root/folder/", "/root/folder0")),
+    "catalogue.list_folder_page": (FOLDER_PAGE_SQL, ("folder", 1, 100)),
+    "catalogue.list_folder_page.after": (FOLDER_PAGE_AFTER_SQL, ("folder", 0, "name", "id", 100)),
+    "file_preview.file": (FILE_SQL, ("file",)),
+    "file_preview.siblings": (SUBFOLDERS_SQL, ("folder",)),
+}
+
+# Query admin dashboard; hanya dicek bila tabel orders sudah ada (init_payment_db)
+ORDER_QUERIES: Dict[str, Tuple[str, Union[tuple, Dict]]] = {
+    "admin.get_users": (USERS_SQL, (50,)),
+    "admin.get_user_detail.summary": (USER_SUMMARY_SQL, ("user@example.com",)),
+    "admin.get_user_detail.orders": (USER_ORDERS_SQL, ("user@example.com",)),
+    "admin.get_top_customers": (TOP_CUSTOMERS_SQL, (10,)),
+    "admin.get_revenue_by_date": (REVENUE_BY_DATE_SQL, ("2024-01-01", "2024-02-01")),
+    "reconciler.claim": (CLAIM_SQL, {"now": "2024-01-02 00:00:00", "oldest": "2024-01-01 00:00:00",
+                                     "youngest": "2024-01-01 23:59:30", "min_gap": 30, "max_gap": 900,
+                                     "backoff": 0.25, "limit": 100}),
+}
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Union[tuple, Dict] = ()) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def bad_plan_lines(plan: List[str]) -> List[str]:
+    """Plan lines that mean a table/index scan or a temp B-tree sort"""
+    return [line for line in plan if line.startswith("SCAN") or "USE TEMP B-TREE" in line]
+
+
+def check_query_plans(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Return {query_name: plan} for every hot query that scans a table or
+    index, or sorts with a temp B-tree. An empty dict means all hot routes
+    are served by index seeks."""
+    queries = dict(HOT_QUERIES)
+    has_orders = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders'"
+    ).fetchone() is not None
+    if has_orders:
+        queries.update(ORDER_QUERIES)
+    problems = {}
+    for name, (sql, params) in queries.items():
+        plan = explain(conn, sql, params)
+        if bad_plan_lines(plan):
+            problems[name] = plan
+    return problems
+
+
+if __name__ == '__main__':
+    from migrations import run_migrations
+
+    print(f"Schema version: {run_migrations(DATABASE_PATH)}")
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        problems = check_query_plans(conn)
+    finally:
+        conn.close()
+    for name, plan in problems.items():
+        print(f"❌ {name}: " + " | ".join(plan))
+    if problems:
+        sys.exit(1)
+    print("✅ No hot query scans the files or orders tables")
@@ -0,0 +1,269 @@
+"""
+Order Reconciler
+Background worker that asks DANA about PENDING orders (newest first, less
+often as they age) and applies the outcomes in batched transactions, so
+the success page can answer from local state
+
+Run: python reconciler.py [--once] [--stats]
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+import db
+from config import DATABASE_PATH
+from dana_payment import DANAPaymentGateway, dana_gateway
+from order_manager import OrderManager, order_manager
+from status_bus import status_bus
+from webhook_queue import STATUS_MAP
+
+# === Konfigurasi reconciler (bisa diatur lewat environment) ===
+RECONCILE_ENABLED = os.environ.get('RECONCILE_ENABLED', 'true').lower() == 'true'
+# Jeda antar putaran scan (detik)
+RECONCILE_INTERVAL = float(os.environ.get('RECONCILE_INTERVAL', 30))
+# Order maksimal per batch (satu transaksi klaim + satu transaksi hasil)
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', 100))
+# Panggilan verify_payment paralel dan batas per detik (per proses)
+RECONCILE_CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', 4))
+RECONCILE_RATE = float(os.environ.get('RECONCILE_RATE', 10))
+# Order lebih muda dari ini belum dicek (user masih di halaman DANA / webhook belum sempat)
+RECONCILE_MIN_AGE = int(os.environ.get('RECONCILE_MIN_AGE', 30))
+# Order PENDING lebih tua dari ini tidak dicek lagi
+RECONCILE_MAX_AGE = int(os.environ.get('RECONCILE_MAX_AGE', 24 * 3600))
+# Jarak antar cek satu order: umur * BACKOFF, dibatasi [INTERVAL, MAX_GAP]
+RECONCILE_BACKOFF = float(os.environ.get('RECONCILE_BACKOFF', 0.25))
+RECONCILE_MAX_GAP = int(os.environ.get('RECONCILE_MAX_GAP', 900))
+# Order yang diminta halaman success dicek lagi paling cepat setelah ini
+RECONCILE_PRIORITY_GAP = int(os.environ.get('RECONCILE_PRIORITY_GAP', 5))
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# PENDING yang sudah jatuh tempo, terbaru dulu (seek pada idx_orders_status_created).
+# Tanpa dana_order_id order belum ada di DANA (checkout async masih antri), kecuali
+# job checkout-nya UNKNOWN: DANA mungkin sudah membuatnya, jadi tetap ditanyakan.
+CLAIM_SQL = """
+SELECT id, dana_order_id FROM orders
+WHERE status = 'PENDING' AND created_at >= :oldest AND created_at <= :youngest
+  AND (dana_order_id IS NOT NULL OR id IN (SELECT order_id FROM checkout_jobs WHERE status = 'UNKNOWN'))
+  AND (reconciled_at IS NULL
+       OR (julianday(:now) - julianday(reconciled_at)) * 86400 >=
+          MAX(:min_gap, MIN(:max_gap, (julianday(:now) - julianday(created_at)) * 86400 * :backoff)))
+ORDER BY created_at DESC
+LIMIT :limit
+"""
+
+CLAIM_PRIORITY_SQL = """
+SELECT id, dana_order_id FROM orders
+WHERE id = ? AND status = 'PENDING'
+  AND (dana_order_id IS NOT NULL OR id IN (SELECT order_id FROM checkout_jobs WHERE status = 'UNKNOWN'))
+  AND (reconciled_at IS NULL OR reconciled_at <= ?)
+"""
+
+
+class RateLimiter:
+    """Blocking token bucket shared by the poller threads"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.throttled_seconds += delay
+        if delay:
+            time.sleep(delay)
+
+
+class Reconciler:
+    """Polls DANA for PENDING orders and applies what it learns.
+
+    Each batch is claimed in one short BEGIN IMMEDIATE transaction that
+    stamps `reconciled_at`, so several gunicorn workers never ask about the
+    same order twice in a round and the schedule survives restarts. The
+    claimed orders are polled outside any transaction (bounded by
+    `concurrency` and `rate`), then all changes are written in one
+    transaction through OrderManager.write_status. An order that a webhook
+    settled in the meantime is left alone.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, orders: OrderManager = order_manager,
+                 gateway: DANAPaymentGateway = dana_gateway, batch_size: int = RECONCILE_BATCH_SIZE,
+                 interval: float = RECONCILE_INTERVAL, concurrency: int = RECONCILE_CONCURRENCY,
+                 rate: float = RECONCILE_RATE, enabled: bool = RECONCILE_ENABLED):
+        self.db_path = db_path
+        self.orders = orders
+        self.gateway = gateway
+        self.batch_size = batch_size
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.enabled = enabled
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._priority: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._stats = {"rounds": 0, "polled": 0, "poll_errors": 0, "updated": 0, "superseded": 0,
+                       "last_round_ms": 0.0}
+
+    # === Thread ===
+
+    def start(self):
+        """Start the reconciler thread in this process (no-op if running)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="order-reconciler", daemon=True)
+            self._thread.start()
+
+    def prioritize(self, order_id: str):
+        """Check this order in the next round (the user is waiting on it)"""
+        with self._lock:
+            self._priority.add(order_id)
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Reconciler error: {e}")
+
+    # === Rekonsiliasi ===
+
+    def run_once(self) -> int:
+        """Reconcile every due order; returns orders polled"""
+        started = time.perf_counter()
+        total = 0
+        while True:
+            claimed = self.claim()
+            if not claimed:
+                break
+            self.apply(self.poll(claimed))
+            total += len(claimed)
+            if len(claimed) < self.batch_size:
+                break
+        self._stats["rounds"] += 1
+        self._stats["last_round_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return total
+
+    def claim(self, now: Optional[datetime] = None) -> List[Tuple[str, Optional[str]]]:
+        """Pick due orders (priority ones first) and stamp reconciled_at"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            priority, self._priority = self._priority, set()
+        params = {
+            "now": now.strftime(TIMESTAMP_FORMAT),
+            "oldest": (now - timedelta(seconds=RECONCILE_MAX_AGE)).strftime(TIMESTAMP_FORMAT),
+            "youngest": (now - timedelta(seconds=RECONCILE_MIN_AGE)).strftime(TIMESTAMP_FORMAT),
+            "min_gap": self.interval,
+            "max_gap": RECONCILE_MAX_GAP,
+            "backoff": RECONCILE_BACKOFF,
+        }
+        priority_before = (now - timedelta(seconds=RECONCILE_PRIORITY_GAP)).strftime(TIMESTAMP_FORMAT)
+
+        with db.connection(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = []
+            for order_id in priority:
+                rows.extend(conn.execute(CLAIM_PRIORITY_SQL, (order_id, priority_before)).fetchall())
+            seen = {row['id'] for row in rows}
+            params["limit"] = max(0, self.batch_size - len(rows))
+            rows.extend(row for row in conn.execute(CLAIM_SQL, params) if row['id'] not in seen)
+            conn.executemany("UPDATE orders SET reconciled_at = ? WHERE id = ?",
+                             [(params["now"], row['id']) for row in rows])
+        return [(row['id'], row['dana_order_id']) for row in rows]
+
+    def _poll_one(self, order: Tuple[str, Optional[str]]) -> Tuple[str, Optional[str]]:
+        order_id, dana_order_id = order
+        self.limiter.acquire()
+        result = self.gateway.verify_payment(order_id, dana_order_id)
+        if not result.get('success'):
+            return order_id, None
+        return order_id, STATUS_MAP.get(result.get('status'))
+
+    def poll(self, claimed: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str]]]:
+        """Ask DANA about each order; (order_id, new status or None)"""
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(claimed))) as pool:
+            results = list(pool.map(self._poll_one, claimed))
+        self._stats["polled"] += len(results)
+        self._stats["poll_errors"] += sum(1 for _order_id, status in results if status is None)
+        return results
+
+    def apply(self, results: List[Tuple[str, Optional[str]]]) -> int:
+        """Write every status change in one transaction; returns orders updated"""
+        changes = [(order_id, status) for order_id, status in results if status and status != "PENDING"]
+        if not changes:
+            return 0
+        updated = 0
+        with db.connection(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for order_id, status in changes:
+                row = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
+                # Webhook mungkin sudah lebih dulu mengubah status
+                if row is None or row['status'] != "PENDING":
+                    self._stats["superseded"] += 1
+                    continue
+                self.orders.write_status(conn, order_id, status)
+                updated += 1
+        status_bus.wake()
+        self._stats["updated"] += updated
+        return updated
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats, enabled=self.enabled,
+                     throttled_seconds=round(self.limiter.throttled_seconds, 2))
+        stats["running"] = bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+        return stats
+
+
+def pending_by_age(db_path: str = DATABASE_PATH) -> Dict[str, int]:
+    """PENDING orders per age bucket"""
+    with db.connection(db_path, readonly=True) as conn:
+        return {row[0]: row[1] for row in conn.execute("""
+        SELECT CASE
+            WHEN created_at >= datetime('now', '-1 hour') THEN '< 1h'
+            WHEN created_at >= datetime('now', '-1 day') THEN '1h - 1d'
+            ELSE '> 1d'
+        END AS age, COUNT(*)
+        FROM orders WHERE status = 'PENDING'
+        GROUP BY age
+        """)}
+
+
+reconciler = Reconciler()
+
+
+if __name__ == '__main__':
+    # python reconciler.py --once  -> satu putaran rekonsiliasi (mis. dari cron)
+    # python reconciler.py --stats -> jumlah order PENDING per umur
+    parser = argparse.ArgumentParser(description="Reconcile PENDING orders with DANA")
+    parser.add_argument("--once", action="store_true", help="poll all due PENDING orders once")
+    parser.add_argument("--stats", action="store_true", help="print PENDING orders per age")
+    args = parser.parse_args()
+
+    if args.once:
+        print(f"✅ {reconciler.run_once()} orders polled, {reconciler.stats()['updated']} updated")
+    if args.stats or not args.once:
+        print(pending_by_age())
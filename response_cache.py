@@ -0,0 +1,265 @@
+"""
+Response Cache
+Per-worker LRU (plus optional shared disk tier) for catalogue pages and APIs,
+keyed by route + arguments + catalogue generation, with strong ETags
+"""
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from flask import Response, make_response, request
+
+from catalogue import GenerationStamp
+from config import BASE_DIR
+
+# === Konfigurasi cache (bisa diatur lewat environment) ===
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Tier disk dipakai bersama oleh semua worker; kosong = hanya memori
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR', '')
+# Browser boleh memakai salinannya selama ini sebelum revalidasi (detik)
+RESPONSE_CACHE_MAX_AGE = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 60))
+
+# Header yang disimpan bersama body
+CACHED_HEADERS = ('Content-Type', 'Content-Disposition')
+
+
+# Versi rilis eksplisit (mis. git SHA dari platform deploy); kosong = sidik jari kode
+RESPONSE_CACHE_VERSION = os.environ.get('RESPONSE_CACHE_VERSION', os.environ.get('RELEASE_VERSION', ''))
+
+
+def _code_version() -> str:
+    """Fingerprint of the code and templates, so a deploy changes every ETag.
+
+    Covers every module in the app directory, not only app.py: cached
+    output also comes from catalogue, search_index, prefix_index,
+    fuzzy_search and whatever they import. Content hashes rather than
+    mtimes, so every worker and host agrees on the version of the shared
+    disk tier.
+    """
+    if RESPONSE_CACHE_VERSION:
+        # Dipakai sebagai nama direktori tier disk: bentuk hex seperti sidik jari
+        return hashlib.sha1(RESPONSE_CACHE_VERSION.encode()).hexdigest()[:12]
+    paths = sorted(glob.glob(os.path.join(BASE_DIR, '*.py')))
+    paths += sorted(glob.glob(os.path.join(BASE_DIR, 'templates', '*.html')))
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except OSError:
+            continue
+        digest.update(os.path.relpath(path, BASE_DIR).encode())
+        digest.update(hashlib.sha1(content).digest())
+    return digest.hexdigest()[:12]
+
+
+class ResponseCache:
+    """Cache for views whose output depends only on the `files` catalogue.
+
+    The catalogue generation is read from the stamp file drive_sync writes
+    after each commit (catalogue.GenerationStamp), re-read only when its
+    mtime changes. The ETag is derived from route, arguments and
+    generation alone, so If-None-Match is answered with 304 before the view
+    runs or SQLite is opened.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES, disk_dir: str = RESPONSE_CACHE_DIR,
+                 max_age: int = RESPONSE_CACHE_MAX_AGE, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.max_age = max_age
+        self.enabled = enabled
+        self.version = _code_version()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple]" = OrderedDict()
+        self._bytes = 0
+        self._stamp = GenerationStamp(db_path)
+        self._generation = 0
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "evictions": 0,
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    # === Generation ===
+
+    def generation(self) -> int:
+        """Current catalogue generation; costs one stat() when unchanged"""
+        self._generation = self._stamp.current()
+        return self._generation
+
+    # === Decorator ===
+
+    def cached(self, max_age: Optional[int] = None):
+        """Decorate a Flask view whose output depends only on the catalogue"""
+        max_age = self.max_age if max_age is None else max_age
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                key = self._key()
+                etag = key[:32]
+                if request.method in ('GET', 'HEAD') and etag in request.if_none_match:
+                    self._count("not_modified")
+                    return self._finish(Response(status=304), etag, max_age)
+
+                entry = self._get(key)
+                if entry is None:
+                    self._count("misses")
+                    resp = view(*args, **kwargs)
+                    resp = make_response(resp)
+                    if not self._cacheable(resp):
+                        return resp
+                    entry = (
+                        resp.status_code,
+                        [(name, resp.headers[name]) for name in CACHED_HEADERS if name in resp.headers],
+                        resp.get_data(),
+                    )
+                    self._put(key, entry)
+
+                status, headers, body = entry
+                return self._finish(Response(body, status=status, headers=headers), etag, max_age)
+            return wrapper
+        return decorator
+
+    def _key(self) -> str:
+        parts = [
+            self.version,
+            str(self.generation()),
+            request.method if request.method != 'HEAD' else 'GET',
+            request.path,
+            "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True))),
+        ]
+        if request.method == 'POST':
+            parts.append(request.get_data(as_text=True))
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    def _cacheable(self, resp: Response) -> bool:
+        return (
+            resp.status_code == 200
+            and not resp.is_streamed
+            and 'Set-Cookie' not in resp.headers
+            and resp.content_length is not None
+            and resp.content_length <= self.max_bytes // 8
+        )
+
+    def _finish(self, resp: Response, etag: str, max_age: int) -> Response:
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+        resp.headers['X-Catalogue-Generation'] = str(self._generation)
+        return resp
+
+    # === Tier memori (LRU) ===
+
+    def _get(self, key: str) -> Optional[Tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+
+        entry = self._disk_get(key)
+        if entry is not None:
+            self._count("disk_hits")
+            self._memory_put(key, entry)
+        return entry
+
+    def _put(self, key: str, entry: Tuple):
+        self._memory_put(key, entry)
+        self._disk_put(key, entry)
+
+    def _memory_put(self, key: str, entry: Tuple):
+        size = len(entry[2])
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[2])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _key, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[2])
+                self._stats["evictions"] += 1
+
+    # === Tier disk (dibagi antar worker) ===
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{self.version}-{self._generation}", f"{key}.resp")
+
+    def _disk_get(self, key: str) -> Optional[Tuple]:
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                # Baris pertama: [status, headers] dalam JSON, sisanya body
+                status, headers = json.loads(f.readline())
+                return status, [tuple(header) for header in headers], f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+    def _disk_put(self, key: str, entry: Tuple):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+                self._disk_prune(os.path.basename(directory))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            status, headers, body = entry
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps([status, headers]).encode() + b"\n")
+                f.write(body)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    def _disk_prune(self, current: str):
+        """Remove directories of older generations / code versions"""
+        for name in os.listdir(self.disk_dir):
+            if name != current:
+                shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0
+        stats.update(generation=self._generation, disk_dir=self.disk_dir, version=self.version)
+        return stats
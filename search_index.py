@@ -0,0 +1,212 @@
+"""
+Full-text Search Index
+FTS5 mirror of files.name used by /search, /api/search and /api/autocomplete
+"""
+
+import re
+import sqlite3
+from typing import List, Optional
+
+from catalogue import subtree_range
+
+# Nama tabel virtual FTS5 (rowid = files.rowid).
+# `files` memakai TEXT PRIMARY KEY, jadi rowid-nya implisit dan boleh diberi
+# nomor ulang oleh VACUUM. Setelah VACUUM jalankan rebuild_search_index(),
+# kalau tidak hasil pencarian menunjuk ke baris yang salah.
+FTS_TABLE = "files_fts"
+
+# Kolom `compact` berisi nama tanpa tanda hubung dan titik (aturan yang sama
+# dengan compact_text), supaya "2NZFE" menemukan "2NZ-FE" dan "k3ve2"
+# menemukan "K3-VE.2". Dikosongkan jika nama tidak mengandung keduanya.
+COMPACT_EXPR = (
+    "CASE WHEN instr({col}, '-') > 0 OR instr({col}, '.') > 0 "
+    "THEN replace(replace({col}, '-', ''), '.', '') ELSE '' END"
+)
+
+# bm25 weights: name, compact
+BM25_WEIGHTS = (10.0, 5.0)
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_COMPACT_RE = re.compile(r"[-.]")
+
+# Cache status FTS per database path
+_fts_status = {}
+
+
+def fts5_supported(conn: sqlite3.Connection) -> bool:
+    """Check whether this SQLite build was compiled with FTS5"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE IF EXISTS temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def create_search_index(conn: sqlite3.Connection) -> bool:
+    """Create the FTS5 table and sync triggers, then backfill it if empty.
+
+    Runs inside the caller's transaction (no commit). Returns False (and
+    creates nothing) when FTS5 is unavailable.
+    """
+    if not fts5_supported(conn):
+        return False
+
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name,
+        compact,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )
+    """)
+
+    create_search_triggers(conn)
+
+    indexed = conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}").fetchone()[0]
+    if indexed == 0:
+        rebuild_search_index(conn)
+    return True
+
+
+def create_search_triggers(conn: sqlite3.Connection):
+    """Keep files_fts in step with `files`.
+
+    Rows are replaced with DELETE + INSERT rather than INSERT OR REPLACE:
+    inside a trigger the outer statement's conflict policy wins, so OR
+    REPLACE fails when `files` is written with an UPSERT.
+    """
+    new_compact = COMPACT_EXPR.format(col="new.name")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS files_fts_ai AFTER INSERT ON files BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = new.rowid;
+        INSERT INTO {FTS_TABLE}(rowid, name, compact)
+        VALUES (new.rowid, new.name, {new_compact});
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS files_fts_ad AFTER DELETE ON files BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+    END
+    """)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS files_fts_au AFTER UPDATE OF name ON files BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+        INSERT INTO {FTS_TABLE}(rowid, name, compact)
+        VALUES (new.rowid, new.name, {new_compact});
+    END
+    """)
+
+
+def replace_search_triggers(conn: sqlite3.Connection):
+    """Drop and recreate the sync triggers (no-op without an FTS table)"""
+    if not fts_enabled(conn):
+        return
+    for name in ("ai", "ad", "au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS files_fts_{name}")
+    create_search_triggers(conn)
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    """Repopulate the FTS table from scratch (e.g. after a bulk import or a
+    VACUUM, which may renumber the rowids of `files`)"""
+    conn.execute(f"DELETE FROM {FTS_TABLE}")
+    conn.execute(f"""
+    INSERT INTO {FTS_TABLE}(rowid, name, compact)
+    SELECT rowid, name, {COMPACT_EXPR.format(col='name')} FROM files
+    """)
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def refresh_search_index(conn: sqlite3.Connection):
+    """Recreate the triggers and rebuild the index after COMPACT_EXPR changed
+    (no-op without an FTS table)"""
+    if not fts_enabled(conn):
+        return
+    replace_search_triggers(conn)
+    rebuild_search_index(conn)
+
+
+def fts_enabled(conn: sqlite3.Connection, db_path: Optional[str] = None) -> bool:
+    """Return True if the FTS table exists for this connection's database"""
+    if db_path is not None and db_path in _fts_status:
+        return _fts_status[db_path]
+    enabled = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone() is not None
+    if db_path is not None:
+        _fts_status[db_path] = enabled
+    return enabled
+
+
+def tokenize_query(query: str) -> List[str]:
+    """Split a user query into lowercase word tokens ("2NZ-FE" -> ["2nz", "fe"])"""
+    return [t.lower() for t in _TOKEN_RE.findall(query or "")]
+
+
+def compact_text(text: str) -> str:
+    """Text with dashes and dots removed ("1NR-FE" -> "1NRFE", "K3-VE.2" -> "K3VE2").
+
+    Same rule as COMPACT_EXPR, so autocomplete and /search agree.
+    """
+    return _COMPACT_RE.sub("", text or "")
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Build an FTS5 MATCH expression: all tokens ANDed, last one as prefix"""
+    tokens = tokenize_query(query)
+    if not tokens:
+        return None
+    terms = [f'"{t}"' for t in tokens[:-1]]
+    terms.append(f'"{tokens[-1]}"*')
+    return " ".join(terms)
+
+
+def search_files(conn: sqlite3.Connection,
+                 query: str,
+                 columns: str = "f.*",
+                 files_only: bool = False,
+                 limit: Optional[int] = None,
+                 db_path: Optional[str] = None,
+                 within: Optional[str] = None) -> List[sqlite3.Row]:
+    """Search files by name, ranked by bm25 (LIKE scan if FTS5 is unavailable).
+
+    `columns` is a select list over the `files` table aliased as `f`.
+    `within` is a folder path (catalogue.folder_path) to search below.
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+
+    filters = " AND f.is_directory = 0" if files_only else ""
+    filter_params = []
+    if within:
+        filters += " AND f.path > ? AND f.path < ?"
+        filter_params = list(subtree_range(within))
+    limit_sql = " LIMIT ?" if limit else ""
+
+    if fts_enabled(conn, db_path):
+        match = build_match_query(query)
+        if not match:
+            return []
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        sql = (
+            f"SELECT {columns} FROM {FTS_TABLE} "
+            f"JOIN files f ON f.rowid = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH ?{filters} "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}), f.name{limit_sql}"
+        )
+        params = [match] + filter_params
+    else:
+        sql = (
+            f"SELECT {columns} FROM files f WHERE f.name LIKE ?{filters} "
+            f"ORDER BY f.root_folder_name, f.name{limit_sql}"
+        )
+        params = [f"%{query}%"] + filter_params
+
+    if limit:
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
@@ -1,3 +1,15 @@
 #!/bin/bash
 pip install -r requirements.txt
-gunicorn app:app -w 2 -b 0.0.0.0:3000 --timeout 120
+if [ "$DOWNLOAD_GATEWAY" = "asgi" ]; then
+    # Download /download/<id> dilayani asyncio (ratusan transfer per proses),
+    # route Flask lain tetap berjalan di thread pool. Batas bandwidth per klien
+    # memakai hop X-Forwarded-For yang ditambahkan proxy Render (paling kanan);
+    # jangan percayai semua alamat (FORWARDED_ALLOW_IPS=*), entri kiri bisa dipalsukan.
+    export DOWNLOAD_TRUSTED_PROXY_HOPS="${DOWNLOAD_TRUSTED_PROXY_HOPS:-1}"
+    gunicorn download_gateway:application -k uvicorn.workers.UvicornWorker -w 2 -b 0.0.0.0:3000 --timeout 120
+else
+    # gthread: SSE / long-poll /payment/status memegang satu thread, bukan seluruh
+    # worker. status_bus membaca GUNICORN_THREADS untuk batas klien menunggu.
+    export GUNICORN_THREADS="${GUNICORN_THREADS:-8}"
+    gunicorn app:app -k gthread -w 2 --threads "$GUNICORN_THREADS" -b 0.0.0.0:3000 --timeout 120
+fi
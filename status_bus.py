@@ -0,0 +1,233 @@
+"""
+Status Bus
+Order status changes pushed to waiting clients (SSE / long-poll). A trigger
+appends every status or payment_url change to `order_status_events`; one
+watcher thread per process tails that table while clients are waiting
+and wakes them, so N waiting clients cost one indexed query per tick
+instead of N status polls
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import db
+from config import DATABASE_PATH
+
+# === Konfigurasi status bus (bisa diatur lewat environment) ===
+# Seberapa sering watcher membaca event baru (detik); penulis di proses ini membangunkannya langsung
+STATUS_BUS_POLL_INTERVAL = float(os.environ.get('STATUS_BUS_POLL_INTERVAL', 0.25))
+# Thread request per proses worker: gunicorn --threads (start.sh mengekspor GUNICORN_THREADS),
+# download_gateway memakai GATEWAY_WSGI_THREADS. Worker sync hanya punya satu thread.
+STATUS_BUS_WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 1))
+# Thread yang tidak boleh dipakai menunggu (halaman, download, webhook DANA)
+STATUS_BUS_RESERVED_THREADS = int(os.environ.get('STATUS_BUS_RESERVED_THREADS', 2))
+# Batas atas klien menunggu per proses (tiap klien memegang satu thread worker)
+STATUS_BUS_MAX_WAITERS = int(os.environ.get('STATUS_BUS_MAX_WAITERS', 200))
+# Jeda polling singkat (detik) yang diminta dari klien kalau tidak boleh menunggu
+STATUS_POLL_INTERVAL = float(os.environ.get('STATUS_POLL_INTERVAL', 2))
+# Event disimpan selama ini (detik) lalu dihapus
+STATUS_EVENT_RETENTION = int(os.environ.get('STATUS_EVENT_RETENTION', 3600))
+# SSE: lama satu stream (EventSource menyambung ulang sendiri) dan jeda keep-alive
+STATUS_STREAM_SECONDS = int(os.environ.get('STATUS_STREAM_SECONDS', 60))
+STATUS_HEARTBEAT_SECONDS = int(os.environ.get('STATUS_HEARTBEAT_SECONDS', 15))
+# Batas ?wait= untuk long-poll /payment/status
+STATUS_LONGPOLL_MAX = int(os.environ.get('STATUS_LONGPOLL_MAX', 30))
+# Event terakhir per order yang diingat di memori
+STATUS_BUS_RECENT = 10000
+
+
+class BusFull(Exception):
+    """Too many clients waiting in this process; the caller should poll instead"""
+
+
+def waiter_limit(threads: int) -> int:
+    """Clients allowed to wait at once in a process serving requests on
+    `threads` threads (0 on a sync worker: clients short-poll instead)"""
+    return max(0, min(STATUS_BUS_MAX_WAITERS, threads - STATUS_BUS_RESERVED_THREADS))
+
+
+def create_status_event_table(conn: sqlite3.Connection):
+    """order_status_events and the trigger that fills it"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS order_status_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT NOT NULL,
+        status TEXT,
+        payment_url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS orders_status_event
+    AFTER UPDATE OF status, payment_url ON orders
+    WHEN old.status IS NOT new.status OR old.payment_url IS NOT new.payment_url
+    BEGIN
+        INSERT INTO order_status_events (order_id, status, payment_url)
+        VALUES (new.id, new.status, new.payment_url);
+    END
+    """)
+
+
+def head(conn: sqlite3.Connection) -> int:
+    """Sequence number of the newest event (read it before the order row)"""
+    row = conn.execute("SELECT MAX(seq) FROM order_status_events").fetchone()
+    return row[0] or 0
+
+
+class StatusBus:
+    """In-process fan-out of order status events.
+
+    `wait(order_id, after_seq)` returns the first event for that order
+    newer than `after_seq`, or None on timeout. While nobody waits the
+    watcher thread is idle and reads nothing; a client older than what
+    the watcher has read since it woke rewinds it to its `after_seq`, so
+    a change made between reading the order and subscribing is never
+    lost. Writers in
+    this process call `wake()` after commit; changes from other workers
+    are seen within `poll_interval`.
+
+    Every waiting client holds a request thread, so `max_waiters` is the
+    worker's thread count minus a reserve; when that is 0 `can_wait` is
+    False and the routes answer at once with a poll interval.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, poll_interval: float = STATUS_BUS_POLL_INTERVAL,
+                 max_waiters: int = waiter_limit(STATUS_BUS_WORKER_THREADS)):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.max_waiters = max_waiters
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._recent: "OrderedDict[str, Dict]" = OrderedDict()
+        self._seq = 0
+        # Sejak seq ini watcher membaca tanpa putus; klien lebih baru tidak perlu memundurkan
+        self._covered = 0
+        self._waiters = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._last_prune = 0.0
+        self._stats = {"polls": 0, "events": 0, "delivered": 0, "timeouts": 0, "rejected": 0,
+                       "peak_waiters": 0}
+
+    # === Thread ===
+
+    def start(self):
+        """Start the watcher thread in this process (no-op if running)"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            # Waiter dari proses induk tidak ikut ter-fork
+            self._pid = os.getpid()
+            self._waiters = 0
+            self._thread = threading.Thread(target=self._run, name="status-bus", daemon=True)
+            self._thread.start()
+
+    def set_threads(self, threads: int):
+        """The server runs `threads` request threads per process"""
+        self.max_waiters = waiter_limit(threads)
+
+    @property
+    def can_wait(self) -> bool:
+        return self.max_waiters > 0
+
+    def head_seq(self) -> int:
+        with db.connection(self.db_path, readonly=True) as conn:
+            return head(conn)
+
+    def wake(self):
+        """A status was just committed in this process: read it now"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                active = self._waiters > 0
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                read = self.poll()
+            except sqlite3.Error as e:
+                print(f"Status bus error: {e}")
+                read = 0
+            if not read:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def poll(self, limit: int = 500) -> int:
+        """Read events after the last seen one and wake their waiters"""
+        with self._cond:
+            after = self._seq
+        with db.connection(self.db_path, readonly=True) as conn:
+            rows = conn.execute("""
+            SELECT seq, order_id, status, payment_url FROM order_status_events
+            WHERE seq > ? ORDER BY seq LIMIT ?
+            """, (after, limit)).fetchall()
+        self._stats["polls"] += 1
+        if rows:
+            with self._cond:
+                for row in rows:
+                    known = self._recent.get(row['order_id'])
+                    if known is None or known['seq'] < row['seq']:
+                        self._recent[row['order_id']] = dict(row)
+                        self._recent.move_to_end(row['order_id'])
+                # Klien baru mungkin memundurkan posisi selama query: jangan ditimpa
+                if self._seq == after:
+                    self._seq = rows[-1]['seq']
+                while len(self._recent) > STATUS_BUS_RECENT:
+                    self._recent.popitem(last=False)
+                self._stats["events"] += len(rows)
+                self._cond.notify_all()
+        if time.monotonic() - self._last_prune > 600:
+            self._last_prune = time.monotonic()
+            self.prune()
+        return len(rows)
+
+    def prune(self):
+        with db.connection(self.db_path) as conn:
+            conn.execute("DELETE FROM order_status_events WHERE created_at < datetime('now', ?)",
+                         (f"-{STATUS_EVENT_RETENTION} seconds",))
+
+    # === Klien ===
+
+    def wait(self, order_id: str, after_seq: int, timeout: float) -> Optional[Dict]:
+        """Next event for `order_id` with seq > after_seq; raises BusFull"""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._waiters >= self.max_waiters:
+                self._stats["rejected"] += 1
+                raise BusFull()
+            if self._waiters == 0 or after_seq < self._covered:
+                # Mulai (lagi) dari posisi klien ini; event yang terbaca ulang tidak menimpa yang lebih baru
+                self._seq = self._covered = after_seq
+            self._waiters += 1
+            self._stats["peak_waiters"] = max(self._stats["peak_waiters"], self._waiters)
+            self._wake.set()
+            try:
+                while True:
+                    event = self._recent.get(order_id)
+                    if event and event['seq'] > after_seq:
+                        self._stats["delivered"] += 1
+                        return event
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        return None
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._stats, waiters=self._waiters, max_waiters=self.max_waiters, seq=self._seq)
+        stats["running"] = bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+        return stats
+
+
+status_bus = StatusBus()
@@ -0,0 +1,126 @@
+"""
+Download Streaming
+Adaptive chunk sizes and throughput metrics for proxied downloads
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+# === Konfigurasi streaming (bisa diatur lewat environment) ===
+# adaptive: mulai dari CHUNK_MIN, naik sampai CHUNK_MAX selama upstream cepat
+# fixed:    selalu CHUNK_MIN
+CHUNK_MODE = os.environ.get('DOWNLOAD_CHUNK_MODE', 'adaptive')
+CHUNK_MIN = int(os.environ.get('DOWNLOAD_CHUNK_MIN', 256 * 1024))
+CHUNK_MAX = int(os.environ.get('DOWNLOAD_CHUNK_MAX', 1024 * 1024))
+# Read yang lebih cepat dari ini -> perbesar chunk; lebih lambat dari SLOW -> perkecil
+FAST_READ_SECONDS = 0.05
+SLOW_READ_SECONDS = 0.5
+
+
+def iter_chunks(raw, mode: str = CHUNK_MODE, min_size: int = CHUNK_MIN,
+                max_size: int = CHUNK_MAX) -> Iterator[bytes]:
+    """Yield the body of an upstream response in large chunks.
+
+    `raw` is a file-like object with read(n) (e.g. requests' `r.raw`).
+    In adaptive mode the chunk size doubles while reads fill quickly and
+    halves when the upstream is slow, so fast transfers need few Python
+    iterations and WSGI writes while slow ones still deliver bytes
+    promptly. Nothing is read ahead: the next read only happens when the
+    server has written the previous chunk to the client, which is the
+    backpressure a sync worker needs.
+    """
+    size = min_size
+    while True:
+        started = time.perf_counter()
+        chunk = raw.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+        if mode != 'adaptive':
+            continue
+        elapsed = time.perf_counter() - started
+        if len(chunk) == size and elapsed < FAST_READ_SECONDS and size < max_size:
+            size = min(size * 2, max_size)
+        elif elapsed > SLOW_READ_SECONDS and size > min_size:
+            size = max(size // 2, min_size)
+
+
+class DownloadMeter:
+    """Per-worker throughput statistics for streamed downloads"""
+
+    def __init__(self, history: int = 100):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self._stats = {
+            "downloads": 0,
+            "active": 0,
+            "bytes": 0,
+            "seconds": 0.0,
+            "aborted": 0,
+        }
+
+    def track(self, chunks: Iterator[bytes], label: Optional[str] = None,
+              logger=None) -> Iterator[bytes]:
+        """Wrap a chunk iterator and record bytes/sec when it finishes"""
+        started = self._start()
+        sent = 0
+        completed = False
+        try:
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            self._finish(started, sent, completed, label, logger)
+
+    async def atrack(self, chunks: AsyncIterator[bytes], label: Optional[str] = None,
+                     logger=None) -> AsyncIterator[bytes]:
+        """Async variant of track() for the ASGI download gateway"""
+        started = self._start()
+        sent = 0
+        completed = False
+        try:
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+            completed = True
+        finally:
+            self._finish(started, sent, completed, label, logger)
+
+    def _start(self) -> float:
+        with self._lock:
+            self._stats["active"] += 1
+        return time.perf_counter()
+
+    def _finish(self, started: float, sent: int, completed: bool, label, logger):
+        elapsed = time.perf_counter() - started
+        rate = sent / elapsed if elapsed > 0 else 0
+        with self._lock:
+            self._stats["active"] -= 1
+            self._stats["downloads"] += 1
+            self._stats["bytes"] += sent
+            self._stats["seconds"] += elapsed
+            if not completed:
+                self._stats["aborted"] += 1
+            self._recent.append(rate)
+        if logger is not None:
+            logger.info('Download %s: %d bytes in %.2fs (%.2f MiB/s)%s', label, sent, elapsed,
+                        rate / 1024 / 1024, '' if completed else ' [aborted]')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            recent = sorted(self._recent)
+        stats["avg_bytes_per_sec"] = round(stats["bytes"] / stats["seconds"]) if stats["seconds"] else 0
+        stats["median_bytes_per_sec"] = round(recent[len(recent) // 2]) if recent else 0
+        stats["chunk_mode"] = CHUNK_MODE
+        stats["chunk_min"] = CHUNK_MIN
+        stats["chunk_max"] = CHUNK_MAX
+        return stats
+
+
+download_meter = DownloadMeter()
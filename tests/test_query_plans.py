@@ -0,0 +1,50 @@
+"""EXPLAIN QUERY PLAN guard: hot routes must be served by index seeks"""
+
+import sqlite3
+
+import pytest
+
+from migrations import run_migrations
+from order_manager import init_payment_db
+from query_plans import HOT_QUERIES, ORDER_QUERIES, bad_plan_lines, check_query_plans, explain
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "plans.db")
+    run_migrations(path)
+    init_payment_db(path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_index(conn, name):
+    plan = explain(conn, *HOT_QUERIES[name])
+    assert not bad_plan_lines(plan), plan
+
+
+@pytest.mark.parametrize("name", sorted(ORDER_QUERIES))
+def test_order_query_uses_index(conn, name):
+    plan = explain(conn, *ORDER_QUERIES[name])
+    assert not bad_plan_lines(plan), plan
+
+
+def test_check_query_plans_reports_scans(db_path):
+    with sqlite3.connect(db_path) as conn:
+        assert check_query_plans(conn) == {}
+        conn.execute("DROP INDEX idx_files_path")
+    conn.close()
+
+    # Koneksi baru: statement EXPLAIN yang di-cache tidak ikut diperbarui
+    conn = sqlite3.connect(db_path)
+    try:
+        assert "catalogue.subtree_stats" in check_query_plans(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,89 @@
+"""Webhook queue: replays are stored once and every event changes order state at most once"""
+
+import json
+
+import pytest
+
+import db
+from order_manager import OrderManager, init_payment_db
+from webhook_queue import WebhookWorker, enqueue
+
+
+class FailingOrders(OrderManager):
+    """Writes the status, then fails for one order (like a trigger error mid-event)"""
+
+    def write_status(self, conn, order_id, status):
+        super().write_status(conn, order_id, status)
+        if order_id == "order_bad":
+            raise RuntimeError("boom")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "webhooks.db")
+    init_payment_db(path)
+    return path
+
+
+def create_orders(db_path, *order_ids):
+    orders = OrderManager(db_path)
+    for order_id in order_ids:
+        orders.create_order(order_id, "user", "doc_premium_1", "Premium", 50000.0, user_email="user@mail.test")
+    return orders
+
+
+def notify(db_path, webhook_id, order_id, status):
+    return enqueue(webhook_id, order_id, "payment", json.dumps({"orderId": order_id, "status": status}),
+                   db_path=db_path)
+
+
+def order_status(db_path, order_id):
+    with db.connection(db_path, readonly=True) as conn:
+        return conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()['status']
+
+
+def event_statuses(db_path):
+    with db.connection(db_path, readonly=True) as conn:
+        return dict(conn.execute("SELECT id, status FROM payment_webhooks").fetchall())
+
+
+def test_replayed_event_is_stored_once(db_path):
+    create_orders(db_path, "order_1")
+
+    assert notify(db_path, "evt_1", "order_1", "COMPLETED")
+    assert not notify(db_path, "evt_1", "order_1", "COMPLETED")
+
+    assert event_statuses(db_path) == {"evt_1": "RECEIVED"}
+    assert WebhookWorker(db_path=db_path, enabled=False).drain() == 1
+    assert order_status(db_path, "order_1") == "COMPLETED"
+
+
+def test_failing_event_rolls_back_only_its_savepoint(db_path):
+    create_orders(db_path, "order_1", "order_bad", "order_2")
+    notify(db_path, "evt_1", "order_1", "COMPLETED")
+    notify(db_path, "evt_bad", "order_bad", "COMPLETED")
+    notify(db_path, "evt_2", "order_2", "FAILED")
+
+    worker = WebhookWorker(db_path=db_path, orders=FailingOrders(db_path), enabled=False)
+    assert worker.process_batch() == 3
+
+    assert order_status(db_path, "order_1") == "COMPLETED"
+    assert order_status(db_path, "order_bad") == "PENDING"
+    assert order_status(db_path, "order_2") == "FAILED"
+    assert event_statuses(db_path) == {"evt_1": "PROCESSED", "evt_bad": "ERROR", "evt_2": "PROCESSED"}
+    assert worker.stats()["errors"] == 1
+
+
+@pytest.mark.parametrize("final, late", [("COMPLETED", "FAILED"), ("FAILED", "COMPLETED"),
+                                         ("COMPLETED", "PENDING")])
+def test_late_webhook_does_not_change_final_status(db_path, final, late):
+    create_orders(db_path, "order_1")
+    notify(db_path, "evt_final", "order_1", final)
+    worker = WebhookWorker(db_path=db_path, enabled=False)
+    worker.drain()
+
+    notify(db_path, "evt_late", "order_1", late)
+    worker.drain()
+
+    assert order_status(db_path, "order_1") == final
+    assert event_statuses(db_path)["evt_late"] == "IGNORED"
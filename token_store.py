@@ -0,0 +1,226 @@
+"""
+Token Store
+Access tokens shared by every worker process through one SQLite row per
+token (DANA OAuth, Google service account), refreshed early by a single
+lease holder
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import db
+from config import DATABASE_PATH
+
+# === Konfigurasi token store (bisa diatur lewat environment) ===
+# Token diperbarui selama sisa umurnya kurang dari margin ini (detik)
+TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', 300))
+# Lama lease refresh; lease yang lewat dianggap milik proses yang mati
+TOKEN_LEASE_SECONDS = float(os.environ.get('TOKEN_LEASE_SECONDS', 30))
+# Jeda antar pengecekan saat menunggu proses lain selesai refresh
+TOKEN_WAIT_INTERVAL = float(os.environ.get('TOKEN_WAIT_INTERVAL', 0.05))
+# Token disimpan di file terpisah (di-.gitignore), bukan di database.db yang
+# ikut di-commit bersama snapshot katalog
+TOKEN_STORE_PATH = os.environ.get('TOKEN_STORE_PATH', f"{DATABASE_PATH}.tokens")
+
+# fetch() -> (token, expires_at sebagai epoch detik)
+Fetcher = Callable[[], Tuple[str, float]]
+
+
+def create_token_table(conn: sqlite3.Connection):
+    """One row per shared token, plus the refresh lease"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS shared_tokens (
+        name TEXT PRIMARY KEY,
+        token TEXT,
+        expires_at REAL NOT NULL DEFAULT 0,
+        refresh_at REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_until REAL NOT NULL DEFAULT 0,
+        updated_at REAL
+    )
+    """)
+
+
+class SharedToken:
+    """Access token cached in-process and in the `shared_tokens` row.
+
+    `get_token()` answers from memory until `refresh_at`: `margin` seconds
+    before expiry, or half-way for tokens living less than 2 * margin.
+    After that one thread per process goes to the row: if another worker
+    already stored a fresh token it is adopted, otherwise the caller takes
+    the lease (BEGIN IMMEDIATE) and runs `fetch`. While someone else holds
+    the lease, callers keep using the old token if it has not actually
+    expired and only wait when it has. Tokens outlive worker restarts
+    because they are read back from the row. The row lives in its own
+    owner-only file (TOKEN_STORE_PATH), never in the catalogue database.
+    If the store is unavailable the token is fetched locally.
+    """
+
+    def __init__(self, name: str, fetch: Fetcher, margin: float = TOKEN_REFRESH_MARGIN,
+                 lease: float = TOKEN_LEASE_SECONDS, db_path: Optional[str] = None):
+        self.name = name
+        self.fetch = fetch
+        self.margin = margin
+        self.lease = lease
+        self.db_path = db_path or TOKEN_STORE_PATH
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._table_pid = None
+        self._started = time.time()
+        self._stats = {
+            "fetches": 0,
+            "fetch_errors": 0,
+            "adopted": 0,
+            "waits": 0,
+            "store_errors": 0,
+        }
+        self.last_fetch = None
+
+    def _fresh(self, now: float) -> bool:
+        return self._token is not None and now < self._refresh_at
+
+    def _valid(self, now: float) -> bool:
+        return self._token is not None and now < self._expires_at
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return self._expires_at if self._token else None
+
+    def get_token(self) -> str:
+        """Return a valid token; raises if none can be obtained"""
+        if self._fresh(time.time()):
+            return self._token
+        with self._lock:
+            return self._refresh()
+
+    def invalidate(self):
+        """Drop the token here and in the store (e.g. after a 401)"""
+        with self._lock:
+            self._token, self._expires_at, self._refresh_at = None, 0.0, 0.0
+            try:
+                with db.connection(self.db_path) as conn:
+                    conn.execute("""
+                    UPDATE shared_tokens SET token = NULL, expires_at = 0, refresh_at = 0 WHERE name = ?
+                    """, (self.name,))
+            except sqlite3.Error as e:
+                self._stats["store_errors"] += 1
+                print(f"Error invalidating token {self.name}: {e}")
+
+    def _refresh(self) -> str:
+        deadline = time.time() + self.lease
+        waited = False
+        while True:
+            now = time.time()
+            if self._fresh(now):
+                return self._token
+            try:
+                claimed, row = self._load_or_claim(now)
+            except sqlite3.Error as e:
+                self._stats["store_errors"] += 1
+                print(f"Error reading token store for {self.name}: {e}")
+                return self._fetch(store=False)
+
+            if row and row["token"] and row["expires_at"] > self._expires_at:
+                self._token = row["token"]
+                self._expires_at, self._refresh_at = row["expires_at"], row["refresh_at"]
+                if self._fresh(now):
+                    self._stats["adopted"] += 1
+                    return self._token
+            if claimed:
+                return self._fetch(store=True)
+            # Proses lain sedang refresh: token lama masih boleh dipakai
+            if self._valid(now):
+                return self._token
+            if now >= deadline:
+                raise TimeoutError(f"Timed out waiting for {self.name} token refresh")
+            if not waited:
+                self._stats["waits"] += 1
+                waited = True
+            time.sleep(TOKEN_WAIT_INTERVAL)
+
+    def _ensure_table(self, conn: sqlite3.Connection):
+        if self._table_pid != os.getpid():
+            create_token_table(conn)
+            conn.commit()
+            try:
+                os.chmod(self.db_path, 0o600)
+            except OSError:
+                pass
+            self._table_pid = os.getpid()
+
+    def _owner(self) -> str:
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def _load_or_claim(self, now: float) -> Tuple[bool, Optional[sqlite3.Row]]:
+        """Read the row; take the lease if the token is stale and nobody holds it"""
+        with db.connection(self.db_path) as conn:
+            self._ensure_table(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+            SELECT token, expires_at, refresh_at, lease_until FROM shared_tokens WHERE name = ?
+            """, (self.name,)).fetchone()
+            if row and ((row["token"] and now < row["refresh_at"]) or row["lease_until"] > now):
+                return False, row
+            conn.execute("""
+            INSERT INTO shared_tokens (name, lease_owner, lease_until) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                lease_owner = excluded.lease_owner,
+                lease_until = excluded.lease_until
+            """, (self.name, self._owner(), now + self.lease))
+            return True, row
+
+    def _fetch(self, store: bool) -> str:
+        try:
+            token, expires_at = self.fetch()
+        except Exception:
+            self._stats["fetch_errors"] += 1
+            if store:
+                self._release()
+            # Refresh lebih awal gagal: token lama masih berlaku sampai expiry
+            if self._valid(time.time()):
+                return self._token
+            raise
+        self._stats["fetches"] += 1
+        self.last_fetch = time.time()
+        refresh_at = expires_at - min(self.margin, (expires_at - self.last_fetch) / 2)
+        self._token, self._expires_at, self._refresh_at = token, expires_at, refresh_at
+        if store:
+            try:
+                with db.connection(self.db_path) as conn:
+                    conn.execute("""
+                    UPDATE shared_tokens
+                    SET token = ?, expires_at = ?, refresh_at = ?,
+                        lease_owner = NULL, lease_until = 0, updated_at = ?
+                    WHERE name = ?
+                    """, (token, expires_at, refresh_at, self.last_fetch, self.name))
+            except sqlite3.Error as e:
+                self._stats["store_errors"] += 1
+                print(f"Error saving token {self.name}: {e}")
+        return token
+
+    def _release(self):
+        try:
+            with db.connection(self.db_path) as conn:
+                conn.execute("""
+                UPDATE shared_tokens SET lease_owner = NULL, lease_until = 0
+                WHERE name = ? AND lease_owner = ?
+                """, (self.name, self._owner()))
+        except sqlite3.Error as e:
+            self._stats["store_errors"] += 1
+            print(f"Error releasing token lease {self.name}: {e}")
+
+    def stats(self) -> Dict:
+        uptime_hours = max((time.time() - self._started) / 3600, 1 / 60)
+        stats = dict(self._stats)
+        stats.update(
+            name=self.name,
+            fetches_per_hour=round(self._stats["fetches"] / uptime_hours, 2),
+            last_fetch=self.last_fetch,
+            expires_at=self.expires_at,
+        )
+        return stats
@@ -0,0 +1,206 @@
+"""
+Webhook Queue
+DANA notifications are stored in `payment_webhooks` (de-duplicated by the
+provider's event id) and acknowledged at once; a background worker applies
+the status changes in batches
+
+Run: python webhook_queue.py [--drain] [--stats]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+import db
+from config import DATABASE_PATH
+from order_manager import FINAL_STATUSES, OrderManager, order_manager
+from status_bus import status_bus
+
+# === Konfigurasi worker (bisa diatur lewat environment) ===
+WEBHOOK_WORKER_ENABLED = os.environ.get('WEBHOOK_WORKER_ENABLED', 'true').lower() == 'true'
+# Event per transaksi
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 200))
+# Cek antrian walau tidak ada notify() (event dari worker gunicorn lain)
+WEBHOOK_POLL_INTERVAL = float(os.environ.get('WEBHOOK_POLL_INTERVAL', 2.0))
+# Tunggu sebentar setelah notify() agar burst masuk satu batch
+WEBHOOK_BATCH_DELAY = float(os.environ.get('WEBHOOK_BATCH_DELAY', 0.02))
+
+# Status DANA -> status order
+STATUS_MAP = {
+    "COMPLETED": "COMPLETED",
+    "SETTLED": "COMPLETED",
+    "FAILED": "FAILED",
+    "EXPIRED": "FAILED",
+    "PENDING": "PENDING",
+}
+
+# Field / header yang dipakai sebagai id event dari provider
+EVENT_ID_FIELDS = ("eventId", "event_id", "notificationId", "notification_id")
+EVENT_ID_HEADERS = ("X-Event-Id", "X-EXTERNAL-ID")
+
+
+def event_id(data: Mapping, headers: Mapping, body: bytes) -> str:
+    """Provider event id; a replay without one is recognised by its body hash"""
+    for field in EVENT_ID_FIELDS:
+        if data.get(field):
+            return str(data[field])
+    for header in EVENT_ID_HEADERS:
+        if headers.get(header):
+            return str(headers[header])
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+def enqueue(webhook_id: str, order_id: Optional[str], event_type: Optional[str], payload: str,
+            db_path: str = DATABASE_PATH) -> bool:
+    """Store one notification; False if this event id was already received"""
+    with db.connection(db_path) as conn:
+        cursor = conn.execute("""
+        INSERT INTO payment_webhooks (id, order_id, event_type, payload)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(id) DO NOTHING
+        """, (webhook_id, order_id, event_type, payload))
+        return cursor.rowcount == 1
+
+
+class WebhookWorker:
+    """Applies queued notifications, one write transaction per batch.
+
+    Claiming, the order updates (with their rollup triggers) and marking
+    the events PROCESSED/IGNORED commit together, so each event changes
+    order state exactly once even with several gunicorn workers draining
+    the same queue: BEGIN IMMEDIATE serialises them. An event that raises
+    is rolled back to its savepoint and marked ERROR without failing the
+    rest of the batch.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH, orders: OrderManager = order_manager,
+                 batch_size: int = WEBHOOK_BATCH_SIZE, poll_interval: float = WEBHOOK_POLL_INTERVAL,
+                 enabled: bool = WEBHOOK_WORKER_ENABLED):
+        self.db_path = db_path
+        self.orders = orders
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._stats = {"batches": 0, "processed": 0, "ignored": 0, "errors": 0, "last_batch_ms": 0.0}
+
+    # === Thread ===
+
+    def start(self):
+        """Start the worker thread in this process (no-op if running)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # Thread dari proses master tidak ikut ter-fork ke worker gunicorn
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="webhook-worker", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            if self._wake.wait(self.poll_interval):
+                time.sleep(WEBHOOK_BATCH_DELAY)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Webhook worker error: {e}")
+
+    # === Pemrosesan ===
+
+    def drain(self) -> int:
+        """Process batches until the queue is empty; returns events handled"""
+        total = 0
+        while True:
+            handled = self.process_batch()
+            total += handled
+            if handled < self.batch_size:
+                return total
+
+    def process_batch(self) -> int:
+        started = time.perf_counter()
+        with db.connection(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            events = conn.execute("""
+            SELECT id, order_id, payload FROM payment_webhooks
+            WHERE status = 'RECEIVED'
+            ORDER BY created_at, rowid
+            LIMIT ?
+            """, (self.batch_size,)).fetchall()
+            for event in events:
+                conn.execute("SAVEPOINT webhook_event")
+                try:
+                    result = self._apply(conn, event)
+                    conn.execute("RELEASE webhook_event")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO webhook_event")
+                    conn.execute("RELEASE webhook_event")
+                    print(f"Webhook {event['id']} failed: {e}")
+                    result = "ERROR"
+                conn.execute("""
+                UPDATE payment_webhooks SET status = ?, processed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """, (result, event['id']))
+                self._stats[{"PROCESSED": "processed", "IGNORED": "ignored", "ERROR": "errors"}[result]] += 1
+        if events:
+            status_bus.wake()
+            self._stats["batches"] += 1
+            self._stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return len(events)
+
+    def _apply(self, conn: sqlite3.Connection, event) -> str:
+        data = json.loads(event['payload'] or "{}")
+        status = STATUS_MAP.get(data.get('status'))
+        if not event['order_id'] or status is None:
+            return "IGNORED"
+        row = conn.execute("SELECT status FROM orders WHERE id = ?", (event['order_id'],)).fetchone()
+        if row is None:
+            return "IGNORED"
+        if row['status'] == status:
+            return "PROCESSED"
+        if row['status'] in FINAL_STATUSES:
+            return "IGNORED"
+        self.orders.write_status(conn, event['order_id'], status)
+        return "PROCESSED"
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats, enabled=self.enabled)
+        stats["running"] = bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+        return stats
+
+
+def queue_depth(db_path: str = DATABASE_PATH) -> Dict[str, int]:
+    with db.connection(db_path, readonly=True) as conn:
+        return {row[0]: row[1] for row in conn.execute(
+            "SELECT status, COUNT(*) FROM payment_webhooks GROUP BY status")}
+
+
+webhook_worker = WebhookWorker()
+
+
+if __name__ == '__main__':
+    # python webhook_queue.py --drain -> proses antrian sekali (mis. dari cron)
+    # python webhook_queue.py --stats -> jumlah event per status
+    parser = argparse.ArgumentParser(description="DANA webhook queue")
+    parser.add_argument("--drain", action="store_true", help="process all RECEIVED events once")
+    parser.add_argument("--stats", action="store_true", help="print event counts per status")
+    args = parser.parse_args()
+
+    if args.drain:
+        print(f"✅ {webhook_worker.drain()} webhook events processed")
+    if args.stats or not args.drain:
+        print(queue_depth())